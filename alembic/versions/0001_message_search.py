@@ -0,0 +1,58 @@
+"""Full-text search vector and GIN index on messages
+
+Revision ID: 0001_message_search
+Revises: 
+Create Date: 2026-10-19 00:00:00
+
+Tables are created by the application on startup (Base.metadata.create_all);
+this revision brings existing databases up to date. Every statement is
+idempotent, so it is also safe on a database created by a newer create_all.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from app.config import settings
+
+
+# revision identifiers, used by Alembic.
+revision = '0001_message_search'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+BACKFILL_BATCH_SIZE = 5000
+
+
+def upgrade() -> None:
+    op.execute("CREATE EXTENSION IF NOT EXISTS btree_gin")
+    op.execute("ALTER TABLE messages ADD COLUMN IF NOT EXISTS search_vector tsvector")
+
+    # Backfill user messages in short transactions so the table is never locked for long
+    backfill = sa.text(
+        """
+        UPDATE messages SET search_vector =
+            setweight(to_tsvector(CAST(:config AS regconfig), coalesce(content, '')), 'A') ||
+            setweight(to_tsvector(CAST(:config AS regconfig), coalesce(ai_response, '')), 'B')
+        WHERE id IN (
+            SELECT id FROM messages
+            WHERE search_vector IS NULL AND message_type = 'USER'
+            LIMIT :batch_size
+        )
+        """
+    )
+    with op.get_context().autocommit_block():
+        bind = op.get_bind()
+        while True:
+            result = bind.execute(backfill, {"config": settings.search_text_config, "batch_size": BACKFILL_BATCH_SIZE})
+            if result.rowcount == 0:
+                break
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_messages_user_search "
+            "ON messages USING gin (user_id, search_vector)"
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_messages_user_search")
+    op.execute("ALTER TABLE messages DROP COLUMN IF EXISTS search_vector")
@@ -0,0 +1,39 @@
+"""Soft-delete columns on chatrooms and users
+
+Revision ID: 0002_soft_delete
+Revises: 0001_message_search
+Create Date: 2026-10-19 00:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0002_soft_delete'
+down_revision = '0001_message_search'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Nullable columns without defaults: metadata-only changes, no table rewrite
+    op.execute("ALTER TABLE chatrooms ADD COLUMN IF NOT EXISTS deleted_at TIMESTAMP WITH TIME ZONE")
+    op.execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS deleted_at TIMESTAMP WITH TIME ZONE")
+    with op.get_context().autocommit_block():
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_chatrooms_deleted_at "
+            "ON chatrooms (deleted_at) WHERE deleted_at IS NOT NULL"
+        )
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_users_deleted_at "
+            "ON users (deleted_at) WHERE deleted_at IS NOT NULL"
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_users_deleted_at")
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_chatrooms_deleted_at")
+    op.execute("ALTER TABLE users DROP COLUMN IF EXISTS deleted_at")
+    op.execute("ALTER TABLE chatrooms DROP COLUMN IF EXISTS deleted_at")
@@ -0,0 +1,168 @@
+"""Partition messages by month; archive segment table
+
+Revision ID: 0003_partition_messages
+Revises: 0002_soft_delete
+Create Date: 2026-10-19 00:00:00
+
+Rebuilds `messages` as a RANGE (created_at) partitioned table. The existing
+table is renamed to `messages_legacy`, copied one month per statement into the
+new monthly partitions, then dropped. Run it in a maintenance window: writes
+to `messages` must be stopped while it runs.
+
+The downgrade rebuilds a plain `messages` table keyed by `id` from every monthly
+partition still in the database (attached or left detached) and the default
+partition, then drops the partitioned table and `message_archive_segments`.
+Months that were already archived are not restored: their messages only exist
+in the zstd files under ARCHIVE_DIR, which the downgrade leaves in place.
+"""
+from datetime import datetime
+from alembic import op
+from dateutil.relativedelta import relativedelta
+import pytz
+from sqlalchemy import text
+from app.partitions import (
+    DEFAULT_PARTITION, create_month_partition, ensure_partitions, list_partitions, month_start
+)
+
+
+# revision identifiers, used by Alembic.
+revision = '0003_partition_messages'
+down_revision = '0002_soft_delete'
+branch_labels = None
+depends_on = None
+
+COLUMNS = (
+    "id, chatroom_id, user_id, content, message_type, ai_response, processing_status, "
+    "created_at, processing_time_ms, search_vector"
+)
+INDEXES = ("ix_messages_type_created_at", "ix_messages_user_search")
+
+
+def upgrade() -> None:
+    op.execute(
+        """
+        CREATE TABLE IF NOT EXISTS message_archive_segments (
+            id UUID PRIMARY KEY,
+            partition_name VARCHAR(64) NOT NULL,
+            chatroom_id UUID NOT NULL REFERENCES chatrooms (id) ON DELETE CASCADE,
+            user_id UUID NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+            path VARCHAR(1024) NOT NULL,
+            "offset" BIGINT NOT NULL,
+            length BIGINT NOT NULL,
+            message_count INTEGER NOT NULL,
+            first_created_at TIMESTAMP WITH TIME ZONE NOT NULL,
+            last_created_at TIMESTAMP WITH TIME ZONE NOT NULL,
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT now()
+        )
+        """
+    )
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS ix_message_archive_segments_partition_name "
+        "ON message_archive_segments (partition_name)"
+    )
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS ix_message_archive_segments_chatroom "
+        "ON message_archive_segments (chatroom_id, last_created_at)"
+    )
+
+    conn = op.get_bind()
+    kind = conn.execute(text("SELECT relkind FROM pg_class WHERE oid = to_regclass('messages')")).scalar()
+    if kind == "p":
+        # Already partitioned (created by create_all): only make sure the partitions exist
+        ensure_partitions(conn)
+        return
+
+    op.execute("ALTER TABLE messages RENAME TO messages_legacy")
+    op.execute("ALTER TABLE messages_legacy RENAME CONSTRAINT messages_pkey TO messages_legacy_pkey")
+    for index in INDEXES:
+        op.execute(f"ALTER INDEX IF EXISTS {index} RENAME TO {index}_legacy")
+
+    op.execute(
+        """
+        CREATE TABLE messages (
+            id UUID NOT NULL,
+            chatroom_id UUID NOT NULL REFERENCES chatrooms (id) ON DELETE CASCADE,
+            user_id UUID NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+            content TEXT NOT NULL,
+            message_type messagetype NOT NULL,
+            ai_response TEXT,
+            processing_status processingstatus,
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL,
+            processing_time_ms INTEGER,
+            search_vector TSVECTOR,
+            PRIMARY KEY (id, created_at)
+        ) PARTITION BY RANGE (created_at)
+        """
+    )
+    op.execute(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF messages DEFAULT")
+    op.execute("CREATE INDEX ix_messages_type_created_at ON messages (message_type, created_at)")
+    op.execute("CREATE INDEX ix_messages_chatroom_created_at ON messages (chatroom_id, created_at)")
+    op.execute("CREATE INDEX ix_messages_user_search ON messages USING gin (user_id, search_vector)")
+
+    now = datetime.utcnow().replace(tzinfo=pytz.UTC)
+    earliest = conn.execute(text("SELECT min(created_at) FROM messages_legacy")).scalar()
+    month = month_start(earliest or now)
+    current = month_start(now)
+    while month < current:
+        create_month_partition(conn, month)
+        month += relativedelta(months=1)
+    ensure_partitions(conn, now)
+
+    # One statement per month keeps each copy's sort/WAL burst bounded
+    month = month_start(earliest or now)
+    while month <= current:
+        conn.execute(text(
+            f"INSERT INTO messages ({COLUMNS}) SELECT {COLUMNS} FROM messages_legacy "
+            "WHERE created_at >= :start AND created_at < :end"
+        ), {"start": month, "end": month + relativedelta(months=1)})
+        month += relativedelta(months=1)
+    conn.execute(text(
+        f"INSERT INTO messages ({COLUMNS}) "
+        f"SELECT {COLUMNS.replace('created_at', 'COALESCE(created_at, now())')} FROM messages_legacy "
+        "WHERE created_at IS NULL OR created_at >= :end"
+    ), {"end": current + relativedelta(months=1)})
+    op.execute("DROP TABLE messages_legacy")
+
+
+def downgrade() -> None:
+    conn = op.get_bind()
+    partitions = sorted(list_partitions(conn))
+    has_default = conn.execute(text("SELECT to_regclass(:name)"), {"name": DEFAULT_PARTITION}).scalar()
+    if has_default:
+        partitions.append(DEFAULT_PARTITION)
+
+    op.execute("ALTER TABLE messages RENAME TO messages_partitioned")
+    op.execute("ALTER TABLE messages_partitioned RENAME CONSTRAINT messages_pkey TO messages_partitioned_pkey")
+    for index in INDEXES + ("ix_messages_chatroom_created_at",):
+        op.execute(f"ALTER INDEX IF EXISTS {index} RENAME TO {index}_partitioned")
+
+    op.execute(
+        """
+        CREATE TABLE messages (
+            id UUID PRIMARY KEY,
+            chatroom_id UUID NOT NULL REFERENCES chatrooms (id) ON DELETE CASCADE,
+            user_id UUID NOT NULL REFERENCES users (id) ON DELETE CASCADE,
+            content TEXT NOT NULL,
+            message_type messagetype NOT NULL,
+            ai_response TEXT,
+            processing_status processingstatus,
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
+            processing_time_ms INTEGER,
+            search_vector TSVECTOR
+        )
+        """
+    )
+    # One statement per partition, as in upgrade(); detached months are copied too
+    for partition in partitions:
+        conn.execute(text(
+            f"INSERT INTO messages ({COLUMNS}) SELECT {COLUMNS} FROM {partition} "
+            "ON CONFLICT (id) DO NOTHING"
+        ))
+    op.execute("CREATE INDEX ix_messages_type_created_at ON messages (message_type, created_at)")
+    op.execute("CREATE INDEX ix_messages_chatroom_created_at ON messages (chatroom_id, created_at)")
+    op.execute("CREATE INDEX ix_messages_user_search ON messages USING gin (user_id, search_vector)")
+
+    op.execute("DROP TABLE messages_partitioned")
+    for partition in partitions:
+        op.execute(f"DROP TABLE IF EXISTS {partition}")
+    op.execute("DROP TABLE IF EXISTS message_archive_segments")
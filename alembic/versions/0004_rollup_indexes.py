@@ -0,0 +1,37 @@
+"""Indexes used by the usage rollup job
+
+Revision ID: 0004_rollup_indexes
+Revises: 0003_partition_messages
+Create Date: 2026-10-19 00:00:00
+
+`refresh_usage_rollups` finds dirty buckets through `usage_tracking.last_updated`
+and AI replies by (message_type, created_at). Both indexes were only created by
+`create_all` on fresh databases.
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '0004_rollup_indexes'
+down_revision = '0003_partition_messages'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_usage_tracking_last_updated "
+            "ON usage_tracking (last_updated)"
+        )
+    # Partitioned table: CONCURRENTLY is not supported on the parent, and the
+    # index normally exists already (0003 creates it with the partitions)
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS ix_messages_type_created_at "
+        "ON messages (message_type, created_at)"
+    )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_usage_tracking_last_updated")
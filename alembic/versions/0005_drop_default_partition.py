@@ -0,0 +1,39 @@
+"""Drop the default messages partition
+
+Revision ID: 0005_drop_default_partition
+Revises: 0004_rollup_indexes
+Create Date: 2026-10-19 00:00:00
+
+Postgres refuses DETACH PARTITION ... CONCURRENTLY while the parent has a
+DEFAULT partition, so archiving a month would otherwise lock `messages`.
+Rows that landed in `messages_default` are first moved into their monthly
+partitions (created as needed). Monthly partitions are kept
+MESSAGES_PARTITION_MONTHS_AHEAD months ahead, so new rows always have one.
+"""
+from alembic import op
+from sqlalchemy import text
+from app.partitions import DEFAULT_PARTITION, create_month_partition, month_start
+
+
+# revision identifiers, used by Alembic.
+revision = '0005_drop_default_partition'
+down_revision = '0004_rollup_indexes'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    if not conn.execute(text("SELECT to_regclass(:name)"), {"name": DEFAULT_PARTITION}).scalar():
+        return
+    months = conn.execute(text(
+        f"SELECT DISTINCT date_trunc('month', created_at AT TIME ZONE 'UTC') FROM {DEFAULT_PARTITION}"
+    )).scalars().all()
+    for month in sorted(months):
+        create_month_partition(conn, month_start(month))
+    op.execute(f"ALTER TABLE messages DETACH PARTITION {DEFAULT_PARTITION}")
+    op.execute(f"DROP TABLE {DEFAULT_PARTITION}")
+
+
+def downgrade() -> None:
+    op.execute(f"CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} PARTITION OF messages DEFAULT")
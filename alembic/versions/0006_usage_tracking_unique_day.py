@@ -0,0 +1,54 @@
+"""One usage_tracking row per user and day
+
+Revision ID: 0006_usage_tracking_unique_day
+Revises: 0005_drop_default_partition
+Create Date: 2026-10-19 00:00:00
+
+`reserve_usage` creates the day's row with INSERT ... ON CONFLICT DO NOTHING
+and then locks it, which needs a unique (user_id, date). Duplicate rows left by
+concurrent first requests of a day are merged into one first.
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '0006_usage_tracking_unique_day'
+down_revision = '0005_drop_default_partition'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute("""
+        WITH ranked AS (
+            SELECT id, user_id, date,
+                   row_number() OVER (PARTITION BY user_id, date ORDER BY id) AS rn,
+                   sum(message_count) OVER (PARTITION BY user_id, date) AS total_messages,
+                   sum(api_calls) OVER (PARTITION BY user_id, date) AS total_calls,
+                   count(*) OVER (PARTITION BY user_id, date) AS copies
+            FROM usage_tracking
+        )
+        UPDATE usage_tracking u
+        SET message_count = r.total_messages, api_calls = r.total_calls
+        FROM ranked r
+        WHERE u.id = r.id AND r.rn = 1 AND r.copies > 1
+    """)
+    op.execute("""
+        DELETE FROM usage_tracking u
+        USING usage_tracking keep
+        WHERE u.user_id = keep.user_id AND u.date = keep.date
+          AND keep.id < u.id
+    """)
+    with op.get_context().autocommit_block():
+        op.execute(
+            "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS uq_usage_tracking_user_date "
+            "ON usage_tracking (user_id, date)"
+        )
+    op.execute(
+        "ALTER TABLE usage_tracking ADD CONSTRAINT uq_usage_tracking_user_date "
+        "UNIQUE USING INDEX uq_usage_tracking_user_date"
+    )
+
+
+def downgrade() -> None:
+    op.execute("ALTER TABLE usage_tracking DROP CONSTRAINT IF EXISTS uq_usage_tracking_user_date")
@@ -0,0 +1,319 @@
+"""
+Two-tier cache: a bounded in-process TTL/LRU tier in front of Redis.
+
+    value = await cache.get(key)
+    await cache.set(key, value, ttl)
+    await cache.delete(key1, key2)
+    value = await cache.get_or_load(key, loader, ttl)
+    body, etag = await cache.get_many([body_key, etag_key])
+    await cache.update({key: (value, ttl)}, delete=[other_key])
+
+`get_many` and `update` cost one Redis round-trip however many keys they touch.
+Values are bytes (stored as-is) or anything the configured serializer handles
+(app.serializers; large values are compressed). Local entries
+live at most `LOCAL_CACHE_TTL` seconds (and never beyond the Redis TTL); every
+set/delete publishes the keys on `CACHE_INVALIDATION_CHANNEL`, and a listener
+thread in each process (uvicorn workers and Celery workers alike) drops them
+from its local tier. If the subscription drops, the local tier is cleared,
+since invalidations may have been missed. Cached objects are shared: never
+mutate a value returned by the cache.
+
+`get_or_load` is single-flight: concurrent misses for a key in one process wait
+for one loader call, and a short Redis lock keeps other processes from running
+the same loader at the same time.
+"""
+import asyncio
+import inspect
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple, Union
+import orjson
+from app.config import settings
+from app.redis_client import redis_client
+from app.serializers import codec
+
+logger = logging.getLogger(__name__)
+
+
+def _decode(data: bytes) -> Any:
+    if not codec.has_header(data):
+        # Written before the two-tier cache existed: plain text
+        return data.decode("utf-8")
+    return codec.decode(data)
+
+
+class LocalTTLCache:
+    """Thread-safe LRU with a per-entry expiry."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return False, None
+            self._entries.move_to_end(key)
+            return True, value
+
+    def set(self, key: str, value: Any, ttl: float):
+        if self.maxsize <= 0 or ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, *keys: str):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class TwoTierCache:
+    def __init__(self):
+        self.local = LocalTTLCache(settings.local_cache_max_entries)
+        self.channel = settings.cache_invalidation_channel
+        # Lets the listener skip invalidations this process published itself
+        self._origin = f"{os.getpid()}:{uuid.uuid4().hex[:8]}".encode()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._listener: Optional[threading.Thread] = None
+        self._listener_lock = threading.Lock()
+        self.stats = {
+            "local_hits": 0, "redis_hits": 0, "misses": 0,
+            "loads": 0, "coalesced": 0, "invalidations_received": 0
+        }
+
+    # --- invalidation broadcast ------------------------------------------
+
+    def start_listener(self):
+        """Subscribe to invalidations (idempotent; called lazily on the first local write)."""
+        if self._listener is not None:
+            return
+        with self._listener_lock:
+            if self._listener is None:
+                self._listener = threading.Thread(target=self._listen, name="cache-invalidation", daemon=True)
+                self._listener.start()
+
+    def _listen(self):
+        backoff = 1.0
+        while True:
+            try:
+                pubsub = redis_client.binary_client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                backoff = 1.0
+                for message in pubsub.listen():
+                    origin, _, payload = message["data"].partition(b"|")
+                    if origin == self._origin:
+                        continue
+                    keys = orjson.loads(payload)
+                    self.local.delete(*keys)
+                    self.stats["invalidations_received"] += len(keys)
+            except Exception as e:
+                logger.warning("Cache invalidation listener disconnected: %s", e)
+            # Invalidations may have been missed while disconnected
+            self.local.clear()
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 30.0)
+
+    def _message(self, keys) -> bytes:
+        return self._origin + b"|" + orjson.dumps(list(keys))
+
+    def _local_ttl(self, ttl: Optional[int]) -> float:
+        return settings.local_cache_ttl if not ttl else min(settings.local_cache_ttl, ttl)
+
+    # --- sync API (Celery workers, threads) ------------------------------
+
+    def update_sync(
+        self,
+        values: Optional[Dict[str, Tuple[Any, Optional[int]]]] = None,
+        delete: Iterable[str] = (),
+        nx: bool = False
+    ) -> bool:
+        """
+        Set `{key: (value, ttl)}` and delete `delete` with one pipeline and one
+        invalidation message. With `nx`, values are only written to keys that do
+        not exist yet (read-through loads must not overwrite a newer write).
+        """
+        values = values or {}
+        delete = [key for key in delete if key not in values]
+        if not values and not delete:
+            return True
+        if values:
+            self.start_listener()
+        self.local.delete(*delete)
+        if not nx:
+            for key, (value, ttl) in values.items():
+                self.local.set(key, value, self._local_ttl(ttl))
+        try:
+            pipe = redis_client.binary_client.pipeline(transaction=False)
+            if delete:
+                pipe.delete(*delete)
+            for key, (value, ttl) in values.items():
+                pipe.set(key, codec.encode(value), ex=ttl, nx=nx)
+            pipe.publish(self.channel, self._message([*delete, *values]))
+            results = pipe.execute()
+        except Exception as e:
+            logger.warning("Cache update failed for %s: %s", [*delete, *values], e)
+            return False
+        if nx:
+            set_results = results[1:-1] if delete else results[:-1]
+            for (key, (value, ttl)), stored in zip(values.items(), set_results):
+                if stored:
+                    self.local.set(key, value, self._local_ttl(ttl))
+        return True
+
+    def set_sync(self, key: str, value: Any, ttl: Optional[int] = None, nx: bool = False) -> bool:
+        return self.update_sync({key: (value, ttl)}, nx=nx)
+
+    def delete_sync(self, *keys: str) -> bool:
+        return self.update_sync(delete=keys)
+
+    # --- async API -------------------------------------------------------
+
+    async def get(self, key: str, local_ttl: Optional[int] = None) -> Any:
+        found, value = self.local.get(key)
+        if found:
+            self.stats["local_hits"] += 1
+            return value
+        data = await redis_client.get_bytes(key)
+        if data is None:
+            self.stats["misses"] += 1
+            return None
+        self.stats["redis_hits"] += 1
+        value = _decode(data)
+        self.start_listener()
+        self.local.set(key, value, local_ttl or settings.local_cache_ttl)
+        return value
+
+    async def get_many(self, keys: List[str], local_ttl: Optional[int] = None) -> List[Any]:
+        """Like `get` for several keys; the ones missing locally are fetched with one MGET."""
+        values: List[Any] = [None] * len(keys)
+        remote = []
+        for i, key in enumerate(keys):
+            found, value = self.local.get(key)
+            if found:
+                self.stats["local_hits"] += 1
+                values[i] = value
+            else:
+                remote.append(i)
+        if not remote:
+            return values
+        try:
+            fetched = redis_client.binary_client.mget([keys[i] for i in remote])
+        except Exception:
+            fetched = [None] * len(remote)
+        for i, data in zip(remote, fetched):
+            if data is None:
+                self.stats["misses"] += 1
+                continue
+            self.stats["redis_hits"] += 1
+            values[i] = _decode(data)
+            self.start_listener()
+            self.local.set(keys[i], values[i], local_ttl or settings.local_cache_ttl)
+        return values
+
+    async def set(self, key: str, value: Any, ttl: Optional[int] = None, nx: bool = False) -> bool:
+        return self.set_sync(key, value, ttl, nx)
+
+    async def update(
+        self,
+        values: Optional[Dict[str, Tuple[Any, Optional[int]]]] = None,
+        delete: Iterable[str] = ()
+    ) -> bool:
+        return self.update_sync(values, delete)
+
+    async def delete(self, *keys: str) -> bool:
+        return self.delete_sync(*keys)
+
+    async def get_or_load(
+        self,
+        key: str,
+        loader: Callable[[], Union[Any, Awaitable[Any]]],
+        ttl: Union[int, Callable[[Any], int]],
+        nx: bool = False
+    ) -> Any:
+        """
+        Cached value, or the loader's result (stored with `ttl`, which may be a
+        function of the value). A None result is returned but not cached. With
+        `nx`, the result is not stored over a value written while it was loading.
+        """
+        value = await self.get(key)
+        if value is not None:
+            return value
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.stats["coalesced"] += 1
+            return await asyncio.shield(inflight)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await self._load_once(key, loader, ttl, nx)
+            future.set_result(value)
+            return value
+        except BaseException as e:
+            future.set_exception(e)
+            # Retrieve it so waiter-less failures are not logged as "never retrieved"
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    async def _load_once(self, key, loader, ttl, nx) -> Any:
+        lock_key = f"lock:cache:{key}"
+        try:
+            locked = redis_client.client.set(lock_key, "1", nx=True, ex=settings.cache_load_lock_ttl)
+        except Exception:
+            locked = True  # Redis unavailable: just load
+        if not locked:
+            # Another process is loading this key: wait for its result
+            deadline = time.monotonic() + settings.cache_load_wait
+            while time.monotonic() < deadline:
+                await asyncio.sleep(0.05)
+                data = await redis_client.get_bytes(key)
+                if data is not None:
+                    self.stats["coalesced"] += 1
+                    return _decode(data)
+        try:
+            self.stats["loads"] += 1
+            value = loader()
+            if inspect.isawaitable(value):
+                value = await value
+            if value is not None:
+                await self.set(key, value, ttl(value) if callable(ttl) else ttl, nx)
+            return value
+        finally:
+            if locked:
+                await redis_client.delete(lock_key)
+
+    def snapshot(self) -> dict:
+        """Hit ratios for this process."""
+        stats = dict(self.stats)
+        lookups = stats["local_hits"] + stats["redis_hits"] + stats["misses"]
+        stats["local_entries"] = len(self.local)
+        stats["local_hit_ratio"] = round(stats["local_hits"] / lookups, 4) if lookups else None
+        stats["hit_ratio"] = round((stats["local_hits"] + stats["redis_hits"]) / lookups, 4) if lookups else None
+        stats["pid"] = os.getpid()
+        return stats
+
+
+cache = TwoTierCache()
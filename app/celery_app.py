@@ -1,5 +1,7 @@
-from celery import Celery
+from celery import Celery, signals
 from app.config import settings
+from app.tracing import instrument_celery
+from app.logging_config import configure_logging
 
 celery_app = Celery(
     "gemini_backend",
@@ -25,4 +27,72 @@ celery_app.conf.update(
 # Configure task routes
 celery_app.conf.task_routes = {
     'app.tasks.process_gemini_message': {'queue': 'ai_processing'},
-}
\ No newline at end of file
+    'app.tasks.flush_otp_audit': {'queue': 'maintenance'},
+    'app.tasks.process_stripe_events': {'queue': 'stripe_events'},
+    'app.tasks.requeue_stripe_events': {'queue': 'maintenance'},
+    'app.tasks.downgrade_lapsed_subscriptions': {'queue': 'maintenance'},
+    'app.tasks.reconcile_stripe_subscriptions': {'queue': 'maintenance'},
+    'app.tasks.refresh_usage_rollups': {'queue': 'maintenance'},
+    'app.tasks.maintain_message_partitions': {'queue': 'maintenance'},
+    'app.tasks.recount_chatroom_message_counts': {'queue': 'maintenance'},
+    'app.tasks.export_user_data': {'queue': 'maintenance'},
+    'app.tasks.delete_expired_exports': {'queue': 'maintenance'},
+    'app.tasks.purge_chatroom': {'queue': 'maintenance'},
+    'app.tasks.purge_user': {'queue': 'maintenance'},
+    'app.tasks.purge_deleted': {'queue': 'maintenance'},
+}
+
+# Periodic jobs (run exactly one `celery -A app.celery_app beat` process)
+celery_app.conf.beat_schedule = {
+    'flush-otp-audit': {
+        'task': 'app.tasks.flush_otp_audit',
+        'schedule': settings.otp_audit_flush_interval,
+    },
+    'requeue-stripe-events': {
+        'task': 'app.tasks.requeue_stripe_events',
+        'schedule': 300.0,
+    },
+    'downgrade-lapsed-subscriptions': {
+        'task': 'app.tasks.downgrade_lapsed_subscriptions',
+        'schedule': settings.entitlement_sweep_interval,
+    },
+    'reconcile-stripe-subscriptions': {
+        'task': 'app.tasks.reconcile_stripe_subscriptions',
+        'schedule': settings.stripe_reconcile_interval,
+    },
+    'refresh-usage-rollups': {
+        'task': 'app.tasks.refresh_usage_rollups',
+        'schedule': settings.rollup_interval,
+    },
+    'maintain-message-partitions': {
+        'task': 'app.tasks.maintain_message_partitions',
+        'schedule': settings.partition_maintenance_interval,
+    },
+    'delete-expired-exports': {
+        'task': 'app.tasks.delete_expired_exports',
+        'schedule': settings.export_cleanup_interval,
+    },
+    'purge-deleted': {
+        'task': 'app.tasks.purge_deleted',
+        'schedule': 3600.0,
+    },
+}
+
+@signals.worker_ready.connect
+def start_worker_heartbeat(sender=None, **kwargs):
+    """Refresh the heartbeat file read by this instance's /ready (see app.health)."""
+    from app.health import worker_heartbeat
+    worker_heartbeat.start(sender.hostname)
+
+@signals.worker_shutdown.connect
+def stop_worker_heartbeat(**kwargs):
+    from app.health import worker_heartbeat
+    worker_heartbeat.stop()
+
+@signals.setup_logging.connect
+def setup_celery_logging(**kwargs):
+    """Use the application's logging pipeline instead of Celery's default root handler."""
+    configure_logging()
+
+# Propagate trace context from the API through task headers
+instrument_celery()
\ No newline at end of file
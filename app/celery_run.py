@@ -1,19 +1,34 @@
 import os
+import json
 from threading import Thread
 from http.server import HTTPServer, BaseHTTPRequestHandler
 
 class SimpleHandler(BaseHTTPRequestHandler):
+    def _send_json(self, status_code, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status_code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
     def do_GET(self):
         if self.path == "/health":
-            self.send_response(200)
-            self.send_header("Content-Type", "application/json")
-            self.end_headers()
-            self.wfile.write(b'{"status":"ok"}')
+            self._send_json(200, {"status": "ok"})
+        elif self.path == "/ready":
+            # Imported lazily so the liveness endpoint stays up even if app config is broken
+            from app.health import worker_readiness
+            result = worker_readiness.check()
+            self._send_json(200 if result["status"] == "ready" else 503, result)
         else:
             self.send_response(404)
             self.end_headers()
             self.wfile.write(b'Not Found')
 
+    def log_message(self, format, *args):
+        # Probes hit this every few seconds; keep them out of the worker logs
+        pass
+
 def run_http_server():
     port = int(os.environ.get("PORT", 8001))
     httpd = HTTPServer(('0.0.0.0', port), SimpleHandler)
@@ -21,7 +36,16 @@ def run_http_server():
     httpd.serve_forever()
 
 def run_celery_worker():
-    os.system("celery -A app.celery_app worker --loglevel=info -Q ai_processing --pool=solo")
+    # A heartbeat left by a previous run must not count for this worker
+    from app.config import settings
+    try:
+        os.remove(settings.worker_heartbeat_file)
+    except FileNotFoundError:
+        pass
+    # Beat runs as one dedicated `celery -A app.celery_app beat` process; embedding it
+    # (CELERY_EMBED_BEAT=1) is only safe when exactly one worker instance is running
+    beat = " -B" if os.environ.get("CELERY_EMBED_BEAT", "0") == "1" else ""
+    os.system(f"celery -A app.celery_app worker --loglevel=info -Q ai_processing,stripe_events,maintenance --pool=solo{beat}")
 
 if __name__ == "__main__":
     # Start HTTP server in a thread (keeps port open for Render)
@@ -0,0 +1,157 @@
+"""
+Chatroom metadata cache for ownership checks.
+
+Two entries per chatroom, because they change at very different rates:
+
+- `chatroom:owner:{id}` -> owner user id. Ownership never changes, so it is
+  written on create (and on first lookup) and only replaced when the chatroom is
+  deleted, by a short-lived negative entry (also used for ids that do not exist).
+  Routes that just need "does the caller own this chatroom" hit only this key.
+  Lookups write it with SET NX, so a request that read the row just before a
+  delete committed cannot replace the negative entry with the old owner.
+- `chatroom:meta:{id}` -> title, description, message_count and timestamps,
+  written through on create and dropped after every commit that changes
+  message_count or updated_at; the next read repopulates it from Postgres.
+
+Both live in the two-tier cache (app.cache), so a repeat check in the same
+worker does not even reach Redis.
+"""
+import uuid
+from datetime import datetime
+from types import SimpleNamespace
+from typing import Iterable, List, Optional
+from fastapi import HTTPException, status
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.models import Chatroom
+from app.cache import cache
+from app.etag import chatroom_etag_key, chatroom_list_etag_key
+
+MISSING = "-"
+
+
+def chatroom_owner_key(chatroom_id) -> str:
+    return f"chatroom:owner:{chatroom_id}"
+
+
+def chatroom_meta_key(chatroom_id) -> str:
+    return f"chatroom:meta:{chatroom_id}"
+
+
+def chatroom_list_key(user_id) -> str:
+    """Serialized `GET /chatroom` response body."""
+    return f"chatrooms:user:{user_id}"
+
+
+def chatroom_meta(chatroom) -> dict:
+    return {
+        "id": str(chatroom.id),
+        "user_id": str(chatroom.user_id),
+        "title": chatroom.title,
+        "description": chatroom.description,
+        "message_count": chatroom.message_count,
+        "created_at": chatroom.created_at.isoformat() if chatroom.created_at else None,
+        "updated_at": chatroom.updated_at.isoformat() if chatroom.updated_at else None
+    }
+
+
+def _as_chatroom(meta: dict) -> SimpleNamespace:
+    """Attribute view of cached metadata, usable wherever a Chatroom row's fields are read."""
+    return SimpleNamespace(
+        id=uuid.UUID(meta["id"]),
+        user_id=uuid.UUID(meta["user_id"]),
+        title=meta["title"],
+        description=meta["description"],
+        message_count=meta["message_count"],
+        created_at=datetime.fromisoformat(meta["created_at"]) if meta["created_at"] else None,
+        updated_at=datetime.fromisoformat(meta["updated_at"]) if meta["updated_at"] else None
+    )
+
+
+def _parse_id(chatroom_id) -> Optional[uuid.UUID]:
+    try:
+        return uuid.UUID(str(chatroom_id))
+    except ValueError:
+        return None
+
+
+def _not_found() -> HTTPException:
+    return HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Chatroom not found")
+
+
+def _ttl(owner: str) -> int:
+    return settings.chatroom_negative_cache_ttl if owner == MISSING else settings.chatroom_cache_ttl
+
+
+async def store_chatroom_meta(chatroom, invalidate: Iterable[str] = ()):
+    """Write-through after creating a chatroom; `invalidate` keys are dropped in the same round-trip."""
+    await cache.update({
+        chatroom_owner_key(chatroom.id): (str(chatroom.user_id), settings.chatroom_cache_ttl),
+        chatroom_meta_key(chatroom.id): (chatroom_meta(chatroom), settings.chatroom_cache_ttl)
+    }, delete=invalidate)
+
+
+async def mark_chatroom_missing(chatroom_id, invalidate: Iterable[str] = ()):
+    """After a delete: ownership checks fail from cache until the negative entry expires."""
+    await cache.update(
+        {chatroom_owner_key(chatroom_id): (MISSING, settings.chatroom_negative_cache_ttl)},
+        delete=[chatroom_meta_key(chatroom_id), *invalidate]
+    )
+
+
+def chatroom_changed_keys(user_id, *chatroom_ids) -> List[str]:
+    """Cache entries to drop after committing a change to chatrooms' message_count or updated_at."""
+    keys = [chatroom_list_key(user_id), chatroom_list_etag_key(user_id)]
+    for chatroom_id in chatroom_ids:
+        keys += [chatroom_etag_key(user_id, chatroom_id), chatroom_meta_key(chatroom_id)]
+    return keys
+
+
+def invalidate_chatroom_meta_sync(chatroom_ids: Iterable):
+    """For Celery jobs that change counts without knowing the owners (re-counts)."""
+    cache.delete_sync(*(chatroom_meta_key(chatroom_id) for chatroom_id in chatroom_ids))
+
+
+def _load(db: Session, chatroom_id: uuid.UUID) -> Optional[Chatroom]:
+    return db.execute(
+        select(Chatroom).where(Chatroom.id == chatroom_id, Chatroom.deleted_at.is_(None))
+    ).scalar_one_or_none()
+
+
+async def get_owned_chatroom_id(db: Session, chatroom_id, user_id) -> uuid.UUID:
+    """
+    Ownership check served from the cache; 404 when missing, deleted or not the
+    caller's. A cached owner can lag a concurrent delete by one request, so
+    writes must still guard on `deleted_at` (see `increment_message_count`).
+    """
+    parsed = _parse_id(chatroom_id)
+    if parsed is None:
+        raise _not_found()
+
+    def load_owner() -> str:
+        chatroom = _load(db, parsed)
+        if chatroom is None:
+            return MISSING
+        cache.set_sync(chatroom_meta_key(parsed), chatroom_meta(chatroom), settings.chatroom_cache_ttl, nx=True)
+        return str(chatroom.user_id)
+
+    owner = await cache.get_or_load(chatroom_owner_key(parsed), load_owner, _ttl, nx=True)
+    if owner != str(user_id):
+        raise _not_found()
+    return parsed
+
+
+async def get_owned_chatroom(db: Session, chatroom_id, user_id) -> SimpleNamespace:
+    """The caller's chatroom metadata (cached); 404 like `get_owned_chatroom_id`."""
+    parsed = await get_owned_chatroom_id(db, chatroom_id, user_id)
+
+    def load_meta() -> Optional[dict]:
+        chatroom = _load(db, parsed)
+        return chatroom_meta(chatroom) if chatroom is not None else None
+
+    meta = await cache.get_or_load(chatroom_meta_key(parsed), load_meta, settings.chatroom_cache_ttl, nx=True)
+    if meta is None:
+        await mark_chatroom_missing(parsed)
+        raise _not_found()
+    return _as_chatroom(meta)
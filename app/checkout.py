@@ -0,0 +1,78 @@
+import asyncio
+import logging
+import time
+from typing import Any, Dict
+from fastapi import HTTPException, status
+from app.redis_client import redis_client
+from app.stripe_client import stripe_client
+
+logger = logging.getLogger(__name__)
+
+# Stop handing out a cached session shortly before Stripe expires it
+CHECKOUT_EXPIRY_MARGIN = 60
+CHECKOUT_LOCK_TTL = 30
+CHECKOUT_LOCK_WAIT = 10.0
+
+
+def checkout_session_key(user_id) -> str:
+    return f"checkout:user:{user_id}"
+
+
+def checkout_lock_key(user_id) -> str:
+    return f"lock:checkout:user:{user_id}"
+
+
+def invalidate_checkout_session_sync(user_id):
+    """Called from the Stripe event worker once a session completes or expires."""
+    try:
+        redis_client.client.delete(checkout_session_key(user_id))
+    except Exception as e:
+        logger.warning("Could not invalidate checkout session for user %s: %s", user_id, e)
+
+
+async def _wait_for_session(user_id) -> Dict[str, Any]:
+    """Another request holds the creation lock; wait for it to publish its session."""
+    deadline = time.monotonic() + CHECKOUT_LOCK_WAIT
+    while time.monotonic() < deadline:
+        await asyncio.sleep(0.1)
+        cached = await redis_client.get_json(checkout_session_key(user_id))
+        if cached:
+            return cached
+        if not await redis_client.exists(checkout_lock_key(user_id)):
+            break
+    raise HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail="A checkout session is already being created, please retry"
+    )
+
+
+async def get_or_create_checkout_session(user_id, customer_email: str = None) -> Dict[str, Any]:
+    """
+    Return the user's open checkout session, creating one if needed.
+
+    Sessions are cached in Redis until shortly before they expire, so repeat
+    "upgrade" clicks get the same URL without a Stripe round-trip. A SET NX lock
+    ensures concurrent requests for the same user create at most one session.
+    """
+    cache_key = checkout_session_key(user_id)
+    cached = await redis_client.get_json(cache_key)
+    if cached:
+        return cached
+    lock_key = checkout_lock_key(user_id)
+    try:
+        acquired = redis_client.client.set(lock_key, "1", nx=True, ex=CHECKOUT_LOCK_TTL)
+    except Exception:
+        acquired = True  # Redis unavailable: fall back to creating a session without reuse
+    if not acquired:
+        return await _wait_for_session(user_id)
+    try:
+        session = await stripe_client.create_checkout_session_async(
+            user_id=str(user_id),
+            customer_email=customer_email
+        )
+        ttl = int(session.get("expires_at") or 0) - int(time.time()) - CHECKOUT_EXPIRY_MARGIN
+        if ttl > 0:
+            await redis_client.set_json(cache_key, session, expire=ttl)
+        return session
+    finally:
+        await redis_client.delete(lock_key)
@@ -0,0 +1,261 @@
+"""
+Transparent zstd compression for large message bodies.
+
+`CompressedText` is a `Text` column type: with `MESSAGE_COMPRESSION` enabled,
+values of at least `MESSAGE_COMPRESSION_MIN_BYTES` are stored as
+
+    "\\x01z:" + base64(zstd frame)
+
+optionally compressed with a shared dictionary trained on our own messages
+(`train-dict` below). Reads always decode, whatever the current settings, so
+compressed and plain rows can coexist and compression can be switched off at any
+time. Frames carry their dictionary id; every dictionary in
+`MESSAGE_COMPRESSION_DICT_DIR` is loaded for decoding, so keep retired ones there.
+Plain values that happen to start with the marker byte are escaped ("\\x01p:").
+
+Existing rows are (de)compressed in batches with the CLI:
+    python -m app.compression train-dict [--samples 20000] [--size 112640]
+    python -m app.compression compress [--batch-size 500]
+    python -m app.compression decompress [--batch-size 500]
+"""
+import argparse
+import base64
+import glob
+import json
+import logging
+import os
+import threading
+from typing import Dict, Iterable, List, Optional
+from sqlalchemy import select, text
+from sqlalchemy.orm import Session
+from sqlalchemy.types import Text, TypeDecorator
+import zstandard
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+MARKER = "\x01"
+COMPRESSED_PREFIX = MARKER + "z:"
+ESCAPED_PREFIX = MARKER + "p:"
+DICT_SUFFIX = ".zdict"
+
+
+class MessageCodec:
+    """Encodes/decodes stored message bodies; one instance per process (`message_codec`)."""
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._dicts: Optional[Dict[int, zstandard.ZstdCompressionDict]] = None
+        self._active_dict: Optional[zstandard.ZstdCompressionDict] = None
+
+    @classmethod
+    def with_dictionary(cls, dictionary: Optional[zstandard.ZstdCompressionDict]) -> "MessageCodec":
+        """Codec using exactly `dictionary` (or none), ignoring the dictionary settings."""
+        codec = cls()
+        codec._dicts = {dictionary.dict_id(): dictionary} if dictionary else {}
+        codec._active_dict = dictionary
+        return codec
+
+    def _load_dicts(self):
+        with self._lock:
+            if self._dicts is not None:
+                return
+            dicts = {}
+            for path in glob.glob(os.path.join(settings.message_compression_dict_dir, f"*{DICT_SUFFIX}")):
+                with open(path, "rb") as f:
+                    dictionary = zstandard.ZstdCompressionDict(f.read())
+                dicts[dictionary.dict_id()] = dictionary
+            active = None
+            if settings.message_compression_dict:
+                with open(settings.message_compression_dict, "rb") as f:
+                    active = zstandard.ZstdCompressionDict(f.read())
+                active.precompute_compress(level=settings.message_compression_level)
+                dicts[active.dict_id()] = active
+            self._active_dict = active
+            self._dicts = dicts
+
+    def reload(self):
+        """Forget loaded dictionaries (after training a new one)."""
+        with self._lock:
+            self._dicts = None
+            self._active_dict = None
+            self._local = threading.local()
+
+    def _compressor(self) -> zstandard.ZstdCompressor:
+        # zstd contexts are not thread-safe: one per thread
+        compressor = getattr(self._local, "compressor", None)
+        if compressor is None:
+            self._load_dicts()
+            compressor = zstandard.ZstdCompressor(
+                level=settings.message_compression_level, dict_data=self._active_dict
+            )
+            self._local.compressor = compressor
+        return compressor
+
+    def _decompressor(self, dict_id: int) -> zstandard.ZstdDecompressor:
+        decompressors = getattr(self._local, "decompressors", None)
+        if decompressors is None:
+            decompressors = self._local.decompressors = {}
+        decompressor = decompressors.get(dict_id)
+        if decompressor is None:
+            self._load_dicts()
+            dictionary = None
+            if dict_id:
+                dictionary = self._dicts.get(dict_id)
+                if dictionary is None:
+                    raise ValueError(f"zstd dictionary {dict_id} not found in {settings.message_compression_dict_dir}")
+            decompressor = decompressors[dict_id] = zstandard.ZstdDecompressor(dict_data=dictionary)
+        return decompressor
+
+    def compress(self, value: str) -> str:
+        """Stored form of `value` when compressing regardless of the enabled flag (size rules still apply)."""
+        raw = value.encode("utf-8")
+        if len(raw) >= settings.message_compression_min_bytes:
+            encoded = COMPRESSED_PREFIX + base64.b64encode(self._compressor().compress(raw)).decode("ascii")
+            if len(encoded) < len(raw):
+                return encoded
+        return ESCAPED_PREFIX + value if value.startswith(MARKER) else value
+
+    def encode(self, value: Optional[str]) -> Optional[str]:
+        if value is None:
+            return None
+        if settings.message_compression:
+            return self.compress(value)
+        return ESCAPED_PREFIX + value if value.startswith(MARKER) else value
+
+    def decode(self, value: Optional[str]) -> Optional[str]:
+        if value is None or not value.startswith(MARKER):
+            return value
+        if value.startswith(ESCAPED_PREFIX):
+            return value[len(ESCAPED_PREFIX):]
+        if value.startswith(COMPRESSED_PREFIX):
+            frame = base64.b64decode(value[len(COMPRESSED_PREFIX):])
+            dict_id = zstandard.get_frame_parameters(frame).dict_id
+            # Frames are written with their content size, so one-shot decompression applies
+            return self._decompressor(dict_id).decompress(frame).decode("utf-8")
+        return value
+
+
+message_codec = MessageCodec()
+
+
+class CompressedText(TypeDecorator):
+    """`Text` whose large values are stored zstd-compressed (see module docstring)."""
+    impl = Text
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        return message_codec.encode(value)
+
+    def process_result_value(self, value, dialect):
+        return message_codec.decode(value)
+
+
+# --- Batch migration and dictionary training -------------------------------
+
+def _iter_raw_batches(db: Session, batch_size: int):
+    """Stored (not decoded) message bodies in keyset batches of (created_at, id)."""
+    last = None
+    while True:
+        where = "WHERE (created_at, id) > (:created_at, :id)" if last else ""
+        rows = db.execute(text(
+            f"SELECT id, created_at, content, ai_response FROM messages {where} "
+            "ORDER BY created_at, id LIMIT :limit"
+        ), {"created_at": last[0], "id": last[1], "limit": batch_size} if last else {"limit": batch_size}).all()
+        if not rows:
+            return
+        last = (rows[-1].created_at, rows[-1].id)
+        yield rows
+
+
+def recode_messages(db: Session, compress: bool, batch_size: int = 500) -> dict:
+    """
+    Rewrite existing rows compressed (or back to plain text), one batch per
+    transaction. Rows already in the target form are left untouched, so the
+    migration can be stopped and resumed.
+    """
+    summary = {"scanned": 0, "updated": 0, "bytes_before": 0, "bytes_after": 0}
+    for rows in _iter_raw_batches(db, batch_size):
+        changes = {"content": [], "ai_response": []}
+        for row in rows:
+            for column in ("content", "ai_response"):
+                stored = getattr(row, column)
+                if stored is None:
+                    continue
+                plain = message_codec.decode(stored)
+                target = message_codec.compress(plain) if compress else (
+                    ESCAPED_PREFIX + plain if plain.startswith(MARKER) else plain
+                )
+                summary["bytes_before"] += len(stored.encode("utf-8"))
+                summary["bytes_after"] += len(target.encode("utf-8"))
+                if target != stored:
+                    changes[column].append(
+                        {"id": row.id, "created_at": row.created_at, "old": stored, "new": target}
+                    )
+        # One column per statement, only if it still holds the value read above:
+        # a Gemini reply written since the batch was read is never overwritten
+        for column, params in changes.items():
+            if params:
+                db.execute(text(
+                    f"UPDATE messages SET {column} = :new "
+                    f"WHERE id = :id AND created_at = :created_at AND {column} = :old"
+                ), params)
+        db.commit()
+        summary["scanned"] += len(rows)
+        summary["updated"] += len({change["id"] for params in changes.values() for change in params})
+        logger.info("Recoded %d/%d messages", summary["updated"], summary["scanned"])
+    return summary
+
+
+def sample_messages(db: Session, limit: int) -> List[bytes]:
+    """Recent message bodies (decoded) used as dictionary training samples."""
+    from app.models import Message
+    rows = db.execute(
+        select(Message.content, Message.ai_response).order_by(Message.created_at.desc()).limit(limit)
+    )
+    samples = []
+    for content, ai_response in rows:
+        samples.extend(value.encode("utf-8") for value in (content, ai_response) if value)
+    return samples
+
+
+def train_dictionary(samples: Iterable[bytes], size: int) -> str:
+    """Train a zstd dictionary and write it to MESSAGE_COMPRESSION_DICT_DIR; returns its path."""
+    dictionary = zstandard.train_dictionary(size, list(samples), level=settings.message_compression_level)
+    os.makedirs(settings.message_compression_dict_dir, exist_ok=True)
+    path = os.path.join(settings.message_compression_dict_dir, f"messages-{dictionary.dict_id()}{DICT_SUFFIX}")
+    with open(path, "wb") as f:
+        f.write(dictionary.as_bytes())
+    return path
+
+
+def main():
+    from app.database import SessionLocal
+    from app.logging_config import configure_logging
+
+    arg_parser = argparse.ArgumentParser(description="Message body compression tools")
+    commands = arg_parser.add_subparsers(dest="command", required=True)
+    for name in ("compress", "decompress"):
+        command = commands.add_parser(name)
+        command.add_argument("--batch-size", type=int, default=500)
+    train = commands.add_parser("train-dict")
+    train.add_argument("--samples", type=int, default=20000, help="recent messages to sample")
+    train.add_argument("--size", type=int, default=112640, help="dictionary size in bytes")
+    args = arg_parser.parse_args()
+
+    configure_logging()
+    db = SessionLocal()
+    try:
+        if args.command == "train-dict":
+            path = train_dictionary(sample_messages(db, args.samples), args.size)
+            summary = {"dictionary": path, "hint": f"set MESSAGE_COMPRESSION_DICT={path}"}
+        else:
+            summary = recode_messages(db, args.command == "compress", args.batch_size)
+    finally:
+        db.close()
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
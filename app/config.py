@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings
-from typing import List
+from typing import Dict, List, Optional
 import os
 
 class Settings(BaseSettings):
@@ -8,11 +8,24 @@ class Settings(BaseSettings):
     
     # Redis Configuration
     redis_url: str = "redis://localhost:6379/0"
+    redis_serializer: str = "orjson"  # orjson, json or msgpack (needs `pip install msgpack`)
+    redis_compression_threshold: int = 4096  # bytes; larger values are zstd-compressed, 0 disables
+    redis_compression_level: int = 3
     
     # JWT Configuration
     jwt_secret_key: str = "your-super-secret-jwt-key-here"
     jwt_algorithm: str = "HS256"
     jwt_access_token_expire_minutes: int = 1440  # 24 hours
+    jwt_backend: str = "jose"  # "jose" or "pyjwt" (optional, faster)
+    jwt_cache_size: int = 10000  # decoded-claims LRU entries per process
+
+    # Admin API (disabled when empty)
+    admin_api_key: str = ""
+    user_import_batch_size: int = 1000
+
+    # Password Hashing
+    bcrypt_rounds: int = 12
+    password_hash_workers: int = 2
     
     # Google Gemini API
     gemini_api_key: str = ""
@@ -22,6 +35,11 @@ class Settings(BaseSettings):
     stripe_secret_key: str = ""
     stripe_webhook_secret: str = ""
     stripe_pro_price_id: str = ""
+    stripe_event_max_attempts: int = 10
+    stripe_backend: str = "live"  # "live" or "stub" (in-process fake for local dev/tests)
+    stripe_request_timeout: float = 10.0
+    stripe_reconcile_interval: float = 86400.0  # seconds between full reconciliation runs
+    stripe_reconcile_chunk_size: int = 500
     
     # Application Configuration
     app_name: str = "Gemini Backend Clone"
@@ -35,6 +53,89 @@ class Settings(BaseSettings):
     
     # Rate Limiting
     basic_daily_limit: int = 5
+
+    # Two-tier cache (in-process LRU in front of Redis)
+    local_cache_max_entries: int = 10000
+    local_cache_ttl: int = 30  # seconds; bounds staleness if an invalidation is missed
+    cache_invalidation_channel: str = "cache:invalidate"
+    cache_load_lock_ttl: int = 10  # seconds a process holds the single-flight lock for a key
+    cache_load_wait: float = 2.0  # seconds other processes wait for that load before loading themselves
+
+    # Chatroom metadata cache (ownership checks)
+    chatroom_cache_ttl: int = 3600  # seconds
+    chatroom_negative_cache_ttl: int = 60  # seconds a deleted/unknown chatroom id is remembered
+
+    # Idempotency-Key support (POST /chatroom/{id}/message)
+    idempotency_ttl: int = 86400  # seconds a stored response can be replayed
+    idempotency_lock_ttl: int = 60  # seconds an in-flight request holds its key
+
+    # Entitlements
+    entitlement_cache_ttl: int = 3600  # seconds; never outlives a paid period
+    subscription_grace_seconds: int = 3600  # paid access kept this long past current_period_end
+    entitlement_sweep_interval: float = 600.0  # seconds between lapsed-subscription sweeps
+
+    # Message search
+    search_text_config: str = "english"  # Postgres text search configuration
+    search_max_candidates: int = 2000  # newest matches considered for ranking
+
+    # Data export
+    export_dir: str = "exports"  # background exports are written here (shared with the API)
+    export_retention: int = 86400  # seconds an export file is kept before the cleanup job deletes it
+    export_cleanup_interval: float = 3600.0  # seconds between cleanup runs
+
+    # Deletion
+    purge_batch_size: int = 1000  # messages deleted per transaction
+    purge_batch_pause: float = 0.05  # seconds between batches
+    purge_sweep_delay: int = 3600  # soft-deleted rows older than this are re-enqueued for purge
+
+    # Message body compression (opt-in; reads always decode)
+    message_compression: bool = False
+    message_compression_min_bytes: int = 1024  # smaller bodies are stored as plain text
+    message_compression_level: int = 6
+    message_compression_dict: Optional[str] = None  # dictionary file used for new writes
+    message_compression_dict_dir: str = "zstd_dicts"  # every dictionary here is loaded for reads
+
+    # Message partitions and archive
+    messages_partition_months_ahead: int = 3  # monthly partitions created ahead of time
+    messages_archive_after_days: int = 365  # whole months older than this are archived and dropped
+    archive_dir: str = "archive"  # zstd archives of old partitions
+    archive_zstd_level: int = 10
+    partition_maintenance_interval: float = 86400.0  # seconds between partition maintenance runs
+    context_lookback_days: int = 30  # Gemini context only reads this recent window (partition pruning)
+
+    # Usage rollups
+    rollup_interval: float = 900.0  # seconds between incremental rollup runs
+    rollup_overlap_seconds: int = 300  # re-read window before the watermark for late commits
+
+    # OTP
+    otp_ttl_seconds: int = 300
+    otp_max_attempts: int = 5
+    otp_audit_batch_size: int = 500
+    otp_audit_max_backlog: int = 100000  # oldest audit records are dropped beyond this
+    otp_audit_flush_interval: float = 10.0  # seconds
+
+    # Readiness probes
+    readiness_probe_timeout: float = 1.0  # seconds, per dependency
+    readiness_cache_seconds: float = 3.0
+    worker_heartbeat_file: str = "/tmp/celery-worker-heartbeat"  # written by this instance's worker, read by its /ready
+    worker_heartbeat_interval: float = 5.0  # seconds
+    worker_heartbeat_max_age: float = 30.0  # seconds before the worker is reported down
+
+    # Logging
+    log_level: str = "INFO"
+    log_format: str = "json"  # "json" or "text"
+    log_levels: Dict[str, str] = {"httpx": "WARNING"}  # per-module overrides
+    log_sample_rates: Dict[str, float] = {}  # e.g. {"app.tasks": 0.1} keeps 10% of sub-WARNING records
+    log_max_message_length: int = 2000
+    log_queue_size: int = 10000
+
+    # Tracing
+    tracing_enabled: bool = False
+    tracing_service_name: str = "gemini-backend"
+    tracing_exporter: str = "file"  # "file" or "collector" (OTLP/HTTP JSON)
+    tracing_file_path: str = "traces.jsonl"
+    tracing_collector_url: str = "http://localhost:4318/v1/traces"
+    tracing_sample_rate: float = 1.0
     
     class Config:
         env_file = ".env"
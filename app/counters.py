@@ -0,0 +1,65 @@
+"""
+Chatroom message counters.
+
+Counts are maintained with a server-side `UPDATE ... SET message_count =
+message_count + n`, issued as the last statement before commit so the row lock
+is held only for the commit itself. `recount_message_counts` recomputes every
+chatroom's count from `messages` (plus archived segments, see app.partitions)
+in keyset-paginated batches (backfill/repair).
+"""
+import logging
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session
+from app.chatroom_cache import invalidate_chatroom_meta_sync
+from app.models import Chatroom, Message, MessageArchiveSegment
+
+logger = logging.getLogger(__name__)
+
+
+def increment_message_count(db: Session, chatroom_id, amount: int = 1) -> bool:
+    """
+    Atomically add `amount` to the chatroom's counter within the caller's transaction.
+    Returns False when the chatroom is soft-deleted (or gone): the caller should
+    roll back, since ownership checks served from cache may not have seen the delete.
+    """
+    result = db.execute(
+        update(Chatroom)
+        .where(Chatroom.id == chatroom_id, Chatroom.deleted_at.is_(None))
+        .values(message_count=func.coalesce(Chatroom.message_count, 0) + amount)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount > 0
+
+
+def recount_message_counts(db: Session, batch_size: int = 1000) -> dict:
+    """Set message_count = COUNT(messages) for every chatroom, one batch of chatrooms per transaction."""
+    summary = {"chatrooms": 0, "corrected": 0}
+    last_id = None
+    while True:
+        query = select(Chatroom.id).order_by(Chatroom.id).limit(batch_size)
+        if last_id is not None:
+            query = query.where(Chatroom.id > last_id)
+        ids = db.execute(query).scalars().all()
+        if not ids:
+            break
+        last_id = ids[-1]
+        live = select(func.count(Message.id)).where(
+            Message.chatroom_id == Chatroom.id
+        ).scalar_subquery()
+        archived = select(func.coalesce(func.sum(MessageArchiveSegment.message_count), 0)).where(
+            MessageArchiveSegment.chatroom_id == Chatroom.id
+        ).scalar_subquery()
+        actual = live + archived
+        corrected = db.execute(
+            update(Chatroom)
+            .where(Chatroom.id.in_(ids), Chatroom.message_count.is_distinct_from(actual))
+            # Keep updated_at: a repair must not reorder users' chatroom lists
+            .values(message_count=actual, updated_at=Chatroom.updated_at)
+            .returning(Chatroom.id)
+            .execution_options(synchronize_session=False)
+        ).scalars().all()
+        db.commit()
+        invalidate_chatroom_meta_sync(corrected)
+        summary["chatrooms"] += len(ids)
+        summary["corrected"] += len(corrected)
+    return summary
@@ -0,0 +1,156 @@
+"""
+Effective plan resolution.
+
+A user's entitlement (effective tier and daily limit) is derived from their most
+recent subscription and cached in Redis under `entitlement:user:{id}`. Paid
+access ends at `current_period_end` plus a grace period even if no webhook has
+arrived: the cache entry never outlives that moment and lookups re-check it.
+Stripe event handlers invalidate the entry, and `downgrade_lapsed_subscriptions`
+periodically moves lapsed Pro rows back to Basic in bulk.
+"""
+import logging
+from datetime import datetime, timedelta
+from typing import Iterable, Optional
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+import pytz
+from app.config import settings
+from app.models import User, Subscription, SubscriptionTier, SubscriptionStatus
+from app.redis_client import redis_client
+
+logger = logging.getLogger(__name__)
+
+# Statuses that keep paid access until the period ends (past_due: Stripe is still retrying payment)
+PAID_STATUSES = (SubscriptionStatus.ACTIVE, SubscriptionStatus.PAST_DUE)
+
+
+def entitlement_key(user_id) -> str:
+    return f"entitlement:user:{user_id}"
+
+
+def _utcnow() -> datetime:
+    return datetime.utcnow().replace(tzinfo=pytz.UTC)
+
+
+class Entitlement:
+    """Effective plan for one user. `daily_limit` is None for unlimited plans."""
+
+    def __init__(self, tier: SubscriptionTier, status: Optional[str],
+                 current_period_end: Optional[datetime], has_subscription: bool):
+        self.tier = tier
+        self.status = status
+        self.current_period_end = current_period_end
+        self.has_subscription = has_subscription
+
+    @property
+    def access_until(self) -> Optional[datetime]:
+        if self.tier != SubscriptionTier.PRO or self.current_period_end is None:
+            return None
+        return self.current_period_end + timedelta(seconds=settings.subscription_grace_seconds)
+
+    @property
+    def effective_tier(self) -> SubscriptionTier:
+        access_until = self.access_until
+        if self.tier == SubscriptionTier.PRO and (access_until is None or access_until > _utcnow()):
+            return SubscriptionTier.PRO
+        return SubscriptionTier.BASIC
+
+    @property
+    def daily_limit(self) -> Optional[int]:
+        return None if self.effective_tier == SubscriptionTier.PRO else settings.basic_daily_limit
+
+    @classmethod
+    def from_subscription(cls, subscription: Optional[Subscription]) -> "Entitlement":
+        if subscription is None:
+            return cls(SubscriptionTier.BASIC, None, None, False)
+        tier = subscription.plan_type
+        if tier == SubscriptionTier.PRO and subscription.status not in PAID_STATUSES:
+            tier = SubscriptionTier.BASIC
+        return cls(tier, subscription.status.value if subscription.status else None,
+                   subscription.current_period_end, True)
+
+    def to_dict(self) -> dict:
+        return {
+            "tier": self.tier.value,
+            "status": self.status,
+            "current_period_end": self.current_period_end.isoformat() if self.current_period_end else None,
+            "has_subscription": self.has_subscription
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Entitlement":
+        period_end = data.get("current_period_end")
+        return cls(
+            SubscriptionTier(data["tier"]),
+            data.get("status"),
+            datetime.fromisoformat(period_end) if period_end else None,
+            data.get("has_subscription", True)
+        )
+
+
+def load_entitlement(db: Session, user_id) -> Entitlement:
+    subscription = db.query(Subscription).filter(
+        Subscription.user_id == user_id
+    ).order_by(Subscription.created_at.desc()).first()
+    return Entitlement.from_subscription(subscription)
+
+
+def _cache_ttl(entitlement: Entitlement) -> int:
+    ttl = settings.entitlement_cache_ttl
+    access_until = entitlement.access_until
+    if access_until is not None:
+        remaining = int((access_until - _utcnow()).total_seconds())
+        if remaining > 0:
+            ttl = min(ttl, remaining)
+    return max(ttl, 1)
+
+
+async def get_entitlement(user: User, db: Session) -> Entitlement:
+    """One Redis GET on the hot path; falls back to the database on a miss."""
+    key = entitlement_key(user.id)
+    cached = await redis_client.get_json(key)
+    if cached:
+        try:
+            return Entitlement.from_dict(cached)
+        except (KeyError, ValueError):
+            pass
+    entitlement = load_entitlement(db, user.id)
+    await redis_client.set_json(key, entitlement.to_dict(), expire=_cache_ttl(entitlement))
+    return entitlement
+
+
+async def invalidate_entitlement(user_id):
+    await redis_client.delete(entitlement_key(user_id))
+
+
+def invalidate_entitlements_sync(user_ids: Iterable):
+    """Sync variant for Celery tasks and Stripe event handlers."""
+    keys = [entitlement_key(user_id) for user_id in user_ids]
+    try:
+        for i in range(0, len(keys), 500):
+            redis_client.client.delete(*keys[i:i + 500])
+    except Exception as e:
+        logger.warning("Could not invalidate %d entitlement(s): %s", len(keys), e)
+
+
+def downgrade_lapsed_subscriptions(db: Session) -> int:
+    """
+    Move every Pro subscription whose period (plus grace) has ended back to Basic
+    in one UPDATE, and drop the affected cache entries. Returns the number of rows.
+    """
+    cutoff = _utcnow() - timedelta(seconds=settings.subscription_grace_seconds)
+    result = db.execute(
+        update(Subscription)
+        .where(
+            Subscription.plan_type == SubscriptionTier.PRO,
+            Subscription.current_period_end.isnot(None),
+            Subscription.current_period_end < cutoff
+        )
+        .values(plan_type=SubscriptionTier.BASIC, status=SubscriptionStatus.INACTIVE)
+        .returning(Subscription.user_id)
+    )
+    user_ids = [row[0] for row in result]
+    db.commit()
+    if user_ids:
+        invalidate_entitlements_sync(user_ids)
+    return len(user_ids)
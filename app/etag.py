@@ -0,0 +1,70 @@
+import hashlib
+from typing import Optional
+from fastapi import Request
+from fastapi.responses import Response
+from app.cache import cache
+
+# Validators live in the two-tier cache (app.cache) so conditional GETs can be answered without touching Postgres.
+CHATROOM_VALIDATOR_TTL = 300
+MESSAGE_VALIDATOR_TTL = 3600
+
+
+def chatroom_list_etag_key(user_id) -> str:
+    return f"etag:chatrooms:user:{user_id}"
+
+
+def chatroom_etag_key(user_id, chatroom_id) -> str:
+    return f"etag:chatroom:{user_id}:{chatroom_id}"
+
+
+def message_etag_key(user_id, message_id) -> str:
+    return f"etag:message:{user_id}:{message_id}"
+
+
+def make_etag(*parts) -> str:
+    """Weak ETag from the fields that change whenever the representation changes."""
+    digest = hashlib.blake2b("|".join(str(p) for p in parts).encode(), digest_size=8).hexdigest()
+    return f'W/"{digest}"'
+
+
+def chatroom_etag(chatroom) -> str:
+    return make_etag(chatroom.id, chatroom.updated_at, chatroom.message_count)
+
+
+def chatroom_list_etag(chatrooms) -> str:
+    return make_etag(*(f"{c.id}:{c.updated_at}:{c.message_count}" for c in chatrooms))
+
+
+def message_etag(message) -> str:
+    status = getattr(message.processing_status, "value", message.processing_status)
+    return make_etag(message.id, status, message.processing_time_ms, len(message.ai_response or ""))
+
+
+def etag_matches(request: Request, etag: Optional[str]) -> bool:
+    """Weak comparison of `If-None-Match` against `etag` (RFC 9110, 13.1.2)."""
+    header = request.headers.get("if-none-match")
+    if not header or not etag:
+        return False
+    if header.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(candidate.strip().removeprefix("W/") == opaque for candidate in header.split(","))
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag})
+
+
+async def cached_not_modified(request: Request, key: str) -> Optional[Response]:
+    """Return a 304 if the client's validator matches the one cached under `key`."""
+    if "if-none-match" not in request.headers:
+        return None
+    etag = await cache.get(key)
+    if etag and etag_matches(request, etag):
+        return not_modified(etag)
+    return None
+
+
+def store_validator_sync(key: str, etag: str, expire: int):
+    """Store a validator from synchronous code (Celery tasks); other processes drop their local copy."""
+    cache.set_sync(key, etag, expire)
@@ -0,0 +1,181 @@
+"""
+"Download my data" export.
+
+A user's account, chatrooms and messages are streamed as NDJSON (one JSON
+object per line, each with a `type` field) through a generator pipeline:
+
+    iter_export_records -> iter_ndjson -> [gzip_chunks] -> response / file
+
+Rows are read with server-side cursors (`yield_per`), so memory stays constant
+regardless of history size. Archived months (app.partitions) are included: each
+chatroom's archived frames are read, one at a time, just before its live
+messages. `write_export` is the background (Celery) variant that writes the
+same stream to a file under `settings.export_dir`. A user keeps at most one
+export file; files older than EXPORT_RETENTION are deleted by a beat job and a
+purged user's files are deleted with the account.
+"""
+import glob
+import logging
+import os
+import time
+import zlib
+from datetime import datetime
+from typing import Iterable, Iterator
+from sqlalchemy import exists, select
+from app.config import settings
+from app.database import SessionLocal
+from app.models import User, Chatroom, Message, MessageArchiveSegment
+from app.partitions import read_segment
+from app.responses import dumps
+
+logger = logging.getLogger(__name__)
+
+EXPORT_BATCH_SIZE = 1000
+CHUNK_SIZE = 64 * 1024
+MESSAGE_FIELDS = (
+    "id", "chatroom_id", "message_type", "content", "ai_response",
+    "processing_status", "processing_time_ms", "created_at"
+)
+
+
+def _archived_records(segment: MessageArchiveSegment) -> Iterator[dict]:
+    for record in read_segment(segment):
+        yield {"type": "message", **{field: record.get(field) for field in MESSAGE_FIELDS}, "archived": True}
+
+
+def iter_export_records(user_id) -> Iterator[dict]:
+    """Yield the user record, then every chatroom, then every message (by chatroom, oldest first)."""
+    db = SessionLocal()
+    try:
+        user = db.execute(
+            select(User.id, User.mobile_number, User.full_name, User.created_at, User.last_login)
+            .where(User.id == user_id, User.deleted_at.is_(None))
+        ).first()
+        if user is None:
+            return
+        yield {"type": "user", **user._asdict()}
+
+        chatrooms = db.execute(
+            select(Chatroom.id, Chatroom.title, Chatroom.description, Chatroom.message_count,
+                   Chatroom.created_at, Chatroom.updated_at)
+            .where(Chatroom.user_id == user_id, Chatroom.deleted_at.is_(None))
+            .order_by(Chatroom.created_at)
+            .execution_options(yield_per=EXPORT_BATCH_SIZE)
+        )
+        for row in chatrooms:
+            yield {"type": "chatroom", **row._asdict()}
+
+        deleted_room = exists().where(Chatroom.id == Message.chatroom_id, Chatroom.deleted_at.isnot(None))
+        # A few rows per chatroom and month; archived months are older than any live row
+        segments = db.execute(
+            select(MessageArchiveSegment)
+            .join(Chatroom, Chatroom.id == MessageArchiveSegment.chatroom_id)
+            .where(MessageArchiveSegment.user_id == user_id, Chatroom.deleted_at.is_(None))
+            .order_by(MessageArchiveSegment.chatroom_id, MessageArchiveSegment.first_created_at)
+        ).scalars().all()
+        pending = iter(segments)
+        segment = next(pending, None)
+        messages = db.execute(
+            select(Message.id, Message.chatroom_id, Message.message_type, Message.content,
+                   Message.ai_response, Message.processing_status, Message.processing_time_ms,
+                   Message.created_at)
+            .where(Message.user_id == user_id, ~deleted_room)
+            .order_by(Message.chatroom_id, Message.created_at)
+            .execution_options(yield_per=EXPORT_BATCH_SIZE)
+        )
+        for row in messages:
+            # Same chatroom order as Postgres: uuid.UUID compares like the uuid type
+            while segment is not None and segment.chatroom_id <= row.chatroom_id:
+                yield from _archived_records(segment)
+                segment = next(pending, None)
+            yield {"type": "message", **row._asdict()}
+        while segment is not None:
+            yield from _archived_records(segment)
+            segment = next(pending, None)
+    finally:
+        db.close()
+
+
+def iter_ndjson(records: Iterable[dict], chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """Serialize records one per line, coalesced into ~chunk_size byte chunks."""
+    buffer = bytearray()
+    for record in records:
+        buffer += dumps(record)
+        buffer += b"\n"
+        if len(buffer) >= chunk_size:
+            yield bytes(buffer)
+            buffer.clear()
+    if buffer:
+        yield bytes(buffer)
+
+
+def gzip_chunks(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """Incremental gzip (wbits=31 writes the gzip header and trailer)."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def export_stream(user_id, gzip: bool = False) -> Iterator[bytes]:
+    chunks = iter_ndjson(iter_export_records(user_id))
+    return gzip_chunks(chunks) if gzip else chunks
+
+
+def export_filename(user_id, gzip: bool, now: datetime = None) -> str:
+    stamp = (now or datetime.utcnow()).strftime("%Y%m%dT%H%M%SZ")
+    return f"{user_id}-{stamp}.ndjson{'.gz' if gzip else ''}"
+
+
+def _remove(path: str) -> bool:
+    try:
+        os.remove(path)
+        return True
+    except FileNotFoundError:
+        return False
+    except OSError as e:
+        logger.warning("Could not delete export file %s: %s", path, e)
+        return False
+
+
+def user_export_files(user_id):
+    return glob.glob(os.path.join(settings.export_dir, f"{user_id}-*.ndjson*"))
+
+
+def delete_user_exports(user_id, keep: str = None) -> int:
+    """Delete the user's export files (except `keep`); returns how many were removed."""
+    return sum(_remove(path) for path in user_export_files(user_id) if path != keep)
+
+
+def delete_expired_exports(retention: int = None) -> int:
+    """Delete export files last written more than `retention` seconds ago."""
+    retention = settings.export_retention if retention is None else retention
+    cutoff = time.time() - retention
+    removed = 0
+    for path in glob.glob(os.path.join(settings.export_dir, "*.ndjson*")):
+        try:
+            expired = os.path.getmtime(path) < cutoff
+        except FileNotFoundError:
+            continue
+        if expired:
+            removed += _remove(path)
+    return removed
+
+
+def write_export(user_id, gzip: bool = True) -> str:
+    """Write the export to `settings.export_dir` and return the file path (written atomically)."""
+    os.makedirs(settings.export_dir, exist_ok=True)
+    path = os.path.join(settings.export_dir, export_filename(user_id, gzip))
+    tmp_path = f"{path}.part"
+    written = 0
+    with open(tmp_path, "wb") as f:
+        for chunk in export_stream(user_id, gzip):
+            f.write(chunk)
+            written += len(chunk)
+    os.replace(tmp_path, path)
+    # Only the newest copy of the user's history is kept on disk
+    delete_user_exports(user_id, keep=path)
+    logger.info("Export for user %s written to %s (%d bytes)", user_id, path, written)
+    return path
@@ -1,5 +1,6 @@
 import google.generativeai as genai
 from app.config import settings
+from app.tracing import tracer
 import logging
 from typing import List, Dict, Optional
 import os
@@ -9,7 +10,6 @@ logger = logging.getLogger(__name__)
 class GeminiClient:
     def __init__(self):
         if settings.gemini_api_key:
-            logger.info(settings.gemini_api_key)
             genai.configure(api_key=settings.gemini_api_key)
             self.model = genai.GenerativeModel('gemini-2.0-flash-lite')
         else:
@@ -23,11 +23,13 @@ class GeminiClient:
         try:
             if context and isinstance(context, list) and context:
                 # Ensure context is non-empty and list of dicts in Gemini format
-                logger.info(f"[GEMINI] Using chat context: {context}")
-                response = self.model.generate_content(context)
+                logger.debug("[GEMINI] Using chat context with %d turns", len(context))
+                with tracer.span("gemini.generate_content", turns=len(context)):
+                    response = self.model.generate_content(context)
             elif content and isinstance(content, str) and content.strip():
-                logger.info(f"[GEMINI] Using content only: {content!r}")
-                response = self.model.generate_content(content)
+                logger.debug("[GEMINI] Using content only (%d chars)", len(content))
+                with tracer.span("gemini.generate_content", turns=1):
+                    response = self.model.generate_content(content)
             else:
                 logger.error("[GEMINI] Called with no valid input (no context, no content).")
                 return "[No input provided to Gemini.]"
@@ -37,7 +39,7 @@ class GeminiClient:
                 return text
             return "[No text received from Gemini AI.]"
         except Exception as e:
-            logger.error(f"Gemini API error: {str(e)}")
+            logger.error("Gemini API error: %s", e)
             return "Sorry, the AI could not process your message due to a technical error. Please try again later."
 
 # Instantiate singleton
@@ -0,0 +1,214 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Callable, Dict, Optional, Tuple
+
+import redis
+from sqlalchemy import text
+
+from app.config import settings
+from app.database import engine
+
+# Queues consumed by the Celery worker; depth is reported by the worker health server.
+WORKER_QUEUES = ["ai_processing", "stripe_events", "maintenance"]
+
+
+def _pool_stats() -> dict:
+    pool = engine.pool
+    stats = {}
+    for name in ("size", "checkedin", "checkedout", "overflow"):
+        getter = getattr(pool, name, None)
+        if callable(getter):
+            stats[name] = getter()
+    max_overflow = getattr(pool, "_max_overflow", 0)
+    if "size" in stats and max_overflow >= 0:  # a negative max_overflow means unbounded
+        stats["capacity"] = stats["size"] + max_overflow
+    return stats
+
+
+def check_database() -> dict:
+    """
+    Fail fast if the pool has no free connection (a checkout would block for `pool_timeout`),
+    otherwise run a trivial query under a short statement timeout.
+    """
+    pool = _pool_stats()
+    if "capacity" in pool and pool["checkedout"] >= pool["capacity"]:
+        raise RuntimeError(f"connection pool exhausted ({pool['checkedout']}/{pool['capacity']} checked out)")
+    timeout_ms = int(settings.readiness_probe_timeout * 1000)
+    with engine.connect() as conn:
+        if engine.dialect.name == "postgresql":
+            conn.execute(text(f"SET LOCAL statement_timeout = {timeout_ms}"))
+        conn.execute(text("SELECT 1"))
+        conn.rollback()
+    return {"pool": pool}
+
+
+_redis_probe_client: Optional[redis.Redis] = None
+
+
+def check_redis() -> dict:
+    global _redis_probe_client
+    if _redis_probe_client is None:
+        # Dedicated client so the probe has its own tight timeouts and never waits behind app traffic
+        _redis_probe_client = redis.from_url(
+            settings.redis_url,
+            socket_timeout=settings.readiness_probe_timeout,
+            socket_connect_timeout=settings.readiness_probe_timeout,
+        )
+    _redis_probe_client.ping()
+    return {}
+
+
+def check_broker() -> dict:
+    from app.celery_app import celery_app
+    timeout = settings.readiness_probe_timeout
+    with celery_app.connection_for_write(
+        transport_options={"socket_timeout": timeout, "socket_connect_timeout": timeout}
+    ) as conn:
+        conn.ensure_connection(max_retries=1, interval_start=0, timeout=timeout)
+    return {}
+
+
+def queue_depths() -> dict:
+    """Messages waiting in each worker queue (Redis broker: one list per priority step)."""
+    from app.celery_app import celery_app
+    depths = {}
+    with celery_app.connection_for_read() as conn:
+        channel = conn.default_channel
+        client = getattr(channel, "client", None)
+        for queue in WORKER_QUEUES:
+            if client is not None and hasattr(channel, "_q_for_pri"):
+                keys = {channel._q_for_pri(queue, pri) for pri in channel.priority_steps}
+                pipe = client.pipeline()
+                for key in keys:
+                    pipe.llen(key)
+                depths[queue] = sum(pipe.execute())
+            else:
+                depths[queue] = channel.queue_declare(queue=queue, passive=True).message_count
+    return {"queues": depths}
+
+
+class WorkerHeartbeat:
+    """
+    Background thread in the Celery worker that rewrites `worker_heartbeat_file` every
+    `worker_heartbeat_interval` seconds. It keeps beating while a task runs (a
+    `--pool=solo` worker cannot answer a broadcast ping then), and the file is local
+    to the instance, so the worker's /ready only ever reports its own worker.
+    """
+
+    def __init__(self):
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.hostname: Optional[str] = None
+
+    def _write(self):
+        path = settings.worker_heartbeat_file
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"hostname": self.hostname, "pid": os.getpid(), "timestamp": time.time()}, f)
+        os.replace(tmp_path, path)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self._write()
+            except OSError:
+                pass  # reported as a stale heartbeat by check_workers
+            self._stop.wait(settings.worker_heartbeat_interval)
+
+    def start(self, hostname: str):
+        if self._thread is not None:
+            return
+        self.hostname = hostname
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="worker-heartbeat", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout=settings.worker_heartbeat_interval)
+        self._thread = None
+        try:
+            os.remove(settings.worker_heartbeat_file)
+        except FileNotFoundError:
+            pass
+
+
+worker_heartbeat = WorkerHeartbeat()
+
+
+def check_workers() -> dict:
+    try:
+        with open(settings.worker_heartbeat_file) as f:
+            heartbeat = json.load(f)
+    except FileNotFoundError:
+        raise RuntimeError("worker has not started")
+    except ValueError:
+        raise RuntimeError("unreadable worker heartbeat")
+    age = time.time() - heartbeat["timestamp"]
+    if age > settings.worker_heartbeat_max_age:
+        raise RuntimeError(f"worker heartbeat is {age:.1f}s old")
+    return {"worker": heartbeat["hostname"], "heartbeat_age_seconds": round(age, 2)}
+
+
+class ReadinessChecker:
+    """
+    Run a set of dependency probes concurrently, each bounded by a timeout,
+    and cache the combined result for a few seconds so that frequent
+    load-balancer polling does not itself load the dependencies.
+    """
+
+    def __init__(self, checks: Dict[str, Callable[[], dict]]):
+        self.checks = checks
+        self._executor = ThreadPoolExecutor(max_workers=len(checks), thread_name_prefix="readiness")
+        self._lock = threading.Lock()
+        self._result: Optional[dict] = None
+        self._checked_at = 0.0
+
+    @staticmethod
+    def _timed(fn: Callable[[], dict]) -> Tuple[float, dict]:
+        start = time.perf_counter()
+        details = fn()
+        return round((time.perf_counter() - start) * 1000, 2), details
+
+    def _probe(self) -> dict:
+        timeout = settings.readiness_probe_timeout
+        start = time.perf_counter()
+        futures = {name: self._executor.submit(self._timed, fn) for name, fn in self.checks.items()}
+        results = {}
+        for name, future in futures.items():
+            try:
+                latency_ms, details = future.result(timeout=max(start + timeout - time.perf_counter(), 0))
+                results[name] = {"ok": True, "latency_ms": latency_ms, **details}
+            except FutureTimeout:
+                results[name] = {"ok": False, "latency_ms": None, "error": f"timed out after {timeout}s"}
+            except Exception as e:
+                results[name] = {"ok": False, "latency_ms": None, "error": str(e)}
+        ready = all(r["ok"] for r in results.values())
+        return {"status": "ready" if ready else "unready", "checks": results}
+
+    def check(self) -> dict:
+        with self._lock:
+            age = time.monotonic() - self._checked_at
+            if self._result is None or age >= settings.readiness_cache_seconds:
+                self._result = self._probe()
+                self._checked_at = time.monotonic()
+                age = 0.0
+            return {**self._result, "age_seconds": round(age, 2)}
+
+
+api_readiness = ReadinessChecker({
+    "database": check_database,
+    "redis": check_redis,
+    "broker": check_broker,
+})
+
+worker_readiness = ReadinessChecker({
+    "broker": check_broker,
+    "queues": queue_depths,
+    "workers": check_workers,
+})
@@ -0,0 +1,84 @@
+import asyncio
+import hashlib
+import logging
+import time
+from typing import Optional
+from fastapi import HTTPException, status
+from app.config import settings
+from app.redis_client import redis_client
+from app.responses import RawJSONResponse
+from app.serializers import codec
+
+logger = logging.getLogger(__name__)
+
+# How long a concurrent retry waits for the first request to finish
+IDEMPOTENCY_WAIT = 5.0
+REPLAY_HEADER = "Idempotent-Replayed"
+
+
+def idempotency_key(scope: str, user_id, key: str) -> str:
+    return f"idempotency:{scope}:{user_id}:{key}"
+
+
+def request_fingerprint(*parts) -> str:
+    """Hash of the request's identifying parts; a key reused with a different request is rejected."""
+    return hashlib.sha256("\x1f".join(str(part) for part in parts).encode("utf-8")).hexdigest()
+
+
+def _replay(record: dict, fingerprint: str) -> Optional[RawJSONResponse]:
+    if record.get("fingerprint") != fingerprint:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Idempotency-Key was already used for a different request"
+        )
+    if record.get("state") != "done":
+        return None
+    return RawJSONResponse(record["body"].encode("utf-8"), headers={REPLAY_HEADER: "true"})
+
+
+async def begin_idempotent_request(scope: str, user_id, key: str, fingerprint: str) -> Optional[RawJSONResponse]:
+    """
+    Reserve `key` for this request, or return the stored response of the request
+    that already used it. Returns None when the caller should process the request
+    (and then call `complete_idempotent_request` or `release_idempotent_request`).
+
+    A retry arriving while the first attempt is still running waits briefly for
+    its result, then gets 409.
+    """
+    cache_key = idempotency_key(scope, user_id, key)
+    pending = codec.encode({"state": "pending", "fingerprint": fingerprint})
+    try:
+        reserved = redis_client.binary_client.set(cache_key, pending, nx=True, ex=settings.idempotency_lock_ttl)
+    except Exception as e:
+        # Redis unavailable: process without deduplication rather than failing the request
+        logger.warning("Idempotency store unavailable, processing %s without it: %s", scope, e)
+        return None
+    if reserved:
+        return None
+
+    deadline = time.monotonic() + IDEMPOTENCY_WAIT
+    while True:
+        record = await redis_client.get_json(cache_key)
+        if record is None:
+            # The first attempt failed and released the key: take it over
+            return await begin_idempotent_request(scope, user_id, key, fingerprint)
+        replay = _replay(record, fingerprint)
+        if replay is not None:
+            return replay
+        if time.monotonic() >= deadline:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="A request with this Idempotency-Key is still being processed, please retry"
+            )
+        await asyncio.sleep(0.1)
+
+
+async def complete_idempotent_request(scope: str, user_id, key: str, fingerprint: str, body: bytes):
+    """Store the response so replays within IDEMPOTENCY_TTL return it unchanged."""
+    record = {"state": "done", "fingerprint": fingerprint, "body": body.decode("utf-8")}
+    await redis_client.set_json(idempotency_key(scope, user_id, key), record, expire=settings.idempotency_ttl)
+
+
+async def release_idempotent_request(scope: str, user_id, key: str):
+    """The request failed: let a retry with the same key run again."""
+    await redis_client.delete(idempotency_key(scope, user_id, key))
@@ -1,16 +1,20 @@
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.concurrency import run_in_threadpool
 from contextlib import asynccontextmanager
 import logging
 from datetime import datetime
 from app.config import settings
 from app.database import engine, Base
-from app.routers import auth, user, chatroom, subscription
+from app.partitions import ensure_partitions
+from app.routers import auth, user, chatroom, subscription, admin
+from app.tracing import tracer
+from app.logging_config import configure_logging
+from app.health import api_readiness
+from app.responses import FastJSONResponse
 
-# ==== Enhanced Logging Setup ====
-LOG_FORMAT = "%(asctime)s [%(levelname)s] %(name)s:%(lineno)d - %(message)s"
-logging.basicConfig(level=logging.INFO, format=LOG_FORMAT)
+# ==== Logging Setup (queue-based, see app/logging_config.py) ====
+configure_logging()
 logger = logging.getLogger("gemini-backend")  # Use a custom app logger name
 
 @asynccontextmanager
@@ -23,6 +27,15 @@ async def lifespan(app: FastAPI):
     except Exception as e:
         logger.error(f"Error creating DB tables: {e}")
         raise
+    if engine.dialect.name == "postgresql":
+        try:
+            with engine.begin() as conn:
+                created = ensure_partitions(conn)
+            if created:
+                logger.info(f"Created message partitions: {', '.join(created)}")
+        except Exception as e:
+            # Not fatal: partitions are kept MESSAGES_PARTITION_MONTHS_AHEAD months ahead
+            logger.error(f"Error creating message partitions: {e}")
     yield
     # Shutdown
     logger.info("Shutting down Gemini Backend Clone")
@@ -31,6 +44,7 @@ app = FastAPI(
     title=settings.app_name,
     version=settings.app_version,
     description="A Gemini-style backend system with AI conversations and subscription management",
+    default_response_class=FastJSONResponse,
     lifespan=lifespan
 )
 
@@ -41,18 +55,39 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Trace-Id"],
 )
 
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    """Start (or continue, via `traceparent`) a trace for every request."""
+    if not tracer.enabled:
+        return await call_next(request)
+    with tracer.span(
+        f"HTTP {request.method}",
+        traceparent=request.headers.get("traceparent"),
+        method=request.method,
+        path=request.url.path
+    ) as span:
+        response = await call_next(request)
+        if span is not None:
+            route = request.scope.get("route")
+            if route is not None:
+                span.name = f"HTTP {request.method} {route.path}"
+            span.set_attribute("status_code", response.status_code)
+            response.headers["X-Trace-Id"] = span.trace_id
+        return response
+
 # Include routers
 app.include_router(auth.router)
 app.include_router(user.router)
 app.include_router(chatroom.router)
 app.include_router(subscription.router)
+app.include_router(admin.router)
 
 @app.get("/")
 async def root():
     """Root endpoint"""
-    logger.info("GET / (root)")
     return {
         "message": "Welcome to Gemini Backend Clone",
         "version": settings.app_version,
@@ -65,10 +100,19 @@ async def health_check():
     logger.debug("GET /health")
     return {"status": "healthy"}
 
+@app.get("/ready")
+async def readiness_check():
+    """Readiness endpoint: probes the DB pool, Redis and the Celery broker (cached for a few seconds)"""
+    result = await run_in_threadpool(api_readiness.check)
+    if result["status"] != "ready":
+        logger.warning("Readiness check failed: %s", result["checks"])
+        return FastJSONResponse(status_code=503, content=result)
+    return result
+
 @app.exception_handler(HTTPException)
 async def http_exception_handler(request: Request, exc: HTTPException):
     logger.warning(f"HTTPException {exc.status_code} @ {request.url}: {exc.detail}")
-    return JSONResponse(
+    return FastJSONResponse(
         status_code=exc.status_code,
         content={
             "detail": exc.detail,
@@ -80,7 +124,7 @@ async def http_exception_handler(request: Request, exc: HTTPException):
 @app.exception_handler(Exception)
 async def general_exception_handler(request: Request, exc: Exception):
     logger.error(f"Unhandled exception for {request.url} ({request.method}): {str(exc)}", exc_info=True)
-    return JSONResponse(
+    return FastJSONResponse(
         status_code=500,
         content={
             "detail": "Internal server error",
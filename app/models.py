@@ -1,7 +1,9 @@
-from sqlalchemy import Column, String, DateTime, Boolean, Integer, Text, ForeignKey, Enum, UUID
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, String, DateTime, Boolean, Integer, BigInteger, Text, ForeignKey, Enum, UUID, JSON, Index, DDL, UniqueConstraint, event
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.orm import relationship, deferred
 from sqlalchemy.sql import func
 from app.database import Base
+from app.compression import CompressedText
 import uuid
 import enum
 
@@ -26,6 +28,12 @@ class SubscriptionStatus(enum.Enum):
     CANCELLED = "cancelled"
     PAST_DUE = "past_due"
 
+class StripeEventStatus(enum.Enum):
+    PENDING = "pending"
+    PROCESSED = "processed"
+    IGNORED = "ignored"
+    FAILED = "failed"
+
 class User(Base):
     __tablename__ = "users"
     
@@ -37,12 +45,17 @@ class User(Base):
     last_login = Column(DateTime(timezone=True))
     is_active = Column(Boolean, default=True)
     password = Column(String(255), nullable=True)
+    deleted_at = Column(DateTime(timezone=True))  # soft delete; rows are purged by app.purge
     
-    # Relationships
-    chatrooms = relationship("Chatroom", back_populates="user", cascade="all, delete-orphan")
-    messages = relationship("Message", back_populates="user", cascade="all, delete-orphan")
-    subscriptions = relationship("Subscription", back_populates="user", cascade="all, delete-orphan")
-    usage_tracking = relationship("UsageTracking", back_populates="user", cascade="all, delete-orphan")
+    # Relationships (passive_deletes: the database cascades, the ORM never loads children to delete them)
+    chatrooms = relationship("Chatroom", back_populates="user", cascade="all, delete-orphan", passive_deletes=True)
+    messages = relationship("Message", back_populates="user", cascade="all, delete-orphan", passive_deletes=True)
+    subscriptions = relationship("Subscription", back_populates="user", cascade="all, delete-orphan", passive_deletes=True)
+    usage_tracking = relationship("UsageTracking", back_populates="user", cascade="all, delete-orphan", passive_deletes=True)
+    
+    __table_args__ = (
+        Index("ix_users_deleted_at", "deleted_at", postgresql_where=deleted_at.isnot(None)),
+    )
 
 class Chatroom(Base):
     __tablename__ = "chatrooms"
@@ -54,10 +67,15 @@ class Chatroom(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
     message_count = Column(Integer, default=0)
+    deleted_at = Column(DateTime(timezone=True))  # soft delete; messages are purged by app.purge
     
     # Relationships
     user = relationship("User", back_populates="chatrooms")
-    messages = relationship("Message", back_populates="chatroom", cascade="all, delete-orphan")
+    messages = relationship("Message", back_populates="chatroom", cascade="all, delete-orphan", passive_deletes=True)
+    
+    __table_args__ = (
+        Index("ix_chatrooms_deleted_at", "deleted_at", postgresql_where=deleted_at.isnot(None)),
+    )
 
 class Message(Base):
     __tablename__ = "messages"
@@ -65,16 +83,36 @@ class Message(Base):
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     chatroom_id = Column(UUID(as_uuid=True), ForeignKey("chatrooms.id", ondelete="CASCADE"), nullable=False)
     user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
-    content = Column(Text, nullable=False)
+    # Large bodies may be stored zstd-compressed, see app.compression
+    content = Column(CompressedText, nullable=False)
     message_type = Column(Enum(MessageType), nullable=False)
-    ai_response = Column(Text)
+    ai_response = Column(CompressedText)
     processing_status = Column(Enum(ProcessingStatus), default=ProcessingStatus.PENDING)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Partition key: part of the table's primary key, see app.partitions
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), primary_key=True)
     processing_time_ms = Column(Integer)
+    # Set by the application on user messages (content + AI response), see app.search
+    search_vector = deferred(Column(TSVECTOR))
     
     # Relationships
     chatroom = relationship("Chatroom", back_populates="messages")
     user = relationship("User", back_populates="messages")
+    
+    __table_args__ = (
+        Index("ix_messages_type_created_at", "message_type", "created_at"),
+        Index("ix_messages_user_search", "user_id", "search_vector", postgresql_using="gin"),
+        Index("ix_messages_chatroom_created_at", "chatroom_id", "created_at"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
+    # Message ids are unique on their own; the ORM identifies rows by id alone
+    __mapper_args__ = {"primary_key": [id]}
+
+# The (user_id, search_vector) GIN index needs btree_gin for the uuid column
+event.listen(
+    Message.__table__,
+    "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS btree_gin").execute_if(dialect="postgresql")
+)
 
 class Subscription(Base):
     __tablename__ = "subscriptions"
@@ -104,6 +142,36 @@ class OTPVerification(Base):
     is_verified = Column(Boolean, default=False)
     attempt_count = Column(Integer, default=0)
 
+class StripeEvent(Base):
+    """Received Stripe webhook events: idempotency store and per-customer processing queue."""
+    __tablename__ = "stripe_events"
+    
+    id = Column(String(255), primary_key=True)  # Stripe event id (evt_...)
+    type = Column(String(255), nullable=False)
+    ordering_key = Column(String(255), nullable=False)  # Stripe customer id; events are applied in order per key
+    stripe_created = Column(BigInteger, nullable=False)
+    payload = Column(JSON, nullable=False)  # event.data.object
+    status = Column(Enum(StripeEventStatus), nullable=False, default=StripeEventStatus.PENDING)
+    attempts = Column(Integer, default=0)
+    last_error = Column(Text)
+    received_at = Column(DateTime(timezone=True), server_default=func.now())
+    processed_at = Column(DateTime(timezone=True))
+    
+    __table_args__ = (
+        Index("ix_stripe_events_ordering_status", "ordering_key", "status", "stripe_created"),
+    )
+
+class OTPAuditEvent(Base):
+    """Append-only log of OTP issues and verification attempts, flushed in batches from Redis."""
+    __tablename__ = "otp_audit_events"
+    
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    mobile_number = Column(String(15), nullable=False, index=True)
+    event = Column(String(16), nullable=False)
+    outcome = Column(String(16), nullable=False)
+    attempt_count = Column(Integer, default=0)
+    created_at = Column(DateTime(timezone=True), nullable=False)
+
 class UsageTracking(Base):
     __tablename__ = "usage_tracking"
     
@@ -115,4 +183,68 @@ class UsageTracking(Base):
     last_updated = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
     
     # Relationships
-    user = relationship("User", back_populates="usage_tracking")
\ No newline at end of file
+    user = relationship("User", back_populates="usage_tracking")
+    
+    __table_args__ = (
+        UniqueConstraint("user_id", "date", name="uq_usage_tracking_user_date"),
+        Index("ix_usage_tracking_last_updated", "last_updated"),
+    )
+
+class UsageRollup(Base):
+    """Per-user usage folded into weekly/monthly buckets by app.rollups."""
+    __tablename__ = "usage_rollups"
+    
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    period = Column(String(8), primary_key=True)  # "week" or "month"
+    period_start = Column(DateTime(timezone=True), primary_key=True)
+    message_count = Column(Integer, nullable=False, default=0)
+    api_calls = Column(Integer, nullable=False, default=0)
+    ai_messages = Column(Integer, nullable=False, default=0)
+    total_processing_time_ms = Column(BigInteger, nullable=False, default=0)
+    max_processing_time_ms = Column(Integer)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class TierUsageRollup(Base):
+    """Per-tier totals for each weekly/monthly bucket, derived from usage_rollups."""
+    __tablename__ = "tier_usage_rollups"
+    
+    tier = Column(Enum(SubscriptionTier), primary_key=True)
+    period = Column(String(8), primary_key=True)
+    period_start = Column(DateTime(timezone=True), primary_key=True)
+    active_users = Column(Integer, nullable=False, default=0)
+    message_count = Column(BigInteger, nullable=False, default=0)
+    api_calls = Column(BigInteger, nullable=False, default=0)
+    ai_messages = Column(BigInteger, nullable=False, default=0)
+    total_processing_time_ms = Column(BigInteger, nullable=False, default=0)
+    max_processing_time_ms = Column(Integer)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class RollupWatermark(Base):
+    """High-water mark of source rows already folded into the rollup tables."""
+    __tablename__ = "rollup_watermarks"
+    
+    name = Column(String(64), primary_key=True)
+    watermark = Column(DateTime(timezone=True), nullable=False)
+
+class MessageArchiveSegment(Base):
+    """
+    Location of one chatroom's messages inside an archived month: a single zstd
+    frame of NDJSON at [offset, offset + length) in `path`. See app.partitions.
+    """
+    __tablename__ = "message_archive_segments"
+    
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    partition_name = Column(String(64), nullable=False, index=True)
+    chatroom_id = Column(UUID(as_uuid=True), ForeignKey("chatrooms.id", ondelete="CASCADE"), nullable=False)
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    path = Column(String(1024), nullable=False)
+    offset = Column(BigInteger, nullable=False)
+    length = Column(BigInteger, nullable=False)
+    message_count = Column(Integer, nullable=False)
+    first_created_at = Column(DateTime(timezone=True), nullable=False)
+    last_created_at = Column(DateTime(timezone=True), nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    __table_args__ = (
+        Index("ix_message_archive_segments_chatroom", "chatroom_id", "last_created_at"),
+    )
@@ -0,0 +1,109 @@
+import json
+import logging
+from datetime import datetime
+from typing import Tuple
+from fastapi import HTTPException, status
+from app.config import settings
+from app.redis_client import redis_client
+from app.security import generate_otp
+
+logger = logging.getLogger(__name__)
+
+OTP_AUDIT_KEY = "otp:audit"
+
+# KEYS: otp key, audit list; ARGV: code, ttl, audit record, max audit backlog
+ISSUE_SCRIPT = """
+redis.call('DEL', KEYS[1])
+redis.call('HSET', KEYS[1], 'code', ARGV[1], 'attempts', 0)
+redis.call('EXPIRE', KEYS[1], tonumber(ARGV[2]))
+redis.call('RPUSH', KEYS[2], ARGV[3])
+redis.call('LTRIM', KEYS[2], -tonumber(ARGV[4]), -1)
+return 1
+"""
+
+# Compare-and-consume in one step: a correct code deletes the OTP, a wrong one
+# increments the attempt counter, and the last allowed wrong attempt burns the OTP.
+# KEYS: otp key, audit list; ARGV: submitted code, max attempts, mobile number, timestamp, max audit backlog
+VERIFY_SCRIPT = """
+local code = redis.call('HGET', KEYS[1], 'code')
+local outcome = 'missing'
+local attempts = 0
+if code then
+    attempts = redis.call('HINCRBY', KEYS[1], 'attempts', 1)
+    if code == ARGV[1] then
+        outcome = 'verified'
+        redis.call('DEL', KEYS[1])
+    elseif attempts >= tonumber(ARGV[2]) then
+        outcome = 'locked'
+        redis.call('DEL', KEYS[1])
+    else
+        outcome = 'invalid'
+    end
+end
+redis.call('RPUSH', KEYS[2], cjson.encode({
+    mobile_number = ARGV[3], event = 'verify', outcome = outcome, attempt_count = attempts, created_at = ARGV[4]
+}))
+redis.call('LTRIM', KEYS[2], -tonumber(ARGV[5]), -1)
+return {outcome, attempts}
+"""
+
+
+class OTPStore:
+    """
+    OTP issue/verify backed only by Redis. Every issue and verification appends
+    an audit record to a Redis list, which `app.tasks.flush_otp_audit` drains
+    into Postgres in batches.
+    """
+
+    def __init__(self):
+        self._issue = redis_client.client.register_script(ISSUE_SCRIPT)
+        self._verify = redis_client.client.register_script(VERIFY_SCRIPT)
+
+    @staticmethod
+    def _key(mobile_number: str) -> str:
+        return f"otp:{mobile_number}"
+
+    async def issue(self, mobile_number: str) -> str:
+        otp_code = generate_otp()
+        record = json.dumps({
+            "mobile_number": mobile_number,
+            "event": "issue",
+            "outcome": "issued",
+            "attempt_count": 0,
+            "created_at": datetime.utcnow().isoformat()
+        })
+        try:
+            self._issue(
+                keys=[self._key(mobile_number), OTP_AUDIT_KEY],
+                args=[otp_code, settings.otp_ttl_seconds, record, settings.otp_audit_max_backlog]
+            )
+        except Exception as e:
+            logger.error(f"Could not store OTP for {mobile_number}: {e}")
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="OTP service temporarily unavailable"
+            )
+        return otp_code
+
+    async def verify(self, mobile_number: str, otp_code: str) -> Tuple[str, int]:
+        """Returns (outcome, attempts) where outcome is verified, invalid, locked or missing."""
+        try:
+            outcome, attempts = self._verify(
+                keys=[self._key(mobile_number), OTP_AUDIT_KEY],
+                args=[
+                    otp_code, settings.otp_max_attempts, mobile_number,
+                    datetime.utcnow().isoformat(), settings.otp_audit_max_backlog
+                ]
+            )
+        except Exception as e:
+            logger.error(f"Could not verify OTP for {mobile_number}: {e}")
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="OTP service temporarily unavailable"
+            )
+        if isinstance(outcome, bytes):
+            outcome = outcome.decode()
+        return outcome, int(attempts)
+
+
+otp_store = OTPStore()
@@ -0,0 +1,337 @@
+"""
+Monthly range partitions of `messages` and their cold archive.
+
+`messages` is partitioned by `created_at` (RANGE), one partition per calendar
+month named `messages_yYYYYmMM`. `maintain_partitions` (daily Celery beat job)
+creates partitions `messages_partition_months_ahead` months ahead of time and
+archives partitions older than `messages_archive_after_days`:
+
+1. the partition is detached from `messages` with DETACH PARTITION CONCURRENTLY,
+   so it drops out of every query without blocking reads or writes;
+2. its rows are written, ordered by chatroom, to `<archive_dir>/<partition>.ndjson.zst`,
+   one zstd frame per chatroom, each frame recorded in `message_archive_segments`
+   (file, byte offset, length, time range);
+3. the segment rows are inserted and the detached table is dropped in one transaction.
+
+Archived history is only read when explicitly requested (`read_archived_messages`,
+and the data export), by seeking straight to the chatroom's frames.
+
+Rows of chatrooms or users deleted before their month is archived are not
+written (they are dropped with the detached table). Purging a chatroom or user
+afterwards overwrites its frames in place with zstd skippable frames of zeros
+(`purge_archived_messages`), so the content is gone from disk while the other
+frames' offsets, and the file's validity as a zstd stream, are unchanged.
+"""
+import io
+import logging
+import os
+import re
+import struct
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional
+from dateutil.relativedelta import relativedelta
+from sqlalchemy import Column, MetaData, Table, delete, exists, insert, select, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+import orjson
+import pytz
+import zstandard
+from app.config import settings
+from app.models import Chatroom, Message, MessageArchiveSegment, User
+from app.responses import dumps
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PARTITION = "messages_default"
+_PARTITION_RE = re.compile(r"^messages_y(\d{4})m(\d{2})$")
+ARCHIVE_BATCH_SIZE = 5000
+# zstd skippable frame magic number; decoders skip these frames' payloads
+SKIPPABLE_FRAME_MAGIC = 0x184D2A50
+# Columns kept in the archive (search_vector is derived and not archived)
+ARCHIVED_COLUMNS = (
+    "id", "chatroom_id", "user_id", "message_type", "content", "ai_response",
+    "processing_status", "processing_time_ms", "created_at"
+)
+
+
+def month_start(value: datetime) -> datetime:
+    if value.tzinfo is not None:
+        value = value.astimezone(pytz.UTC)
+    return datetime(value.year, value.month, 1, tzinfo=pytz.UTC)
+
+
+def partition_name(month: datetime) -> str:
+    return f"messages_y{month.year:04d}m{month.month:02d}"
+
+
+def partition_month(name: str) -> Optional[datetime]:
+    match = _PARTITION_RE.match(name)
+    if not match:
+        return None
+    return datetime(int(match.group(1)), int(match.group(2)), 1, tzinfo=pytz.UTC)
+
+
+def create_month_partition(conn: Connection, month: datetime) -> bool:
+    """
+    Create the partition for `month` if it does not exist. On databases that
+    still have a default partition (before migration 0005), rows for that month
+    that already landed in it are moved into the new partition first, otherwise
+    Postgres would refuse the new partition bound.
+    """
+    name = partition_name(month)
+    if conn.execute(text("SELECT to_regclass(:name)"), {"name": name}).scalar():
+        return False
+    start, end = month, month + relativedelta(months=1)
+    bounds = f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+    params = {"start": start, "end": end}
+    has_default = conn.execute(text("SELECT to_regclass(:name)"), {"name": DEFAULT_PARTITION}).scalar()
+    stray_rows = has_default and conn.execute(text(
+        f"SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} WHERE created_at >= :start AND created_at < :end)"
+    ), params).scalar()
+    if stray_rows:
+        conn.execute(text(f"CREATE TABLE {name} (LIKE messages INCLUDING DEFAULTS)"))
+        conn.execute(text(
+            f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE created_at >= :start AND created_at < :end "
+            f"RETURNING *) INSERT INTO {name} SELECT * FROM moved"
+        ), params)
+        conn.execute(text(f"ALTER TABLE messages ATTACH PARTITION {name} {bounds}"))
+    else:
+        conn.execute(text(f"CREATE TABLE {name} PARTITION OF messages {bounds}"))
+    logger.info("Created message partition %s", name)
+    return True
+
+
+def ensure_partitions(conn: Connection, now: datetime = None, months_ahead: int = None) -> List[str]:
+    """Make sure the current month and the next `months_ahead` months have partitions."""
+    current = month_start(now or datetime.utcnow().replace(tzinfo=pytz.UTC))
+    months_ahead = settings.messages_partition_months_ahead if months_ahead is None else months_ahead
+    created = []
+    for i in range(months_ahead + 1):
+        month = current + relativedelta(months=i)
+        if create_month_partition(conn, month):
+            created.append(partition_name(month))
+    return created
+
+
+ATTACHED = "attached"
+DETACH_PENDING = "detach_pending"  # an interrupted DETACH ... CONCURRENTLY
+DETACHED = "detached"
+
+
+def list_partitions(conn: Connection) -> Dict[str, str]:
+    """Monthly message partition tables -> ATTACHED, DETACH_PENDING or DETACHED."""
+    rows = conn.execute(text(
+        """
+        SELECT c.relname,
+               CASE WHEN i.inhparent IS NULL THEN 'detached'
+                    WHEN i.inhdetachpending THEN 'detach_pending'
+                    ELSE 'attached' END
+        FROM pg_class c
+        LEFT JOIN pg_inherits i ON i.inhrelid = c.oid
+        WHERE c.relkind = 'r' AND c.relname ~ '^messages_y[0-9]{4}m[0-9]{2}$'
+          AND pg_table_is_visible(c.oid)
+        """
+    ))
+    return {name: state for name, state in rows}
+
+
+def detach_partition(engine: Engine, name: str, state: str = ATTACHED):
+    """
+    Detach a monthly partition without blocking queries on `messages`.
+
+    DETACH ... CONCURRENTLY only takes SHARE UPDATE EXCLUSIVE on the parent and
+    must run outside a transaction block. If a previous run was interrupted
+    between its two internal transactions, the partition is left "detach
+    pending" and is completed with FINALIZE. Postgres does not allow the
+    concurrent form while a DEFAULT partition exists (databases before
+    migration 0005): then a plain DETACH is tried with a short lock_timeout, so
+    it gives up instead of queueing every other query behind it.
+    """
+    if state == DETACHED:
+        return
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        if state == DETACH_PENDING:
+            conn.execute(text(f"ALTER TABLE messages DETACH PARTITION {name} FINALIZE"))
+            return
+        has_default = conn.execute(text("SELECT to_regclass(:name)"), {"name": DEFAULT_PARTITION}).scalar()
+        if not has_default:
+            conn.execute(text(f"ALTER TABLE messages DETACH PARTITION {name} CONCURRENTLY"))
+            return
+        conn.execute(text("SET lock_timeout = '5s'"))
+        try:
+            conn.execute(text(f"ALTER TABLE messages DETACH PARTITION {name}"))
+        finally:
+            conn.execute(text("RESET lock_timeout"))
+
+
+def archive_path(name: str) -> str:
+    return os.path.join(settings.archive_dir, f"{name}.ndjson.zst")
+
+
+def _write_archive(engine: Engine, name: str) -> List[dict]:
+    """Stream a detached partition into a zstd file, one frame per chatroom; return segment rows."""
+    columns = Message.__table__.c
+    # Same column types as `messages` (enums decode to their values), bound to the detached table
+    table = Table(name, MetaData(), *(Column(column, columns[column].type) for column in ARCHIVED_COLUMNS))
+    # Rows of deleted chatrooms/users are left out: their purge no longer sees this table
+    query = select(*table.c).where(
+        exists().where(Chatroom.id == table.c.chatroom_id, Chatroom.deleted_at.is_(None)),
+        exists().where(User.id == table.c.user_id, User.deleted_at.is_(None))
+    ).order_by(
+        table.c.chatroom_id, table.c.created_at, table.c.id
+    )
+    os.makedirs(settings.archive_dir, exist_ok=True)
+    path = archive_path(name)
+    tmp_path = f"{path}.part"
+    compressor = zstandard.ZstdCompressor(level=settings.archive_zstd_level)
+    segments: List[dict] = []
+    current: Optional[dict] = None
+
+    with open(tmp_path, "wb") as f, engine.connect() as conn:
+        writer = compressor.stream_writer(f, closefd=False)
+
+        def close_segment():
+            writer.flush(zstandard.FLUSH_FRAME)
+            current["length"] = f.tell() - current["offset"]
+            segments.append(current)
+
+        rows = conn.execution_options(yield_per=ARCHIVE_BATCH_SIZE).execute(query)
+        for row in rows:
+            if current is None or row.chatroom_id != current["chatroom_id"]:
+                if current is not None:
+                    close_segment()
+                current = {
+                    "partition_name": name,
+                    "chatroom_id": row.chatroom_id,
+                    "user_id": row.user_id,
+                    "path": path,
+                    "offset": f.tell(),
+                    "message_count": 0,
+                    "first_created_at": row.created_at,
+                }
+            writer.write(dumps(row._asdict()) + b"\n")
+            current["message_count"] += 1
+            current["last_created_at"] = row.created_at
+        if current is not None:
+            close_segment()
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return segments
+
+
+def archive_partition(engine: Engine, name: str, state: str) -> dict:
+    """Detach (if needed), archive and drop one monthly partition. Safe to re-run after a failure."""
+    detach_partition(engine, name, state)
+    segments = _write_archive(engine, name)
+    with engine.begin() as conn:
+        conn.execute(delete(MessageArchiveSegment).where(MessageArchiveSegment.partition_name == name))
+        for i in range(0, len(segments), 1000):
+            conn.execute(insert(MessageArchiveSegment), segments[i:i + 1000])
+        conn.execute(text(f"DROP TABLE {name}"))
+    messages = sum(segment["message_count"] for segment in segments)
+    logger.info("Archived partition %s: %d messages in %d chatroom segments", name, messages, len(segments))
+    return {"partition": name, "messages": messages, "segments": len(segments)}
+
+
+def maintain_partitions(engine: Engine, now: datetime = None) -> dict:
+    """Create upcoming partitions and archive the ones older than `messages_archive_after_days`."""
+    now = now or datetime.utcnow().replace(tzinfo=pytz.UTC)
+    with engine.begin() as conn:
+        created = ensure_partitions(conn, now)
+        partitions = list_partitions(conn)
+    cutoff = month_start(now - relativedelta(days=settings.messages_archive_after_days))
+    archived = []
+    for name, state in sorted(partitions.items()):
+        month = partition_month(name)
+        # Only whole months that ended before the cutoff month
+        if month is not None and month + relativedelta(months=1) <= cutoff:
+            archived.append(archive_partition(engine, name, state))
+    return {"created": created, "archived": archived}
+
+
+def _parse_timestamp(value: str) -> datetime:
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=pytz.UTC)
+
+
+def read_segment(segment: MessageArchiveSegment) -> List[dict]:
+    """All records of one segment, oldest first."""
+    with open(segment.path, "rb") as f:
+        f.seek(segment.offset)
+        frame = f.read(segment.length)
+    reader = zstandard.ZstdDecompressor().stream_reader(io.BytesIO(frame))
+    return [orjson.loads(line) for line in io.BufferedReader(reader) if line.strip()]
+
+
+def _record_key(record: dict):
+    return _parse_timestamp(record["created_at"]), uuid.UUID(record["id"])
+
+
+def read_archived_messages(
+    db: Session,
+    chatroom_id,
+    before: Optional[datetime],
+    limit: int,
+    before_id=None
+) -> List[dict]:
+    """
+    Newest-first archived messages of a chatroom older than `before` (or, with
+    `before_id`, than the keyset position (before, before_id)), reading only the
+    frames that can contain them.
+    """
+    query = db.query(MessageArchiveSegment).filter(MessageArchiveSegment.chatroom_id == chatroom_id)
+    if before is not None:
+        before = before if before.tzinfo else before.replace(tzinfo=pytz.UTC)
+        if before_id is not None:
+            before_id = uuid.UUID(str(before_id))
+            query = query.filter(MessageArchiveSegment.first_created_at <= before)
+        else:
+            query = query.filter(MessageArchiveSegment.first_created_at < before)
+    results: List[dict] = []
+    for segment in query.order_by(MessageArchiveSegment.last_created_at.desc()):
+        # Frames are written in created_at order; sort on the full key for ties
+        for record in sorted(read_segment(segment), key=_record_key, reverse=True):
+            if before is not None:
+                created_at, record_id = _record_key(record)
+                if before_id is not None and (created_at, record_id) >= (before, before_id):
+                    continue
+                if before_id is None and created_at >= before:
+                    continue
+            record["archived"] = True
+            results.append(record)
+            if len(results) >= limit:
+                return results
+    return results
+
+
+def purge_archived_messages(db: Session, condition) -> int:
+    """
+    Erase the archived frames of the segments matching `condition` (overwritten
+    with skippable frames, then fsynced) and delete their segment rows. Safe to
+    re-run; returns the number of archived messages erased.
+    """
+    segments = db.query(MessageArchiveSegment).filter(condition).order_by(
+        MessageArchiveSegment.path, MessageArchiveSegment.offset
+    ).all()
+    erased = 0
+    for path in sorted({segment.path for segment in segments}):
+        if not os.path.exists(path):
+            logger.warning("Archive file %s is missing; dropping its segment rows", path)
+            continue
+        with open(path, "r+b") as f:
+            for segment in segments:
+                if segment.path != path or segment.length < 8:
+                    continue
+                f.seek(segment.offset)
+                f.write(struct.pack("<II", SKIPPABLE_FRAME_MAGIC, segment.length - 8) + bytes(segment.length - 8))
+                erased += segment.message_count
+            f.flush()
+            os.fsync(f.fileno())
+    if segments:
+        db.execute(delete(MessageArchiveSegment).where(
+            MessageArchiveSegment.id.in_([segment.id for segment in segments])
+        ).execution_options(synchronize_session=False))
+        db.commit()
+    return erased
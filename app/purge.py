@@ -0,0 +1,86 @@
+"""
+Background purge of soft-deleted chatrooms and users.
+
+The delete endpoints only set `deleted_at` (and hide the rows from every
+query); the rows are removed here with set-based DELETEs of at most
+`purge_batch_size` messages per transaction. Each batch locks only the rows
+it deletes, and nothing is loaded into the ORM, so a room with tens of
+thousands of messages neither blocks other writers nor grows worker memory.
+Archived months are erased too: the chatroom's or user's frames in the archive
+files are overwritten before their segment rows go (app.partitions). A purged
+user's export files are deleted as well.
+"""
+import logging
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import delete, select
+from sqlalchemy.orm import Session
+import pytz
+from app.config import settings
+from app.export import delete_user_exports
+from app.models import User, Chatroom, Message, MessageArchiveSegment
+from app.partitions import purge_archived_messages
+
+logger = logging.getLogger(__name__)
+
+
+def _utcnow() -> datetime:
+    return datetime.utcnow().replace(tzinfo=pytz.UTC)
+
+
+def _delete_messages_in_batches(db: Session, condition) -> int:
+    total = 0
+    while True:
+        batch = select(Message.id).where(condition).limit(settings.purge_batch_size).scalar_subquery()
+        result = db.execute(delete(Message).where(Message.id.in_(batch)).execution_options(synchronize_session=False))
+        db.commit()
+        total += result.rowcount
+        if result.rowcount < settings.purge_batch_size:
+            return total
+        if settings.purge_batch_pause:
+            time.sleep(settings.purge_batch_pause)
+
+
+def purge_chatroom(db: Session, chatroom_id) -> dict:
+    """Delete a soft-deleted chatroom's messages in batches, then the chatroom row."""
+    chatroom = db.execute(
+        select(Chatroom.id, Chatroom.deleted_at).where(Chatroom.id == chatroom_id)
+    ).first()
+    if chatroom is None or chatroom.deleted_at is None:
+        return {"messages": 0, "chatrooms": 0}
+    messages = _delete_messages_in_batches(db, Message.chatroom_id == chatroom_id)
+    messages += purge_archived_messages(db, MessageArchiveSegment.chatroom_id == chatroom_id)
+    db.execute(delete(Chatroom).where(Chatroom.id == chatroom_id).execution_options(synchronize_session=False))
+    db.commit()
+    return {"messages": messages, "chatrooms": 1}
+
+
+def purge_user(db: Session, user_id) -> dict:
+    """
+    Delete a soft-deleted user's messages in batches, then the user row; the
+    remaining small child tables (chatrooms, subscriptions, usage) go with it
+    through ON DELETE CASCADE.
+    """
+    user = db.execute(select(User.id, User.deleted_at).where(User.id == user_id)).first()
+    if user is None:
+        # Already purged; a retry still removes export files left by a failed run
+        return {"messages": 0, "users": 0, "exports": delete_user_exports(user_id)}
+    if user.deleted_at is None:
+        return {"messages": 0, "users": 0, "exports": 0}
+    messages = _delete_messages_in_batches(db, Message.user_id == user_id)
+    messages += purge_archived_messages(db, MessageArchiveSegment.user_id == user_id)
+    db.execute(delete(User).where(User.id == user_id).execution_options(synchronize_session=False))
+    db.commit()
+    return {"messages": messages, "users": 1, "exports": delete_user_exports(user_id)}
+
+
+def pending_purges(db: Session, limit: int = 100):
+    """Soft-deleted rows older than the grace period whose purge task never ran or failed."""
+    cutoff = _utcnow() - timedelta(seconds=settings.purge_sweep_delay)
+    chatroom_ids = db.execute(
+        select(Chatroom.id).where(Chatroom.deleted_at.isnot(None), Chatroom.deleted_at < cutoff).limit(limit)
+    ).scalars().all()
+    user_ids = db.execute(
+        select(User.id).where(User.deleted_at.isnot(None), User.deleted_at < cutoff).limit(limit)
+    ).scalars().all()
+    return chatroom_ids, user_ids
@@ -1,23 +1,43 @@
+import uuid
 from datetime import datetime
+from typing import Tuple
 from fastapi import HTTPException, status
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from app.redis_client import redis_client
-from app.models import User, SubscriptionTier, UsageTracking
+from app.models import User, UsageTracking
 from app.config import settings
+from app.entitlements import get_entitlement
 
 class RateLimiter:
 
+    @staticmethod
+    def _locked_usage_row(user: User, db, today) -> UsageTracking:
+        """
+        Today's usage row, created if missing and locked FOR UPDATE. The insert relies on
+        the unique (user_id, date) constraint, so concurrent first requests of the day
+        end up waiting on the same row instead of each inserting their own.
+        """
+        db.execute(
+            pg_insert(UsageTracking)
+            .values(id=uuid.uuid4(), user_id=user.id, date=today, message_count=0, api_calls=0)
+            .on_conflict_do_nothing(index_elements=[UsageTracking.user_id, UsageTracking.date])
+        )
+        return db.query(UsageTracking).filter(
+            UsageTracking.user_id == user.id,
+            UsageTracking.date == today
+        ).with_for_update().populate_existing().one()
+
     @staticmethod
     async def check_daily_limit(user: User, db) -> bool:
         """
         Check if the user has exceeded their daily persistent message limit.
-        For Pro users, always returns True (unlimited); for Basic, enforces UsageTracking.
+        Unlimited plans always pass; otherwise enforces UsageTracking against the plan's limit.
         """
         if not user:
             return False
-        # Get current subscription
-        current_sub = max(user.subscriptions, key=lambda x: x.created_at) if user.subscriptions else None
-        if current_sub and current_sub.plan_type == SubscriptionTier.PRO:
-            return True  # Pro users unlimited
+        entitlement = await get_entitlement(user, db)
+        if entitlement.daily_limit is None:
+            return True
 
         today = datetime.utcnow().date()
         usage = db.query(UsageTracking).filter(
@@ -25,38 +45,53 @@ class RateLimiter:
             UsageTracking.date == today
         ).first()
         count = usage.message_count if usage else 0
-        return count < settings.basic_daily_limit
+        return count < entitlement.daily_limit
 
     @staticmethod
-    async def increment_usage(user: User, db) -> int:
+    async def increment_usage(user: User, db, amount: int = 1) -> int:
         """
-        Increment user's persistent daily usage (UsageTracking table),
+        Increment user's persistent daily usage (UsageTracking table) by `amount`,
         and mirror to Redis (optional, for quick cache/statistics).
         """
         today = datetime.utcnow().date()
-        usage = db.query(UsageTracking).filter(
-            UsageTracking.user_id == user.id,
-            UsageTracking.date == today
-        ).first()
-        if usage:
-            usage.message_count += 1
-            usage.api_calls += 1
-            usage.last_updated = datetime.utcnow()
-        else:
-            usage = UsageTracking(
-                user_id=user.id,
-                date=today,
-                message_count=1,
-                api_calls=1,
-                last_updated=datetime.utcnow()
-            )
-            db.add(usage)
+        usage = RateLimiter._locked_usage_row(user, db, today)
+        usage.message_count = (usage.message_count or 0) + amount
+        usage.api_calls = (usage.api_calls or 0) + amount
+        usage.last_updated = datetime.utcnow()
         db.commit()
-        # Mirror to Redis for fast access, not authoritative!
-        cache_key = f"rate_limit:user:{user.id}:date:{today}"
-        await redis_client.set(cache_key, str(usage.message_count), expire=86400)
+        await RateLimiter.mirror_usage(user, usage.message_count)
         return usage.message_count
 
+    @staticmethod
+    async def mirror_usage(user: User, message_count: int):
+        # Mirror to Redis for fast access, not authoritative!
+        cache_key = f"rate_limit:user:{user.id}:date:{datetime.utcnow().date()}"
+        await redis_client.set(cache_key, str(message_count), expire=86400)
+
+    @staticmethod
+    async def reserve_usage(user: User, db, requested: int) -> Tuple[int, int]:
+        """
+        Grant up to `requested` messages against today's limit in one step.
+        Returns (granted, today's count including them).
+
+        The usage row is created if needed and locked (SELECT ... FOR UPDATE); the increment is
+        left uncommitted, so it commits or rolls back together with the
+        caller's inserts; call `mirror_usage` after committing.
+        """
+        entitlement = await get_entitlement(user, db)
+        today = datetime.utcnow().date()
+        usage = RateLimiter._locked_usage_row(user, db, today)
+        used = usage.message_count or 0
+        if entitlement.daily_limit is None:
+            granted = requested
+        else:
+            granted = max(0, min(requested, entitlement.daily_limit - used))
+        usage.message_count = used + granted
+        usage.api_calls = (usage.api_calls or 0) + granted
+        usage.last_updated = datetime.utcnow()
+        db.flush()
+        return granted, usage.message_count
+
     @staticmethod
     async def get_current_usage(user: User, db) -> dict:
         """
@@ -64,17 +99,17 @@ class RateLimiter:
         """
         if not user:
             return {"messages_today": 0, "limit": settings.basic_daily_limit}
-        current_sub = max(user.subscriptions, key=lambda x: x.created_at) if user.subscriptions else None
+        entitlement = await get_entitlement(user, db)
         today = datetime.utcnow().date()
         usage = db.query(UsageTracking).filter(
             UsageTracking.user_id == user.id,
             UsageTracking.date == today
         ).first()
         count = usage.message_count if usage else 0
-        if current_sub and current_sub.plan_type == SubscriptionTier.PRO:
+        if entitlement.daily_limit is None:
             return {"messages_today": count, "limit": "unlimited"}
         else:
-            return {"messages_today": count, "limit": settings.basic_daily_limit}
+            return {"messages_today": count, "limit": entitlement.daily_limit}
 
     @staticmethod
     async def enforce_rate_limit(user: User, db):
@@ -0,0 +1,101 @@
+"""
+Stripe -> local subscription reconciliation.
+
+Repairs `subscriptions` rows that drifted because a webhook was missed or
+failed. Stripe subscriptions are streamed page by page and compared against
+local rows one chunk at a time, so memory stays bounded regardless of the
+number of customers; corrections are written with one bulk UPDATE per chunk.
+"""
+import logging
+import time
+from datetime import datetime
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+import pytz
+from app.entitlements import invalidate_entitlements_sync
+from app.models import Subscription, SubscriptionTier, SubscriptionStatus
+from app.stripe_events import STATUS_MAP, subscription_period
+
+logger = logging.getLogger(__name__)
+
+
+def _chunks(items: Iterable, size: int) -> Iterator[List]:
+    iterator = iter(items)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _same(local, remote) -> bool:
+    if isinstance(local, datetime) and isinstance(remote, datetime):
+        # Naive values from the driver are UTC
+        if local.tzinfo is None:
+            local = local.replace(tzinfo=pytz.UTC)
+        return local == remote
+    return local == remote
+
+
+def desired_state(remote: dict) -> Dict:
+    """Local column values implied by a Stripe subscription, or {} for an unknown status."""
+    status = STATUS_MAP.get(remote.get("status"))
+    if status is None:
+        return {}
+    plan_type = SubscriptionTier.PRO if status in (SubscriptionStatus.ACTIVE, SubscriptionStatus.PAST_DUE) \
+        else SubscriptionTier.BASIC
+    start, end = subscription_period(remote)
+    state = {"plan_type": plan_type, "status": status}
+    if start and end:
+        state["current_period_start"] = start
+        state["current_period_end"] = end
+    return state
+
+
+def reconcile_chunk(db: Session, remote_chunk: List[dict], summary: Dict[str, int]):
+    by_id = {remote["id"]: remote for remote in remote_chunk}
+    local_rows = db.query(
+        Subscription.id, Subscription.user_id, Subscription.stripe_subscription_id,
+        Subscription.plan_type, Subscription.status,
+        Subscription.current_period_start, Subscription.current_period_end
+    ).filter(Subscription.stripe_subscription_id.in_(list(by_id))).all()
+
+    updates, affected_users = [], []
+    for row in local_rows:
+        state = desired_state(by_id[row.stripe_subscription_id])
+        if not state:
+            summary["unknown_status"] += 1
+            continue
+        changes = {field: value for field, value in state.items() if not _same(getattr(row, field), value)}
+        if changes:
+            updates.append({"id": row.id, **changes})
+            affected_users.append(row.user_id)
+        else:
+            summary["in_sync"] += 1
+    summary["missing_locally"] += len(by_id) - len(local_rows)
+
+    if updates:
+        # ORM bulk UPDATE by primary key: one executemany per chunk
+        db.execute(update(Subscription), updates)
+        db.commit()
+        invalidate_entitlements_sync(affected_users)
+        summary["updated"] += len(updates)
+
+
+def reconcile_subscriptions(db: Session, remote_subscriptions: Iterable[dict], chunk_size: int = 500) -> Dict:
+    """
+    Diff every Stripe subscription against its local row and correct drift.
+
+    Only rows linked by `stripe_subscription_id` are considered; Stripe
+    subscriptions without a local row are counted in `missing_locally`.
+    """
+    started = time.monotonic()
+    summary = {"scanned": 0, "in_sync": 0, "updated": 0, "missing_locally": 0, "unknown_status": 0}
+    for chunk in _chunks(remote_subscriptions, chunk_size):
+        summary["scanned"] += len(chunk)
+        reconcile_chunk(db, chunk, summary)
+        db.expunge_all()
+    summary["duration_s"] = round(time.monotonic() - started, 2)
+    return summary
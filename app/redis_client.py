@@ -1,11 +1,22 @@
 import redis
-import json
-from typing import Any, Optional
+from typing import Any, List, Optional
 from app.config import settings
+from app.serializers import codec
+from app.tracing import tracer
+
+class TracedRedis(redis.Redis):
+    """Redis client that records a span around every command."""
+
+    def execute_command(self, *args, **options):
+        with tracer.span(f"redis.{args[0]}"):
+            return super().execute_command(*args, **options)
 
 class RedisClient:
     def __init__(self):
-        self.client = redis.from_url(settings.redis_url, decode_responses=True)
+        redis_cls = TracedRedis if tracer.enabled else redis.Redis
+        self.client = redis_cls.from_url(settings.redis_url, decode_responses=True)
+        # Separate client for pre-serialized payloads that must round-trip as raw bytes
+        self.binary_client = redis_cls.from_url(settings.redis_url)
     
     async def get(self, key: str) -> Optional[str]:
         try:
@@ -19,6 +30,24 @@ class RedisClient:
         except Exception:
             return False
     
+    async def get_bytes(self, key: str) -> Optional[bytes]:
+        try:
+            return self.binary_client.get(key)
+        except Exception:
+            return None
+
+    async def set_bytes(self, key: str, value: bytes, expire: Optional[int] = None) -> bool:
+        try:
+            return self.binary_client.set(key, value, ex=expire)
+        except Exception:
+            return False
+
+    async def mget(self, keys: List[str]) -> List[Optional[str]]:
+        try:
+            return self.client.mget(keys)
+        except Exception:
+            return [None] * len(keys)
+
     async def delete(self, key: str) -> bool:
         try:
             return bool(self.client.delete(key))
@@ -45,17 +74,13 @@ class RedisClient:
     
     async def get_json(self, key: str) -> Any:
         try:
-            value = await self.get(key)
-            if value:
-                return json.loads(value)
-            return None
+            return codec.decode(self.binary_client.get(key))
         except Exception:
             return None
     
     async def set_json(self, key: str, value: Any, expire: Optional[int] = None) -> bool:
         try:
-            json_str = json.dumps(value, default=str)
-            return await self.set(key, json_str, expire)
+            return bool(self.binary_client.set(key, codec.encode(value), ex=expire))
         except Exception:
             return False
 
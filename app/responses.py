@@ -0,0 +1,26 @@
+import orjson
+from typing import Any
+from fastapi.responses import ORJSONResponse, Response
+
+# UTC datetimes are rendered with a trailing "Z", matching Pydantic's own JSON output
+ORJSON_OPTIONS = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+
+
+def dumps(content: Any) -> bytes:
+    """Serialize plain dicts/lists (UUIDs, datetimes and enums included) straight to JSON bytes."""
+    return orjson.dumps(content, option=ORJSON_OPTIONS)
+
+
+class FastJSONResponse(ORJSONResponse):
+    """App-wide default response class (orjson instead of the stdlib encoder)."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+class RawJSONResponse(Response):
+    """
+    Response for payloads that are already serialized JSON bytes (e.g. read from cache).
+    Returning it from an endpoint skips `response_model` validation and re-serialization.
+    """
+    media_type = "application/json"
@@ -0,0 +1,169 @@
+"""
+Incremental usage rollups.
+
+`usage_tracking` (one row per user per day) and the AI reply rows in `messages`
+are folded into weekly and monthly buckets in `usage_rollups`, and from there
+into per-tier totals in `tier_usage_rollups`. Each run only recomputes the
+buckets that contain source rows changed since the previous run's watermark,
+so the work per run is proportional to recent activity, not to history.
+Recomputing a user bucket is an idempotent INSERT ... SELECT ... ON CONFLICT DO
+UPDATE; tier buckets are deleted and re-inserted in the same transaction.
+"""
+import logging
+from datetime import datetime, timedelta
+from typing import Optional, Set, Tuple
+from dateutil.relativedelta import relativedelta
+from sqlalchemy import delete, func, insert, literal, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+import pytz
+from app.config import settings
+from app.models import (
+    Message, MessageType, Subscription, SubscriptionTier, UsageTracking,
+    UsageRollup, TierUsageRollup, RollupWatermark
+)
+
+logger = logging.getLogger(__name__)
+
+PERIODS = ("week", "month")
+WATERMARK_NAME = "usage"
+
+
+def period_bounds(period: str, day: datetime) -> Tuple[datetime, datetime]:
+    """[start, end) of the week (ISO, Monday-based) or calendar month containing `day`, in UTC."""
+    if day.tzinfo is not None:
+        day = day.astimezone(pytz.UTC)
+    day = datetime(day.year, day.month, day.day, tzinfo=pytz.UTC)
+    if period == "week":
+        start = day - timedelta(days=day.weekday())
+        return start, start + timedelta(days=7)
+    start = day.replace(day=1)
+    return start, start + relativedelta(months=1)
+
+
+def _dirty_days(db: Session, since: Optional[datetime]) -> Set[datetime]:
+    """Days with usage rows updated, or AI replies written, since `since` (everything on the first run)."""
+    usage_query = select(UsageTracking.date).distinct()
+    messages_query = select(func.date_trunc("day", Message.created_at)).distinct().where(
+        Message.message_type == MessageType.AI
+    )
+    if since is not None:
+        usage_query = usage_query.where(UsageTracking.last_updated >= since)
+        messages_query = messages_query.where(Message.created_at >= since)
+    return {row[0] for row in db.execute(usage_query)} | {row[0] for row in db.execute(messages_query)}
+
+
+def refresh_user_bucket(db: Session, period: str, start: datetime, end: datetime):
+    usage = select(
+        UsageTracking.user_id.label("user_id"),
+        func.sum(UsageTracking.message_count).label("message_count"),
+        func.sum(UsageTracking.api_calls).label("api_calls")
+    ).where(
+        UsageTracking.date >= start, UsageTracking.date < end
+    ).group_by(UsageTracking.user_id).subquery()
+    replies = select(
+        Message.user_id.label("user_id"),
+        func.count().label("ai_messages"),
+        func.sum(Message.processing_time_ms).label("total_processing_time_ms"),
+        func.max(Message.processing_time_ms).label("max_processing_time_ms")
+    ).where(
+        Message.message_type == MessageType.AI,
+        Message.created_at >= start, Message.created_at < end
+    ).group_by(Message.user_id).subquery()
+
+    source = select(
+        func.coalesce(usage.c.user_id, replies.c.user_id),
+        literal(period),
+        literal(start),
+        func.coalesce(usage.c.message_count, 0),
+        func.coalesce(usage.c.api_calls, 0),
+        func.coalesce(replies.c.ai_messages, 0),
+        func.coalesce(replies.c.total_processing_time_ms, 0),
+        replies.c.max_processing_time_ms
+    ).select_from(usage.join(replies, usage.c.user_id == replies.c.user_id, full=True))
+
+    columns = ["user_id", "period", "period_start", "message_count", "api_calls",
+               "ai_messages", "total_processing_time_ms", "max_processing_time_ms"]
+    stmt = pg_insert(UsageRollup).from_select(columns, source)
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=["user_id", "period", "period_start"],
+        set_={**{name: stmt.excluded[name] for name in columns[3:]}, "updated_at": func.now()}
+    ))
+
+
+def refresh_tier_bucket(db: Session, period: str, start: datetime):
+    """
+    Tier totals for one bucket, using each user's current plan (latest subscription).
+
+    The bucket is rebuilt rather than upserted: a plan change moves a user's usage
+    to another tier, and the tier it left must not keep the old totals. The caller
+    commits, so readers see either the old rows or the new ones.
+    """
+    db.execute(delete(TierUsageRollup).where(
+        TierUsageRollup.period == period, TierUsageRollup.period_start == start
+    ))
+    latest_plan = select(
+        Subscription.user_id, Subscription.plan_type
+    ).distinct(Subscription.user_id).order_by(
+        Subscription.user_id, Subscription.created_at.desc()
+    ).subquery()
+    # Resolve the tier in a subquery so GROUP BY can reference a plain column
+    per_user = select(
+        func.coalesce(
+            latest_plan.c.plan_type, literal(SubscriptionTier.BASIC, Subscription.plan_type.type)
+        ).label("tier"),
+        UsageRollup.message_count,
+        UsageRollup.api_calls,
+        UsageRollup.ai_messages,
+        UsageRollup.total_processing_time_ms,
+        UsageRollup.max_processing_time_ms
+    ).select_from(
+        UsageRollup.__table__.outerjoin(latest_plan, latest_plan.c.user_id == UsageRollup.user_id)
+    ).where(
+        UsageRollup.period == period, UsageRollup.period_start == start
+    ).subquery()
+    source = select(
+        per_user.c.tier,
+        literal(period),
+        literal(start),
+        func.count(),
+        func.sum(per_user.c.message_count),
+        func.sum(per_user.c.api_calls),
+        func.sum(per_user.c.ai_messages),
+        func.sum(per_user.c.total_processing_time_ms),
+        func.max(per_user.c.max_processing_time_ms)
+    ).group_by(per_user.c.tier)
+
+    columns = ["tier", "period", "period_start", "active_users", "message_count", "api_calls",
+               "ai_messages", "total_processing_time_ms", "max_processing_time_ms"]
+    db.execute(insert(TierUsageRollup).from_select(columns, source))
+
+
+def refresh_rollups(db: Session) -> dict:
+    """
+    Recompute every weekly/monthly bucket touched since the last run, then advance
+    the watermark. Source rows are re-read with an overlap window so rows committed
+    slightly after their timestamp are not missed.
+    """
+    run_started = datetime.utcnow().replace(tzinfo=pytz.UTC)
+    state = db.get(RollupWatermark, WATERMARK_NAME)
+    since = state.watermark - timedelta(seconds=settings.rollup_overlap_seconds) if state else None
+
+    buckets = set()
+    for day in _dirty_days(db, since):
+        if day is None:
+            continue
+        for period in PERIODS:
+            buckets.add((period, *period_bounds(period, day)))
+
+    for period, start, end in sorted(buckets):
+        refresh_user_bucket(db, period, start, end)
+        refresh_tier_bucket(db, period, start)
+        db.commit()
+
+    if state:
+        state.watermark = run_started
+    else:
+        db.add(RollupWatermark(name=WATERMARK_NAME, watermark=run_started))
+    db.commit()
+    return {"buckets": len(buckets), "since": since.isoformat() if since else None}
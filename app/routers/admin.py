@@ -0,0 +1,96 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from sqlalchemy.orm import Session
+from typing import Optional
+from app.database import get_db
+from app.security import get_admin_access
+from app.user_import import import_stream
+from app.models import UsageRollup, TierUsageRollup
+from app.rollups import PERIODS
+from app.cache import cache
+from app.config import settings
+import logging
+import uuid
+
+logger = logging.getLogger(__name__)
+router = APIRouter(prefix="/admin", tags=["Admin"], dependencies=[Depends(get_admin_access)])
+
+@router.post("/users/import")
+async def import_users(
+    request: Request,
+    format: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Bulk-import users from a streamed CSV (header must include `mobile_number`,
+    optionally `full_name`) or NDJSON body. Each user gets a BASIC subscription;
+    existing mobile numbers are skipped.
+    """
+    fmt = format
+    if fmt is None:
+        content_type = request.headers.get("content-type", "")
+        fmt = "ndjson" if "ndjson" in content_type or "jsonl" in content_type else "csv"
+    if fmt not in ("csv", "ndjson"):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="format must be 'csv' or 'ndjson'"
+        )
+    summary = await import_stream(request.stream(), fmt, db, settings.user_import_batch_size)
+    logger.info(f"Admin user import ({fmt}): {summary['inserted']} inserted of {summary['received']}")
+    return summary
+
+
+def _usage_totals(row) -> dict:
+    totals = {
+        "message_count": row.message_count,
+        "api_calls": row.api_calls,
+        "ai_messages": row.ai_messages,
+        "avg_processing_time_ms": round(row.total_processing_time_ms / row.ai_messages, 1) if row.ai_messages else None,
+        "max_processing_time_ms": row.max_processing_time_ms
+    }
+    if hasattr(row, "active_users"):
+        totals["active_users"] = row.active_users
+    return totals
+
+@router.get("/analytics/usage")
+async def usage_analytics(
+    period: str = Query("week"),
+    limit: int = Query(12, ge=1, le=120),
+    user_id: Optional[uuid.UUID] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Usage per week/month, read only from the rollup tables (refreshed every
+    `rollup_interval` seconds). Per-tier totals by default, or one user's buckets
+    when `user_id` is given.
+    """
+    if period not in PERIODS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="period must be 'week' or 'month'"
+        )
+    if user_id:
+        rows = db.query(UsageRollup).filter(
+            UsageRollup.user_id == user_id,
+            UsageRollup.period == period
+        ).order_by(UsageRollup.period_start.desc()).limit(limit).all()
+        return {
+            "period": period,
+            "user_id": user_id,
+            "buckets": [{"period_start": row.period_start, **_usage_totals(row)} for row in rows]
+        }
+    starts = [start for (start,) in db.query(TierUsageRollup.period_start).filter(
+        TierUsageRollup.period == period
+    ).distinct().order_by(TierUsageRollup.period_start.desc()).limit(limit)]
+    rows = db.query(TierUsageRollup).filter(
+        TierUsageRollup.period == period,
+        TierUsageRollup.period_start.in_(starts)
+    ).all() if starts else []
+    buckets = {start: {"period_start": start, "tiers": {}} for start in starts}
+    for row in rows:
+        buckets[row.period_start]["tiers"][row.tier.value] = _usage_totals(row)
+    return {"period": period, "buckets": list(buckets.values())}
+
+@router.get("/cache/stats")
+async def cache_stats():
+    """Two-tier cache hit ratios of the worker process that served this request."""
+    return cache.snapshot()
@@ -1,11 +1,18 @@
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.security import HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
+from sqlalchemy.exc import IntegrityError
 from datetime import datetime, timedelta
+import uuid
 from app.database import get_db
-from app.models import User, OTPVerification, Subscription, SubscriptionTier
+from app.models import User, Subscription, SubscriptionTier
 from app.schemas import UserSignup, SendOTP, VerifyOTP, ChangePassword, Token, OTPResponse, SuccessResponse
-from app.security import get_password_hash, verify_password, create_access_token, generate_otp, get_current_active_user
-from app.redis_client import redis_client
+from app.security import (
+    get_password_hash_async, verify_password_async, create_access_token, get_current_active_user,
+    verify_token, revoke_token, revoke_user_tokens, security
+)
+from app.otp import otp_store
+from app.config import settings
 import logging
 
 logger = logging.getLogger(__name__)
@@ -14,123 +21,91 @@ router = APIRouter(prefix="/auth", tags=["Authentication"])
 @router.post("/signup", response_model=dict)
 async def signup(user_data: UserSignup, db: Session = Depends(get_db)):
     """Register a new user with mobile number"""
-    # Check if user already exists
-    existing_user = db.query(User).filter(User.mobile_number == user_data.mobile_number).first()
-    if existing_user:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="User with this mobile number already exists"
-        )
-    
-    # Create new user
+    # User and default Basic subscription are written in one transaction;
+    # the unique index on mobile_number rejects duplicates (no separate existence query)
     user = User(
+        id=uuid.uuid4(),
         mobile_number=user_data.mobile_number,
         full_name=user_data.full_name,
         is_active=True
     )
-    
-    db.add(user)
-    db.commit()
-    db.refresh(user)
-    
-    # Create default Basic subscription
     subscription = Subscription(
         user_id=user.id,
         plan_type=SubscriptionTier.BASIC
     )
-    db.add(subscription)
-    db.commit()
+    db.add_all([user, subscription])
+    
+    try:
+        # created_at is fetched via INSERT ... RETURNING during the flush
+        db.flush()
+        response = {
+            "user_id": str(user.id),
+            "status": "registered",
+            "created_at": user.created_at,
+            "message": "User registered successfully. Please verify your mobile number."
+        }
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="User with this mobile number already exists"
+        )
     
-    logger.info(f"New user registered: {user.mobile_number}")
+    logger.info(f"New user registered: {user_data.mobile_number}")
     
-    return {
-        "user_id": str(user.id),
-        "status": "registered",
-        "created_at": user.created_at,
-        "message": "User registered successfully. Please verify your mobile number."
-    }
+    return response
 
 @router.post("/send-otp", response_model=OTPResponse)
 async def send_otp(otp_data: SendOTP, db: Session = Depends(get_db)):
     """Send OTP to user's mobile number (mocked)"""
     # Check if user exists
-    user = db.query(User).filter(User.mobile_number == otp_data.mobile_number).first()
+    user = db.query(User).filter(
+        User.mobile_number == otp_data.mobile_number,
+        User.deleted_at.is_(None)
+    ).first()
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User not found. Please register first."
         )
     
-    # Generate OTP
-    otp_code = generate_otp()
-    expires_at = datetime.utcnow() + timedelta(minutes=5)
-    
-    # Save OTP to database
-    otp_verification = OTPVerification(
-        mobile_number=otp_data.mobile_number,
-        otp_code=otp_code,
-        expires_at=expires_at
-    )
-    
-    db.add(otp_verification)
-    db.commit()
-    
-    # Also store in Redis for quick access
-    cache_key = f"otp:{otp_data.mobile_number}"
-    await redis_client.set_json(cache_key, {
-        "otp": otp_code,
-        "expires_at": expires_at.isoformat()
-    }, expire=300)  # 5 minutes
+    # Issue OTP (Redis only; the audit record is flushed to Postgres in the background)
+    otp_code = await otp_store.issue(otp_data.mobile_number)
     
     # In production, you would send SMS here
-    logger.info(f"OTP generated for {otp_data.mobile_number}: {otp_code}")
+    logger.info(f"OTP generated for {otp_data.mobile_number}")
     
     return OTPResponse(
         otp=otp_code,  # In production, don't return OTP in response
-        expires_in=300,
+        expires_in=settings.otp_ttl_seconds,
         message="OTP sent successfully (mocked)"
     )
 
 @router.post("/verify-otp", response_model=Token)
 async def verify_otp(otp_data: VerifyOTP, db: Session = Depends(get_db)):
     """Verify OTP and return JWT token"""
-    # Check OTP from Redis first (faster)
-    cache_key = f"otp:{otp_data.mobile_number}"
-    cached_otp = await redis_client.get_json(cache_key)
+    # Atomic compare-and-consume in Redis; also enforces the attempt limit
+    outcome, attempts = await otp_store.verify(otp_data.mobile_number, otp_data.otp)
     
-    valid_otp = False
-    
-    if cached_otp:
-        if cached_otp["otp"] == otp_data.otp:
-            expires_at = datetime.fromisoformat(cached_otp["expires_at"])
-            if datetime.utcnow() <= expires_at:
-                valid_otp = True
-                # Remove OTP from cache after successful verification
-                await redis_client.delete(cache_key)
-    
-    # If not found in cache, check database
-    if not valid_otp:
-        db_otp = db.query(OTPVerification).filter(
-            OTPVerification.mobile_number == otp_data.mobile_number,
-            OTPVerification.otp_code == otp_data.otp,
-            OTPVerification.is_verified == False,
-            OTPVerification.expires_at > datetime.utcnow()
-        ).first()
-        
-        if db_otp:
-            valid_otp = True
-            # Mark as verified
-            db_otp.is_verified = True
-            db.commit()
-    
-    if not valid_otp:
+    if outcome == "locked":
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many invalid attempts. Please request a new OTP."
+        )
+    if outcome != "verified":
+        if outcome == "invalid":
+            logger.warning(f"Invalid OTP for {otp_data.mobile_number} (attempt {attempts})")
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Invalid or expired OTP"
         )
     
     # Get user
-    user = db.query(User).filter(User.mobile_number == otp_data.mobile_number).first()
+    user = db.query(User).filter(
+        User.mobile_number == otp_data.mobile_number,
+        User.deleted_at.is_(None)
+    ).first()
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -177,6 +152,22 @@ async def verify_otp(otp_data: VerifyOTP, db: Session = Depends(get_db)):
         user=user_response
     )
 
+@router.post("/logout", response_model=SuccessResponse)
+async def logout(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    """Revoke the presented access token"""
+    payload = verify_token(credentials.credentials)
+    if payload is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    await revoke_token(payload)
+    return SuccessResponse(
+        message="Logged out successfully.",
+        success=True
+    )
+
 @router.post("/forgot-password", response_model=OTPResponse)
 async def forgot_password(otp_data: SendOTP, db: Session = Depends(get_db)):
     """Send OTP for password reset"""
@@ -193,23 +184,26 @@ async def change_password(
     # If user has no password yet in DB
     if not current_user.password:
         # Set the new password
-        current_user.password = get_password_hash(password_data.new_password)
+        current_user.password = await get_password_hash_async(password_data.new_password)
         db.commit()
         logger.info(f"New password set for user {current_user.mobile_number}")
         return SuccessResponse(
             message="Password set successfully.",
             success=True
         )
-    # If password exists, check old password
-    if not verify_password(password_data.old_password, current_user.password):
+    # If password exists, check old password (no rehash needed: it is replaced below)
+    valid, _ = await verify_password_async(password_data.old_password, current_user.password)
+    if not valid:
         logger.warning(f"User {current_user.mobile_number}: Incorrect old password on change attempt.")
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Old password is incorrect."
         )
     # Update with new password
-    current_user.password = get_password_hash(password_data.new_password)
+    current_user.password = await get_password_hash_async(password_data.new_password)
     db.commit()
+    # Existing sessions were authorized with the old password
+    await revoke_user_tokens(current_user.id)
     logger.info(f"Password changed for user {current_user.mobile_number}")
     return SuccessResponse(
         message="Password changed successfully.",
@@ -1,24 +1,73 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, status
+from sqlalchemy import Text, bindparam, func, insert, select, tuple_
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from datetime import datetime
-from typing import List
+from typing import Awaitable, Callable, List, Optional
+from collections import Counter
+import uuid
+from celery import group
 from app.database import get_db
-from app.models import User, Chatroom, Message, MessageType, ProcessingStatus, SubscriptionTier, UsageTracking
+from app.models import User, Chatroom, Message, MessageType, ProcessingStatus
 from app.schemas import (
     ChatroomCreate, ChatroomResponse, ChatroomListResponse,
-    MessageCreate, MessageSendResponse, MessageResponse
+    MessageCreate, MessageSendResponse, MessageResponse,
+    MessageBatchCreate, MessageBatchResponse
 )
 from app.security import get_current_active_user
-from app.redis_client import redis_client
+from app.cache import cache
 from app.rate_limiter import rate_limiter
-from app.tasks import process_gemini_message
+from app.tasks import process_gemini_message, purge_chatroom
+from app.counters import increment_message_count
+from app.search import message_search_vector, search_messages
+from app.partitions import read_archived_messages
+from app.chatroom_cache import (
+    chatroom_list_key, chatroom_changed_keys,
+    get_owned_chatroom, get_owned_chatroom_id, store_chatroom_meta, mark_chatroom_missing
+)
+from app.idempotency import (
+    request_fingerprint, begin_idempotent_request,
+    complete_idempotent_request, release_idempotent_request
+)
 from app.config import settings
+from app.tracing import tracer
+from app.responses import RawJSONResponse, dumps
+from app.etag import (
+    CHATROOM_VALIDATOR_TTL, MESSAGE_VALIDATOR_TTL,
+    chatroom_list_etag_key, chatroom_etag_key, message_etag_key,
+    chatroom_list_etag, chatroom_etag, message_etag,
+    etag_matches, not_modified, cached_not_modified
+)
+from datetime import datetime, timedelta
+import pytz
 import logging
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/chatroom", tags=["Chatroom Management"])
 
+def _chatroom_payload(chatroom: Chatroom) -> dict:
+    """Plain-dict equivalent of ChatroomResponse, serialized directly without a Pydantic round-trip."""
+    return {
+        "id": chatroom.id,
+        "title": chatroom.title,
+        "description": chatroom.description,
+        "message_count": chatroom.message_count,
+        "created_at": chatroom.created_at,
+        "updated_at": chatroom.updated_at
+    }
+
+def _message_payload(message: Message) -> dict:
+    """Plain-dict equivalent of MessageResponse."""
+    return {
+        "id": message.id,
+        "content": message.content,
+        "message_type": message.message_type,
+        "ai_response": message.ai_response,
+        "processing_status": message.processing_status,
+        "created_at": message.created_at,
+        "processing_time_ms": message.processing_time_ms
+    }
+
 @router.post("", response_model=ChatroomResponse)
 async def create_chatroom(
     chatroom_data: ChatroomCreate,
@@ -33,133 +82,360 @@ async def create_chatroom(
     db.add(chatroom)
     db.commit()
     db.refresh(chatroom)
-    cache_key = f"chatrooms:user:{current_user.id}"
-    await redis_client.delete(cache_key)
-    logger.info(f"New chatroom created: {chatroom.title} by user {current_user.mobile_number}")
-    return ChatroomResponse(
-        id=chatroom.id,
-        title=chatroom.title,
-        description=chatroom.description,
-        message_count=chatroom.message_count,
-        created_at=chatroom.created_at,
-        updated_at=chatroom.updated_at
+    await store_chatroom_meta(
+        chatroom,
+        invalidate=(chatroom_list_key(current_user.id), chatroom_list_etag_key(current_user.id))
     )
+    logger.info(f"New chatroom created: {chatroom.title} by user {current_user.mobile_number}")
+    return RawJSONResponse(dumps(_chatroom_payload(chatroom)))
 
 @router.get("", response_model=ChatroomListResponse)
 async def list_chatrooms(
+    request: Request,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
-    cache_key = f"chatrooms:user:{current_user.id}"
-    cached_data = await redis_client.get_json(cache_key)
-    if cached_data:
-        logger.info(f"Returning cached chatrooms for user {current_user.mobile_number}")
-        return ChatroomListResponse(**cached_data)
+    # The cached value is the serialized response body, returned as-is on a hit
+    cache_key = chatroom_list_key(current_user.id)
+    etag_key = chatroom_list_etag_key(current_user.id)
+    cached_response = await cached_not_modified(request, etag_key)
+    if cached_response:
+        return cached_response
+    cached_body, etag = await cache.get_many([cache_key, etag_key])
+    if cached_body and etag:
+        logger.debug("Returning cached chatrooms for user %s", current_user.id)
+        return RawJSONResponse(cached_body, headers={"ETag": etag})
     chatrooms = db.query(Chatroom).filter(
-        Chatroom.user_id == current_user.id
+        Chatroom.user_id == current_user.id,
+        Chatroom.deleted_at.is_(None)
     ).order_by(Chatroom.updated_at.desc()).all()
-    chatroom_responses = [
-        ChatroomResponse(
-            id=chatroom.id,
-            title=chatroom.title,
-            description=chatroom.description,
-            message_count=chatroom.message_count,
-            created_at=chatroom.created_at,
-            updated_at=chatroom.updated_at
-        )
-        for chatroom in chatrooms
+    body = dumps({
+        "chatrooms": [_chatroom_payload(chatroom) for chatroom in chatrooms],
+        "total_count": len(chatrooms)
+    })
+    etag = chatroom_list_etag(chatrooms)
+    await cache.update({cache_key: (body, 300), etag_key: (etag, CHATROOM_VALIDATOR_TTL)})
+    logger.debug("Returning %d chatrooms for user %s", len(chatrooms), current_user.id)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    return RawJSONResponse(body, headers={"ETag": etag})
+
+@router.get("/search")
+async def search_chatroom_messages(
+    q: str = Query(..., min_length=1, max_length=256),
+    chatroom_id: Optional[uuid.UUID] = None,
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0, le=10000),
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Full-text search over the user's messages and AI responses, best matches first."""
+    rows, has_more = search_messages(db, current_user.id, q, limit, offset, chatroom_id)
+    return RawJSONResponse(dumps({
+        "query": q,
+        "results": [
+            {
+                **_message_payload(message),
+                "chatroom_id": message.chatroom_id,
+                "chatroom_title": title,
+                "rank": round(rank, 6)
+            }
+            for message, title, rank in rows
+        ],
+        "limit": limit,
+        "offset": offset,
+        "has_more": has_more
+    }))
+
+@router.post("/messages/batch", response_model=MessageBatchResponse)
+async def send_message_batch(
+    batch: MessageBatchCreate,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Submit up to MAX_BATCH_MESSAGES messages across the user's chatrooms in one
+    request: one ownership query, one quota reservation, one bulk insert and one
+    Celery group. Items are accepted in order until the daily limit is reached;
+    every item gets its own result.
+    """
+    room_ids = {item.chatroom_id for item in batch.messages}
+    # FOR SHARE: a concurrent delete waits for this batch to commit
+    owned = set(db.execute(
+        select(Chatroom.id).where(
+            Chatroom.id.in_(room_ids),
+            Chatroom.user_id == current_user.id,
+            Chatroom.deleted_at.is_(None)
+        ).with_for_update(read=True)
+    ).scalars())
+    candidates = [i for i, item in enumerate(batch.messages) if item.chatroom_id in owned]
+
+    # Recent history per chatroom (9 previous messages, as in send_message), read before the write
+    lookback = datetime.utcnow().replace(tzinfo=pytz.UTC) - timedelta(days=settings.context_lookback_days)
+    history = {room_id: [] for room_id in owned}
+    if owned:
+        ranked = select(
+            Message.chatroom_id, Message.content, Message.message_type, Message.created_at,
+            func.row_number().over(
+                partition_by=Message.chatroom_id, order_by=Message.created_at.desc()
+            ).label("position")
+        ).where(Message.chatroom_id.in_(owned), Message.created_at >= lookback).subquery()
+        for row in db.execute(
+            select(ranked).where(ranked.c.position <= 9).order_by(ranked.c.created_at)
+        ):
+            history[row.chatroom_id].append({
+                "content": row.content,
+                "type": "user" if row.message_type == MessageType.USER else "ai"
+            })
+
+    granted, usage_count = 0, None
+    if candidates:
+        granted, usage_count = await rate_limiter.reserve_usage(current_user, db, len(candidates))
+    accepted = candidates[:granted]
+    rows = [
+        {
+            "id": uuid.uuid4(),
+            "chatroom_id": batch.messages[i].chatroom_id,
+            "user_id": current_user.id,
+            "content": batch.messages[i].content,
+            "search_content": batch.messages[i].content,
+            "message_type": MessageType.USER,
+            "processing_status": ProcessingStatus.PENDING
+        }
+        for i in accepted
     ]
-    response_data = {
-        "chatrooms": [room.dict() for room in chatroom_responses],
-        "total_count": len(chatroom_responses)
-    }
-    await redis_client.set_json(cache_key, response_data, expire=300)
-    logger.info(f"Returning {len(chatrooms)} chatrooms for user {current_user.mobile_number}")
-    return ChatroomListResponse(
-        chatrooms=chatroom_responses,
-        total_count=len(chatroom_responses)
-    )
+    created_at = {}
+    if rows:
+        stmt = insert(Message.__table__).values(
+            search_vector=message_search_vector(bindparam("search_content", type_=Text))
+        ).returning(Message.__table__.c.id, Message.__table__.c.created_at, sort_by_parameter_order=True)
+        created_at = {row.id: row.created_at for row in db.execute(stmt, rows)}
+        per_room = Counter(row["chatroom_id"] for row in rows)
+        for room_id, count in per_room.items():
+            increment_message_count(db, room_id, count)
+    db.commit()
+    if usage_count is not None:
+        await rate_limiter.mirror_usage(current_user, usage_count)
+
+    results = []
+    for index, item in enumerate(batch.messages):
+        results.append({"index": index, "chatroom_id": item.chatroom_id, "status": "rejected",
+                        "error": "chatroom_not_found" if item.chatroom_id not in owned else "daily_limit_exceeded"})
+    signatures = []
+    for i, row in zip(accepted, rows):
+        payload = {
+            "id": row["id"],
+            "content": row["content"],
+            "message_type": MessageType.USER,
+            "ai_response": None,
+            "processing_status": ProcessingStatus.PENDING,
+            "created_at": created_at[row["id"]],
+            "processing_time_ms": None
+        }
+        results[i] = {"index": i, "chatroom_id": row["chatroom_id"], "status": "processing", "message": payload}
+        room_history = history[row["chatroom_id"]]
+        signatures.append(process_gemini_message.s(str(row["id"]), row["content"], room_history[-9:]))
+        # Later items in the same chatroom see the earlier ones as context
+        room_history.append({"content": row["content"], "type": "user"})
+
+    if signatures:
+        with tracer.span("celery.publish", task=process_gemini_message.name, batch_size=len(signatures)):
+            group(signatures).apply_async()
+        await cache.delete(*chatroom_changed_keys(current_user.id, *{row["chatroom_id"] for row in rows}))
+    logger.info("Batch of %d messages from user %s: %d queued", len(batch.messages), current_user.id, len(rows))
+
+    return RawJSONResponse(dumps({
+        "results": results,
+        "accepted": len(rows),
+        "rejected": len(batch.messages) - len(rows)
+    }))
 
 @router.get("/{chatroom_id}", response_model=ChatroomResponse)
 async def get_chatroom(
+    chatroom_id: str,
+    request: Request,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    etag_key = chatroom_etag_key(current_user.id, chatroom_id)
+    cached_response = await cached_not_modified(request, etag_key)
+    if cached_response:
+        return cached_response
+    chatroom = await get_owned_chatroom(db, chatroom_id, current_user.id)
+    etag = chatroom_etag(chatroom)
+    await cache.set(etag_key, etag, CHATROOM_VALIDATOR_TTL)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    return RawJSONResponse(dumps(_chatroom_payload(chatroom)), headers={"ETag": etag})
+
+@router.delete("/{chatroom_id}", status_code=status.HTTP_202_ACCEPTED)
+async def delete_chatroom(
     chatroom_id: str,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
+    """Soft-delete now (hidden from every read); messages are purged in the background."""
+    room_id = await get_owned_chatroom_id(db, chatroom_id, current_user.id)
     chatroom = db.query(Chatroom).filter(
-        Chatroom.id == chatroom_id,
-        Chatroom.user_id == current_user.id
+        Chatroom.id == room_id,
+        Chatroom.deleted_at.is_(None)
     ).first()
     if not chatroom:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Chatroom not found"
+        raise HTTPException(status_code=404, detail="Chatroom not found")
+    chatroom.deleted_at = datetime.utcnow().replace(tzinfo=pytz.UTC)
+    db.commit()
+    purge_chatroom.delay(str(chatroom.id))
+    await mark_chatroom_missing(chatroom.id, invalidate=chatroom_changed_keys(current_user.id, chatroom.id))
+    logger.info("Chatroom %s deleted by user %s; purge queued", chatroom.id, current_user.id)
+    return {"id": str(chatroom.id), "status": "deleted"}
+
+@router.get("/{chatroom_id}/messages")
+async def list_messages(
+    chatroom_id: str,
+    before: Optional[datetime] = None,
+    before_id: Optional[uuid.UUID] = None,
+    limit: int = Query(50, ge=1, le=200),
+    include_archived: bool = False,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Message history, newest first, paginated by keyset on (created_at, id): pass
+    the previous page's `next_before` and `next_before_id`, so messages sharing a
+    timestamp (e.g. from one batch) are never skipped at a page boundary.
+    Archived months are only read with include_archived=true.
+    """
+    room_id = await get_owned_chatroom_id(db, chatroom_id, current_user.id)
+    if before is not None and before.tzinfo is None:
+        before = before.replace(tzinfo=pytz.UTC)
+
+    query = db.query(Message).filter(Message.chatroom_id == room_id)
+    if before is not None and before_id is not None:
+        query = query.filter(tuple_(Message.created_at, Message.id) < tuple_(before, before_id))
+    elif before is not None:
+        query = query.filter(Message.created_at < before)
+    messages = [
+        _message_payload(m)
+        for m in query.order_by(Message.created_at.desc(), Message.id.desc()).limit(limit + 1)
+    ]
+    if include_archived and len(messages) <= limit:
+        if messages:
+            archive_before, archive_before_id = messages[-1]["created_at"], messages[-1]["id"]
+        else:
+            archive_before, archive_before_id = before, before_id
+        archived = read_archived_messages(
+            db, room_id, archive_before, limit + 1 - len(messages), before_id=archive_before_id
         )
-    return ChatroomResponse(
-        id=chatroom.id,
-        title=chatroom.title,
-        description=chatroom.description,
-        message_count=chatroom.message_count,
-        created_at=chatroom.created_at,
-        updated_at=chatroom.updated_at
-    )
+        messages += [
+            {
+                "id": record["id"],
+                "content": record["content"],
+                "message_type": record["message_type"],
+                "ai_response": record["ai_response"],
+                "processing_status": record["processing_status"],
+                "created_at": record["created_at"],
+                "processing_time_ms": record["processing_time_ms"],
+                "archived": True
+            }
+            for record in archived
+        ]
+    has_more = len(messages) > limit
+    messages = messages[:limit]
+    return RawJSONResponse(dumps({
+        "messages": messages,
+        "has_more": has_more,
+        "next_before": messages[-1]["created_at"] if has_more else None,
+        "next_before_id": messages[-1]["id"] if has_more else None
+    }))
 
 @router.post("/{chatroom_id}/message", response_model=MessageSendResponse)
 async def send_message(
     chatroom_id: str,
     message_data: MessageCreate,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", min_length=1, max_length=255),
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
-    # --- Enforce persistent daily limit from UsageTracking for BASIC users ---
-    today = datetime.utcnow().date()
-    sub = None
-    if current_user.subscriptions:
-        sub = max(current_user.subscriptions, key=lambda x: x.created_at)
-    usage = db.query(UsageTracking).filter(
-        UsageTracking.user_id == current_user.id,
-        UsageTracking.date == today
-    ).first()
-    messages_today = usage.message_count if usage else 0
-    if (
-        sub
-        and sub.plan_type == SubscriptionTier.BASIC
-        and messages_today >= settings.basic_daily_limit
-    ):
-        raise HTTPException(
-            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
-            detail={
-                "message": "Daily message limit exceeded (persistent tracking)",
-                "current_usage": messages_today,
-                "limit": settings.basic_daily_limit,
-                "upgrade_required": True
-            }
-        )
+    """
+    With an Idempotency-Key header, retries of the same request return the
+    original response without storing, counting or queueing the message again.
+    The response is stored as soon as the message is committed, so a failure
+    after that point (usage update, enqueueing) is never retried into a second
+    message; only failures before the commit (429, 404, ...) release the key.
+    """
+    if not idempotency_key:
+        return RawJSONResponse(await _send_message(chatroom_id, message_data, current_user, db))
+    scope = "send_message"
+    fingerprint = request_fingerprint(chatroom_id, message_data.content)
+    replay = await begin_idempotent_request(scope, current_user.id, idempotency_key, fingerprint)
+    if replay is not None:
+        logger.info("Replayed send_message for user %s (Idempotency-Key)", current_user.id)
+        return replay
+    committed = False
 
-    chatroom = db.query(Chatroom).filter(
-        Chatroom.id == chatroom_id,
-        Chatroom.user_id == current_user.id
-    ).first()
-    if not chatroom:
-        raise HTTPException(status_code=404, detail="Chatroom not found")
+    async def store_response(body: bytes):
+        nonlocal committed
+        committed = True
+        await complete_idempotent_request(scope, current_user.id, idempotency_key, fingerprint, body)
+
+    try:
+        body = await _send_message(chatroom_id, message_data, current_user, db, on_commit=store_response)
+    except Exception:
+        if not committed:
+            await release_idempotent_request(scope, current_user.id, idempotency_key)
+        raise
+    return RawJSONResponse(body)
+
+async def _send_message(
+    chatroom_id: str,
+    message_data: MessageCreate,
+    current_user: User,
+    db: Session,
+    on_commit: Optional[Callable[[bytes], Awaitable[None]]] = None
+) -> bytes:
+    """Store and enqueue the message; `on_commit` gets the response body once the message is committed."""
+    # Daily limit for the user's effective plan (cached entitlement + UsageTracking)
+    await rate_limiter.enforce_rate_limit(current_user, db)
+
+    room_id = await get_owned_chatroom_id(db, chatroom_id, current_user.id)
 
     user_message = Message(
-        chatroom_id=chatroom.id,
+        chatroom_id=room_id,
         user_id=current_user.id,
         content=message_data.content,
         message_type=MessageType.USER,
-        processing_status=ProcessingStatus.PENDING
+        processing_status=ProcessingStatus.PENDING,
+        search_vector=message_search_vector(message_data.content)
     )
     db.add(user_message)
-    chatroom.message_count += 1
+    try:
+        db.flush()
+        live = increment_message_count(db, room_id)
+    except IntegrityError:
+        live = False  # already purged
+    if not live:
+        # Deleted after the (cached) ownership check: store nothing, charge no quota
+        db.rollback()
+        await mark_chatroom_missing(room_id)
+        raise HTTPException(status_code=404, detail="Chatroom not found")
     db.commit()
     db.refresh(user_message)
+    body = dumps({
+        "message": _message_payload(user_message),
+        "status": "processing",
+        "estimated_response_time": 30
+    })
+    if on_commit is not None:
+        await on_commit(body)
 
     # Increment usage in UsageTracking and Redis
     await rate_limiter.increment_usage(current_user, db)
 
+    # The lookback bound lets Postgres prune the scan to the most recent partitions
+    lookback = datetime.utcnow().replace(tzinfo=pytz.UTC) - timedelta(days=settings.context_lookback_days)
     recent_messages = db.query(Message).filter(
-        Message.chatroom_id == chatroom.id
+        Message.chatroom_id == room_id,
+        Message.created_at >= lookback
     ).order_by(Message.created_at.desc()).limit(10).all()
     context = [
         {
@@ -169,56 +445,50 @@ async def send_message(
         for msg in reversed(recent_messages[1:])  # Exclude current message
     ]
 
-    task = process_gemini_message.delay(
-        str(user_message.id),
-        message_data.content,
-        context
-    )
+    with tracer.span("celery.publish", task=process_gemini_message.name, message_id=str(user_message.id)):
+        task = process_gemini_message.delay(
+            str(user_message.id),
+            message_data.content,
+            context
+        )
 
-    cache_key = f"chatrooms:user:{current_user.id}"
-    await redis_client.delete(cache_key)
+    await cache.update(
+        {message_etag_key(current_user.id, user_message.id): (message_etag(user_message), MESSAGE_VALIDATOR_TTL)},
+        delete=chatroom_changed_keys(current_user.id, room_id)
+    )
     logger.info(f"Message queued for processing: {user_message.id}")
 
-    return MessageSendResponse(
-        message=MessageResponse(
-            id=user_message.id,
-            content=user_message.content,
-            message_type=user_message.message_type,
-            ai_response=user_message.ai_response,
-            processing_status=user_message.processing_status,
-            created_at=user_message.created_at,
-            processing_time_ms=user_message.processing_time_ms
-        ),
-        status="processing",
-        estimated_response_time=30
-    )
+    return body
 
 @router.get("/{chatroom_id}/message/{message_id}", response_model=MessageResponse)
 async def get_message(
     chatroom_id: str,
     message_id: str,
+    request: Request,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
-    chatroom = db.query(Chatroom).filter(
-        Chatroom.id == chatroom_id,
-        Chatroom.user_id == current_user.id
-    ).first()
-    if not chatroom:
-        raise HTTPException(status_code=404, detail="Chatroom not found")
-    message = db.query(Message).filter(
-        Message.id == message_id,
-        Message.chatroom_id == chatroom.id,
-        Message.user_id == current_user.id
+    # Ownership first (a local cache hit), so a deleted or purged chatroom is a 404, never a 304
+    room_id = await get_owned_chatroom_id(db, chatroom_id, current_user.id)
+    # Status polling: answered from the Redis validator (kept current by the Gemini task) when unchanged
+    etag_key = message_etag_key(current_user.id, message_id)
+    cached_response = await cached_not_modified(request, etag_key)
+    if cached_response:
+        return cached_response
+    try:
+        message_uuid = uuid.UUID(message_id)
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Message not found")
+    message = db.query(Message).join(Chatroom, Chatroom.id == Message.chatroom_id).filter(
+        Message.id == message_uuid,
+        Message.chatroom_id == room_id,
+        Message.user_id == current_user.id,
+        Chatroom.deleted_at.is_(None)
     ).first()
     if not message:
         raise HTTPException(status_code=404, detail="Message not found")
-    return MessageResponse(
-        id=message.id,
-        content=message.content,
-        message_type=message.message_type,
-        ai_response=message.ai_response,
-        processing_status=message.processing_status,
-        created_at=message.created_at,
-        processing_time_ms=message.processing_time_ms
-    )
+    etag = message_etag(message)
+    await cache.set(etag_key, etag, MESSAGE_VALIDATOR_TTL)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    return RawJSONResponse(dumps(_message_payload(message)), headers={"ETag": etag})
@@ -1,15 +1,17 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Request
 from sqlalchemy.orm import Session
 from app.database import get_db
-from app.models import User, Subscription, SubscriptionTier, SubscriptionStatus
+from app.models import User, Subscription, SubscriptionTier, SubscriptionStatus, StripeEvent, StripeEventStatus
 from app.schemas import CheckoutResponse, SubscriptionStatusResponse
 from app.security import get_current_active_user
 from app.stripe_client import stripe_client
+from app.checkout import get_or_create_checkout_session
+from app.entitlements import get_entitlement, invalidate_entitlement
 from app.rate_limiter import rate_limiter
-import stripe
-from datetime import datetime
-from dateutil.relativedelta import relativedelta
-import pytz
+from app.stripe_events import ordering_key_for
+from app.tasks import process_stripe_events
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+import json
 import logging
 
 logger = logging.getLogger(__name__)
@@ -21,21 +23,14 @@ async def create_pro_subscription(
     db: Session = Depends(get_db)
 ):
     # Prevent multiple active PRO subscriptions
-    existing_subscription = db.query(Subscription).filter(
-        Subscription.user_id == current_user.id,
-        Subscription.plan_type == SubscriptionTier.PRO,
-        Subscription.status == SubscriptionStatus.ACTIVE
-    ).first()
-    if existing_subscription:
+    entitlement = await get_entitlement(current_user, db)
+    if entitlement.effective_tier == SubscriptionTier.PRO:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="User already has an active Pro subscription"
         )
-    checkout_data = stripe_client.create_checkout_session(
-        user_id=str(current_user.id),
-        customer_email=None  # Or current_user.email
-    )
-    logger.info(f"Stripe checkout session created for user {current_user.id}: {checkout_data['session_id']}")
+    checkout_data = await get_or_create_checkout_session(current_user.id)
+    logger.info("Stripe checkout session for user %s: %s", current_user.id, checkout_data['session_id'])
     return CheckoutResponse(
         checkout_url=checkout_data['checkout_url'],
         session_id=checkout_data['session_id']
@@ -46,10 +41,8 @@ async def get_subscription_status(
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
-    subscription = db.query(Subscription).filter(
-        Subscription.user_id == current_user.id
-    ).order_by(Subscription.created_at.desc()).first()
-    if not subscription:
+    entitlement = await get_entitlement(current_user, db)
+    if not entitlement.has_subscription:
         subscription = Subscription(
             user_id=current_user.id,
             plan_type=SubscriptionTier.BASIC,
@@ -57,19 +50,23 @@ async def get_subscription_status(
         )
         db.add(subscription)
         db.commit()
-        db.refresh(subscription)
+        await invalidate_entitlement(current_user.id)
+        entitlement = await get_entitlement(current_user, db)
     usage = await rate_limiter.get_current_usage(current_user, db)
     return SubscriptionStatusResponse(
-        plan=subscription.plan_type,
-        status=subscription.status.value,
-        current_period_end=subscription.current_period_end,
+        plan=entitlement.effective_tier,
+        status=entitlement.status,
+        current_period_end=entitlement.current_period_end,
         usage=usage
     )
 
-
 @router.post("/webhook/stripe")
 async def stripe_webhook(request: Request, db: Session = Depends(get_db)):
-    """Handle only checkout.session.completed events from Stripe."""
+    """
+    Verify and record a Stripe event, then acknowledge immediately.
+    Events are applied asynchronously (in order per customer) by the stripe_events queue;
+    redelivered events are recognized by their id and not processed twice.
+    """
     payload = await request.body()
     sig_header = request.headers.get('stripe-signature')
     if not sig_header:
@@ -78,74 +75,29 @@ async def stripe_webhook(request: Request, db: Session = Depends(get_db)):
             detail="Missing Stripe signature"
         )
     try:
-        event = stripe_client.construct_webhook_event(payload, sig_header)
-        logger.info("Stripe webhook received: %s", event["type"])
+        stripe_client.construct_webhook_event(payload, sig_header)
     except Exception as e:
         logger.error(f"Invalid Stripe webhook: {e}")
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Invalid Stripe webhook: {}".format(e)
         )
-    if event["type"] == "checkout.session.completed":
-        await handle_checkout_session_completed(event["data"]["object"], db)
-        return {"received": True}
-    else:
-        logger.info(f"Ignored Stripe event type: {event['type']}")
-        return {"ignored": True}
-
-
-async def handle_checkout_session_completed(session_data: dict, db: Session):
-    """
-    Upgrade the user's most recent subscription to PRO if payment succeeded.
-    Sets current_period_start = now, current_period_end = now + 1 month.
-    Never creates a duplicate Subscription row for the user.
-    """
-    user_id = session_data.get('metadata', {}).get('user_id')
-    stripe_customer_id = session_data.get('customer')
-    stripe_subscription_id = session_data.get('subscription')
-    payment_status = session_data.get('payment_status')
-    if not user_id or not stripe_subscription_id:
-        logger.error("Missing user_id or stripe_subscription_id in checkout.session.completed payload")
-        return
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user:
-        logger.error(f"User not found for id {user_id} during checkout.session.completed")
-        return
-
-    # Set now as start, next month as end via relativedelta for calendar correctness
-    now = datetime.utcnow().replace(tzinfo=pytz.UTC)
-    next_month = now + relativedelta(months=1)
-
-    if payment_status == "paid":
-        # Find the latest subscription for this user (any plan type)
-        subscription = db.query(Subscription).filter(
-            Subscription.user_id == user.id
-        ).order_by(Subscription.created_at.desc()).first()
-
-        if subscription:
-            # Update the record in-place
-            subscription.plan_type = SubscriptionTier.PRO
-            subscription.status = SubscriptionStatus.ACTIVE
-            subscription.stripe_subscription_id = stripe_subscription_id
-            subscription.stripe_customer_id = stripe_customer_id
-            subscription.current_period_start = now
-            subscription.current_period_end = next_month
-            logger.info(f"Upgraded subscription ({subscription.id}) to PRO for user {user_id}.")
-        else:
-            # If for some reason user doesn't have a prior subscription
-            subscription = Subscription(
-                user_id=user.id,
-                plan_type=SubscriptionTier.PRO,
-                stripe_subscription_id=stripe_subscription_id,
-                stripe_customer_id=stripe_customer_id,
-                status=SubscriptionStatus.ACTIVE,
-                current_period_start=now,
-                current_period_end=next_month
-            )
-            db.add(subscription)
-            logger.info(f"Created new PRO subscription for user {user_id}.")
-        db.commit()
-        db.refresh(subscription)
-    else:
-        logger.warning(f"Payment for user {user_id} not marked as paid on checkout.session.completed.")
-
+    event = json.loads(payload)
+    ordering_key = ordering_key_for(event)
+    stmt = pg_insert(StripeEvent).values(
+        id=event["id"],
+        type=event["type"],
+        ordering_key=ordering_key,
+        stripe_created=event.get("created", 0),
+        payload=event["data"]["object"],
+        status=StripeEventStatus.PENDING,
+        attempts=0
+    ).on_conflict_do_nothing(index_elements=[StripeEvent.id]).returning(StripeEvent.id)
+    inserted = db.execute(stmt).scalar()
+    db.commit()
+    if not inserted:
+        logger.info("Duplicate Stripe event %s (%s) ignored", event["id"], event["type"])
+        return {"received": True, "duplicate": True}
+    process_stripe_events.delay(ordering_key)
+    logger.info("Stripe event %s (%s) queued", event["id"], event["type"])
+    return {"received": True}
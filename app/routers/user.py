@@ -1,9 +1,19 @@
-from fastapi import APIRouter, Depends
-from app.security import get_current_active_user
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import FileResponse, StreamingResponse
+from app.security import get_current_active_user, revoke_user_tokens
 from app.models import User
 from app.schemas import UserResponse, SubscriptionResponse
 from sqlalchemy.orm import Session
 from app.database import get_db
+from app.celery_app import celery_app
+from app.export import export_stream, export_filename
+from app.tasks import export_user_data, purge_user
+from datetime import datetime
+import os
+import pytz
+import logging
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/user", tags=["User Management"])
 
@@ -33,4 +43,67 @@ async def get_current_user_info(
             current_period_end=subscription.current_period_end,
             created_at=subscription.created_at
         ) if subscription else None
-    )
\ No newline at end of file
+    )
+
+@router.delete("/me", status_code=status.HTTP_202_ACCEPTED)
+async def delete_my_account(
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Soft-delete the account: it is deactivated and all tokens are revoked immediately,
+    and its chatrooms and messages are purged in the background.
+    """
+    current_user.deleted_at = datetime.utcnow().replace(tzinfo=pytz.UTC)
+    current_user.is_active = False
+    db.commit()
+    await revoke_user_tokens(current_user.id)
+    purge_user.delay(str(current_user.id))
+    logger.info("User %s deleted their account; purge queued", current_user.id)
+    return {"id": str(current_user.id), "status": "deleted"}
+
+@router.get("/me/export")
+async def export_my_data(
+    gzip: bool = False,
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Stream the user's account, chatrooms and messages as NDJSON (optionally gzip).
+    The generator opens its own session, so it outlives the request's dependencies.
+    """
+    filename = export_filename(current_user.id, gzip)
+    return StreamingResponse(
+        export_stream(current_user.id, gzip),
+        media_type="application/gzip" if gzip else "application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@router.post("/me/export", status_code=status.HTTP_202_ACCEPTED)
+async def request_data_export(
+    gzip: bool = True,
+    current_user: User = Depends(get_current_active_user)
+):
+    """Background export for very large accounts; poll `GET /user/me/export/{task_id}`."""
+    task = export_user_data.delay(str(current_user.id), gzip)
+    return {"task_id": task.id, "status": "queued"}
+
+@router.get("/me/export/{task_id}")
+async def get_data_export(
+    task_id: str,
+    current_user: User = Depends(get_current_active_user)
+):
+    result = celery_app.AsyncResult(task_id)
+    if not result.ready():
+        return {"task_id": task_id, "status": result.state.lower()}
+    if result.failed():
+        return {"task_id": task_id, "status": "failed"}
+    path = (result.result or {}).get("path", "")
+    filename = os.path.basename(path)
+    # Export files are named after their owner; never serve another user's file
+    if not filename.startswith(f"{current_user.id}-") or not os.path.exists(path):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Export not found")
+    return FileResponse(
+        path,
+        media_type="application/gzip" if filename.endswith(".gz") else "application/x-ndjson",
+        filename=filename
+    )
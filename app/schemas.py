@@ -113,6 +113,27 @@ class MessageSendResponse(BaseModel):
     status: str
     estimated_response_time: Optional[int]
 
+MAX_BATCH_MESSAGES = 100
+
+class MessageBatchItem(BaseModel):
+    chatroom_id: uuid.UUID
+    content: str = Field(..., min_length=1, max_length=2000)
+
+class MessageBatchCreate(BaseModel):
+    messages: List[MessageBatchItem] = Field(..., min_length=1, max_length=MAX_BATCH_MESSAGES)
+
+class MessageBatchResult(BaseModel):
+    index: int
+    chatroom_id: uuid.UUID
+    status: str  # "processing" or "rejected"
+    message: Optional[MessageResponse] = None
+    error: Optional[str] = None  # "chatroom_not_found" or "daily_limit_exceeded"
+
+class MessageBatchResponse(BaseModel):
+    results: List[MessageBatchResult]
+    accepted: int
+    rejected: int
+
 # Subscription Schemas
 class SubscriptionResponse(BaseModel):
     id: uuid.UUID
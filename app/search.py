@@ -0,0 +1,71 @@
+"""
+Full-text search over a user's messages.
+
+Each user message row carries a `search_vector` (tsvector) built from its
+content (weight A) and, once the Gemini task has answered, the AI response
+(weight B). Vectors are computed from the plain text the application writes,
+so the index does not depend on how the text columns are stored. The
+(user_id, search_vector) GIN index (btree_gin) restricts matching to one
+user's rows before any ranking happens.
+"""
+from typing import List, Optional, Tuple
+from sqlalchemy import cast, func, select
+from sqlalchemy.dialects.postgresql import REGCONFIG
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.models import Chatroom, Message
+
+
+def _tsvector(text, weight: str):
+    config = cast(settings.search_text_config, REGCONFIG)
+    return func.setweight(func.to_tsvector(config, "" if text is None else text), weight)
+
+
+def message_search_vector(content, ai_response: Optional[str] = None):
+    """
+    SQL expression for a message's search_vector; assign it on insert/update.
+    `content` may also be a SQL expression (e.g. a bindparam for bulk inserts).
+    """
+    vector = _tsvector(content, "A")
+    if ai_response:
+        vector = vector.op("||")(_tsvector(ai_response, "B"))
+    return vector
+
+
+def search_messages(
+    db: Session,
+    user_id,
+    q: str,
+    limit: int,
+    offset: int,
+    chatroom_id=None
+) -> Tuple[List[Tuple[Message, str, float]], bool]:
+    """
+    Ranked (ts_rank_cd) matches for `q` (websearch syntax: quotes, OR, -term).
+
+    Ranking is applied to the newest `search_max_candidates` matches only, which
+    bounds the cost for very common terms. Returns ((message, chatroom title,
+    rank) rows, has_more).
+    """
+    query = func.websearch_to_tsquery(cast(settings.search_text_config, REGCONFIG), q)
+    candidates = select(Message.id, Message.search_vector).where(
+        Message.user_id == user_id,
+        Message.search_vector.op("@@")(query)
+    )
+    if chatroom_id is not None:
+        candidates = candidates.where(Message.chatroom_id == chatroom_id)
+    candidates = candidates.order_by(Message.created_at.desc()).limit(
+        settings.search_max_candidates
+    ).subquery()
+
+    rank = func.ts_rank_cd(candidates.c.search_vector, query).label("rank")
+    ranked = select(Message, Chatroom.title, rank).join(
+        candidates, candidates.c.id == Message.id
+    ).join(
+        Chatroom, Chatroom.id == Message.chatroom_id
+    ).where(
+        Chatroom.deleted_at.is_(None)
+    ).order_by(rank.desc(), Message.created_at.desc()).offset(offset).limit(limit + 1)
+
+    rows = db.execute(ranked).all()
+    return [tuple(row) for row in rows[:limit]], len(rows) > limit
@@ -1,42 +1,186 @@
+import asyncio
+import hashlib
+import hmac
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Optional, Tuple
 from jose import JWTError, jwt
 from passlib.context import CryptContext
-from fastapi import HTTPException, status, Depends
+from fastapi import HTTPException, status, Depends, Header
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
 from app.config import settings
 from app.database import get_db
 from app.models import User
+from app.redis_client import redis_client
 import random
 import string
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+logger = logging.getLogger(__name__)
+
+# min/max rounds pin the accepted cost, so hashes made with a different cost are flagged for rehash
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__rounds=settings.bcrypt_rounds,
+    bcrypt__min_rounds=settings.bcrypt_rounds,
+    bcrypt__max_rounds=settings.bcrypt_rounds
+)
 security = HTTPBearer()
 
+# bcrypt is CPU-bound (~100-300 ms per call) and releases the GIL, so it runs on a
+# small dedicated pool instead of the event loop thread or Starlette's shared threadpool
+_password_executor = ThreadPoolExecutor(
+    max_workers=settings.password_hash_workers,
+    thread_name_prefix="password-hash"
+)
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
+async def get_password_hash_async(password: str) -> str:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_password_executor, pwd_context.hash, password)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """
+    Verify off the event loop. Returns (valid, new_hash): `new_hash` is set when the stored
+    hash was made with a different bcrypt cost and should be replaced by the caller.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _password_executor, pwd_context.verify_and_update, plain_password, hashed_password
+    )
+
+async def verify_and_upgrade_password(user: User, plain_password: str, db: Session) -> bool:
+    """Verify a user's password, transparently re-hashing it if `bcrypt_rounds` has changed."""
+    valid, new_hash = await verify_password_async(plain_password, user.password)
+    if valid and new_hash:
+        user.password = new_hash
+        db.commit()
+    return valid
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
+    now = datetime.utcnow()
     if expires_delta:
-        expire = datetime.utcnow() + expires_delta
+        expire = now + expires_delta
     else:
-        expire = datetime.utcnow() + timedelta(minutes=settings.jwt_access_token_expire_minutes)
-    to_encode.update({"exp": expire})
+        expire = now + timedelta(minutes=settings.jwt_access_token_expire_minutes)
+    # jti identifies the token for revocation, iat lets a user-wide revocation cut off older tokens
+    to_encode.update({"exp": expire, "iat": now, "jti": uuid.uuid4().hex})
     encoded_jwt = jwt.encode(to_encode, settings.jwt_secret_key, algorithm=settings.jwt_algorithm)
     return encoded_jwt
 
-def verify_token(token: str) -> Optional[dict]:
+def _jose_decode(token: str) -> Optional[dict]:
     try:
-        payload = jwt.decode(token, settings.jwt_secret_key, algorithms=[settings.jwt_algorithm])
-        return payload
+        return jwt.decode(token, settings.jwt_secret_key, algorithms=[settings.jwt_algorithm])
     except JWTError:
         return None
 
+def _select_jwt_decoder():
+    """Optional faster backend: PyJWT (`pip install PyJWT`, JWT_BACKEND=pyjwt)."""
+    if settings.jwt_backend == "pyjwt":
+        try:
+            import jwt as pyjwt
+        except ImportError:
+            logger.warning("JWT_BACKEND=pyjwt but PyJWT is not installed; using python-jose")
+        else:
+            def _pyjwt_decode(token: str) -> Optional[dict]:
+                try:
+                    return pyjwt.decode(token, settings.jwt_secret_key, algorithms=[settings.jwt_algorithm])
+                except pyjwt.PyJWTError:
+                    return None
+            return _pyjwt_decode
+    return _jose_decode
+
+_decode_jwt = _select_jwt_decoder()
+
+class TokenCache:
+    """
+    Bounded LRU of validated claims keyed by the token's SHA-256 digest.
+    Entries are dropped once the token's `exp` has passed, so the cache never
+    extends a token's lifetime.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[bytes, dict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, digest: bytes) -> Optional[dict]:
+        with self._lock:
+            payload = self._entries.get(digest)
+            if payload is None:
+                return None
+            if payload.get("exp", 0) <= time.time():
+                del self._entries[digest]
+                return None
+            self._entries.move_to_end(digest)
+            return payload
+
+    def put(self, digest: bytes, payload: dict):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[digest] = payload
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+_token_cache = TokenCache(settings.jwt_cache_size)
+
+def verify_token(token: str) -> Optional[dict]:
+    digest = hashlib.sha256(token.encode()).digest()
+    payload = _token_cache.get(digest)
+    if payload is not None:
+        return payload
+    payload = _decode_jwt(token)
+    if payload is not None:
+        _token_cache.put(digest, payload)
+    return payload
+
+def _revoked_jti_key(jti: str) -> str:
+    return f"revoked:jti:{jti}"
+
+def _revoked_user_key(user_id) -> str:
+    return f"revoked:user:{user_id}"
+
+async def is_token_revoked(payload: dict) -> bool:
+    """O(1) check against the revocation set: one MGET for the token id and the user-wide cutoff."""
+    jti = payload.get("jti")
+    keys = [_revoked_user_key(payload.get("sub"))]
+    if jti:
+        keys.append(_revoked_jti_key(jti))
+    values = await redis_client.mget(keys)
+    revoked_before = values[0]
+    # `iat` is truncated to whole seconds, so a token from the revocation's own second counts as older
+    if revoked_before is not None and payload.get("iat", 0) <= float(revoked_before):
+        return True
+    return len(values) > 1 and values[1] is not None
+
+async def revoke_token(payload: dict):
+    """Revoke a single token until it would have expired anyway (logout)."""
+    jti = payload.get("jti")
+    if not jti:
+        return
+    ttl = int(payload.get("exp", 0) - time.time())
+    if ttl > 0:
+        await redis_client.set(_revoked_jti_key(jti), "1", expire=ttl)
+
+async def revoke_user_tokens(user_id):
+    """Revoke every token issued to the user before now (password change)."""
+    max_lifetime = max(settings.jwt_access_token_expire_minutes, 1440) * 60
+    await redis_client.set(_revoked_user_key(user_id), repr(time.time()), expire=max_lifetime)
+
 def generate_otp() -> str:
     """Generate a 6-digit OTP"""
     return ''.join(random.choices(string.digits, k=6))
@@ -63,7 +207,10 @@ async def get_current_user(
     except JWTError:
         raise credentials_exception
     
-    user = db.query(User).filter(User.id == user_id).first()
+    if await is_token_revoked(payload):
+        raise credentials_exception
+    
+    user = db.query(User).filter(User.id == user_id, User.deleted_at.is_(None)).first()
     if user is None:
         raise credentials_exception
     
@@ -72,4 +219,12 @@ async def get_current_user(
 def get_current_active_user(current_user: User = Depends(get_current_user)) -> User:
     if not current_user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
-    return current_user
\ No newline at end of file
+    return current_user
+
+def get_admin_access(x_admin_key: Optional[str] = Header(None)) -> bool:
+    """Admin endpoints authenticate with the shared `ADMIN_API_KEY` in the X-Admin-Key header."""
+    if not settings.admin_api_key:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin API is disabled")
+    if not x_admin_key or not hmac.compare_digest(x_admin_key, settings.admin_api_key):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid admin key")
+    return True
\ No newline at end of file
@@ -0,0 +1,156 @@
+"""
+Value encoding for Redis.
+
+Every value written through `RedisClient` (and the two-tier cache) starts with
+one header byte:
+
+    0x00 raw bytes          0x01 JSON (orjson or stdlib)          0x02 msgpack
+    | 0x80 when the payload after the header is zstd-compressed
+
+Payloads of at least `REDIS_COMPRESSION_THRESHOLD` bytes are compressed when
+that makes them smaller. `REDIS_SERIALIZER` picks the format for new writes
+("orjson" by default, "json", or "msgpack" with `pip install msgpack`); reads
+follow the header, so formats can be switched without flushing Redis. Values
+without a header (plain JSON text written before this encoding) still decode.
+"""
+import json
+import logging
+import threading
+from datetime import date, datetime
+from enum import Enum
+from typing import Any
+import orjson
+import zstandard
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+RAW = 0x00
+JSON = 0x01
+MSGPACK = 0x02
+COMPRESSED = 0x80
+
+
+def _default(value: Any) -> Any:
+    """Fallback for types the serializers do not know (matches the previous `default=str`)."""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Enum):
+        return value.value
+    return str(value)
+
+
+class JSONSerializer:
+    """Standard library json, as `set_json` used before; slower, kept for benchmarks and debugging."""
+    name = "json"
+    header = JSON
+
+    def dumps(self, value: Any) -> bytes:
+        return json.dumps(value, default=_default).encode("utf-8")
+
+    def loads(self, data: bytes) -> Any:
+        return orjson.loads(data)
+
+
+class OrjsonSerializer:
+    name = "orjson"
+    header = JSON
+
+    def dumps(self, value: Any) -> bytes:
+        return orjson.dumps(value, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+    def loads(self, data: bytes) -> Any:
+        return orjson.loads(data)
+
+
+class MsgpackSerializer:
+    name = "msgpack"
+    header = MSGPACK
+
+    def __init__(self):
+        import msgpack
+        self._msgpack = msgpack
+
+    def dumps(self, value: Any) -> bytes:
+        return self._msgpack.packb(value, default=_default, datetime=False)
+
+    def loads(self, data: bytes) -> Any:
+        return self._msgpack.unpackb(data, raw=False, strict_map_key=False)
+
+
+def _select_serializer():
+    if settings.redis_serializer == "msgpack":
+        try:
+            return MsgpackSerializer()
+        except ImportError:
+            logger.warning("REDIS_SERIALIZER=msgpack but msgpack is not installed; using orjson")
+    if settings.redis_serializer == "json":
+        return JSONSerializer()
+    return OrjsonSerializer()
+
+
+class ValueCodec:
+    """Header-tagged encoding shared by `RedisClient` and the two-tier cache."""
+
+    def __init__(self, serializer=None, compression_threshold: int = None, compression_level: int = None):
+        self.serializer = serializer or _select_serializer()
+        self.compression_threshold = (
+            settings.redis_compression_threshold if compression_threshold is None else compression_threshold
+        )
+        self.compression_level = (
+            settings.redis_compression_level if compression_level is None else compression_level
+        )
+        self._local = threading.local()
+        self._msgpack = None
+
+    def _compressor(self) -> zstandard.ZstdCompressor:
+        # zstd contexts are not thread-safe: one per thread
+        compressor = getattr(self._local, "compressor", None)
+        if compressor is None:
+            compressor = self._local.compressor = zstandard.ZstdCompressor(level=self.compression_level)
+        return compressor
+
+    def _decompressor(self) -> zstandard.ZstdDecompressor:
+        decompressor = getattr(self._local, "decompressor", None)
+        if decompressor is None:
+            decompressor = self._local.decompressor = zstandard.ZstdDecompressor()
+        return decompressor
+
+    def encode(self, value: Any) -> bytes:
+        if isinstance(value, bytes):
+            header, payload = RAW, value
+        else:
+            header, payload = self.serializer.header, self.serializer.dumps(value)
+        if self.compression_threshold and len(payload) >= self.compression_threshold:
+            compressed = self._compressor().compress(payload)
+            if len(compressed) < len(payload):
+                return bytes((header | COMPRESSED,)) + compressed
+        return bytes((header,)) + payload
+
+    @staticmethod
+    def has_header(data: bytes) -> bool:
+        return bool(data) and (data[0] & ~COMPRESSED) in (RAW, JSON, MSGPACK)
+
+    def decode(self, data: bytes) -> Any:
+        if not data:
+            return None
+        if not self.has_header(data):
+            # Plain JSON text written before this encoding
+            return orjson.loads(data)
+        header = data[0]
+        kind = header & ~COMPRESSED
+        payload = data[1:]
+        if header & COMPRESSED:
+            payload = self._decompressor().decompress(payload)
+        if kind == RAW:
+            return payload
+        if kind == JSON:
+            return orjson.loads(payload)
+        if isinstance(self.serializer, MsgpackSerializer):
+            return self.serializer.loads(payload)
+        if self._msgpack is None:
+            self._msgpack = MsgpackSerializer()
+        return self._msgpack.loads(payload)
+
+
+codec = ValueCodec()
@@ -1,44 +1,17 @@
 import stripe
-from typing import Dict, Any
+import hashlib
+import hmac
+import time
+import uuid
+from typing import Dict, Any, Iterator, List
 from app.config import settings
 import logging
 
 logger = logging.getLogger(__name__)
 
-class StripeClient:
-    def __init__(self):
-        stripe.api_key = settings.stripe_secret_key
-        self.webhook_secret = settings.stripe_webhook_secret
-        self.pro_price_id = settings.stripe_pro_price_id
-    
-    def create_checkout_session(self, user_id: str, customer_email: str = None) -> Dict[str, Any]:
-        """
-        Create Stripe checkout session for Pro subscription.
-        """
-        try:
-            logger.debug(f"Stripe module before session create: {stripe}")
-            session = stripe.checkout.Session.create(
-                payment_method_types=['card'],
-                line_items=[{
-                    'price': self.pro_price_id,
-                    'quantity': 1,
-                }],
-                mode='subscription',
-                success_url='https://autoverse.site?session_id={CHECKOUT_SESSION_ID}',
-                cancel_url='https://autoverse.site',
-                metadata={
-                    'user_id': user_id
-                },
-                customer_email=customer_email,
-            )
-            
-            return {
-                'checkout_url': session.url,
-                'session_id': session.id
-            }
-        except Exception as e:
-            logger.error(f"Stripe checkout error: {str(e)}")
-            raise
+class WebhookVerifier:
+    """Stripe-Signature checks (HMAC-SHA256 with the endpoint secret); no network calls."""
+    webhook_secret: str
 
     def verify_webhook_signature(self, payload: bytes, signature: str) -> bool:
         """
@@ -65,4 +38,135 @@ class StripeClient:
         )
 
 
-stripe_client = StripeClient()
+class StripeClient(WebhookVerifier):
+    def __init__(self):
+        stripe.api_key = settings.stripe_secret_key
+        # One pooled httpx client (sync and async) shared by every Stripe call in the process
+        stripe.default_http_client = stripe.HTTPXClient(
+            timeout=settings.stripe_request_timeout,
+            allow_sync_methods=True
+        )
+        self.webhook_secret = settings.stripe_webhook_secret
+        self.pro_price_id = settings.stripe_pro_price_id
+
+    def _checkout_params(self, user_id: str, customer_email: str = None) -> Dict[str, Any]:
+        return dict(
+            payment_method_types=['card'],
+            line_items=[{
+                'price': self.pro_price_id,
+                'quantity': 1,
+            }],
+            mode='subscription',
+            success_url='https://autoverse.site?session_id={CHECKOUT_SESSION_ID}',
+            cancel_url='https://autoverse.site',
+            metadata={
+                'user_id': user_id
+            },
+            customer_email=customer_email,
+        )
+
+    @staticmethod
+    def _session_result(session) -> Dict[str, Any]:
+        return {
+            'checkout_url': session.url,
+            'session_id': session.id,
+            'expires_at': session.expires_at
+        }
+    
+    def create_checkout_session(self, user_id: str, customer_email: str = None) -> Dict[str, Any]:
+        """
+        Create Stripe checkout session for Pro subscription.
+        """
+        try:
+            session = stripe.checkout.Session.create(**self._checkout_params(user_id, customer_email))
+            return self._session_result(session)
+        except Exception as e:
+            logger.error(f"Stripe checkout error: {str(e)}")
+            raise
+
+    async def create_checkout_session_async(self, user_id: str, customer_email: str = None) -> Dict[str, Any]:
+        """
+        Same as `create_checkout_session`, without blocking the event loop.
+        """
+        try:
+            session = await stripe.checkout.Session.create_async(**self._checkout_params(user_id, customer_email))
+            return self._session_result(session)
+        except Exception as e:
+            logger.error(f"Stripe checkout error: {str(e)}")
+            raise
+
+    def iter_subscriptions(self, page_size: int = 100) -> Iterator[Dict[str, Any]]:
+        """
+        Yield every subscription (all statuses), fetching pages lazily. StripeObjects
+        are dict subclasses, so callers can treat them like webhook payloads.
+        """
+        pages = stripe.Subscription.list(status="all", limit=page_size)
+        yield from pages.auto_paging_iter()
+
+
+class StubStripeClient(WebhookVerifier):
+    """
+    In-process stand-in for local development and tests (STRIPE_BACKEND=stub).
+    No network calls: checkout sessions are generated locally and recorded in
+    `self.sessions`. Webhooks are verified exactly like the live client's, against
+    STRIPE_WEBHOOK_SECRET; `sign_payload` produces the header for test events.
+    """
+
+    def __init__(self):
+        self.webhook_secret = settings.stripe_webhook_secret
+        self.pro_price_id = settings.stripe_pro_price_id
+        self.sessions: Dict[str, Dict[str, Any]] = {}
+        self.subscriptions: List[Dict[str, Any]] = []
+
+    def add_subscription(self, subscription_id: str, customer: str, status: str = "active",
+                         current_period_start: int = None, current_period_end: int = None) -> Dict[str, Any]:
+        """Seed a subscription returned by `iter_subscriptions`."""
+        now = int(time.time())
+        subscription = {
+            'id': subscription_id,
+            'object': 'subscription',
+            'customer': customer,
+            'status': status,
+            'current_period_start': current_period_start or now,
+            'current_period_end': current_period_end or now + 30 * 24 * 3600,
+        }
+        self.subscriptions.append(subscription)
+        return subscription
+
+    def create_checkout_session(self, user_id: str, customer_email: str = None) -> Dict[str, Any]:
+        session_id = f"cs_test_stub_{uuid.uuid4().hex}"
+        result = {
+            'checkout_url': f"https://checkout.stripe.test/c/pay/{session_id}",
+            'session_id': session_id,
+            'expires_at': int(time.time()) + 24 * 3600
+        }
+        self.sessions[session_id] = {**result, 'user_id': user_id, 'customer_email': customer_email}
+        return result
+
+    async def create_checkout_session_async(self, user_id: str, customer_email: str = None) -> Dict[str, Any]:
+        return self.create_checkout_session(user_id, customer_email)
+
+    def iter_subscriptions(self, page_size: int = 100) -> Iterator[Dict[str, Any]]:
+        return iter(list(self.subscriptions))
+
+    def sign_payload(self, payload: bytes, timestamp: int = None) -> str:
+        """Stripe-Signature header value for `payload`, as Stripe would send it."""
+        timestamp = int(time.time()) if timestamp is None else timestamp
+        signed = f"{timestamp}.".encode("utf-8") + payload
+        signature = hmac.new(self.webhook_secret.encode("utf-8"), signed, hashlib.sha256).hexdigest()
+        return f"t={timestamp},v1={signature}"
+
+
+def _create_stripe_client():
+    if settings.stripe_backend == "stub":
+        # The stub grants Pro through webhooks without any payment: never in production
+        if not settings.debug:
+            raise RuntimeError("STRIPE_BACKEND=stub is only allowed with DEBUG=true")
+        if not settings.stripe_webhook_secret:
+            raise RuntimeError("STRIPE_BACKEND=stub needs STRIPE_WEBHOOK_SECRET to verify webhook signatures")
+        logger.warning("Using the in-process Stripe stub (STRIPE_BACKEND=stub); no payments are processed")
+        return StubStripeClient()
+    return StripeClient()
+
+
+stripe_client = _create_stripe_client()
@@ -0,0 +1,256 @@
+"""
+Stripe webhook event processing.
+
+The webhook endpoint only verifies the signature and records the event in
+`stripe_events` (the event id is the primary key, so Stripe retries are no-ops).
+`app.tasks.process_stripe_events` then applies a customer's pending events here,
+oldest first, one transaction per event.
+"""
+from datetime import datetime
+from typing import Callable, Dict, Optional
+from dateutil.relativedelta import relativedelta
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session
+import pytz
+import logging
+import uuid
+from app.checkout import invalidate_checkout_session_sync
+from app.config import settings
+from app.entitlements import invalidate_entitlements_sync
+from app.models import User, Subscription, SubscriptionTier, SubscriptionStatus, StripeEvent, StripeEventStatus
+
+logger = logging.getLogger(__name__)
+
+# Stripe subscription status -> local status
+STATUS_MAP = {
+    "active": SubscriptionStatus.ACTIVE,
+    "trialing": SubscriptionStatus.ACTIVE,
+    "past_due": SubscriptionStatus.PAST_DUE,
+    "unpaid": SubscriptionStatus.PAST_DUE,
+    "canceled": SubscriptionStatus.CANCELLED,
+    "incomplete": SubscriptionStatus.INACTIVE,
+    "incomplete_expired": SubscriptionStatus.INACTIVE,
+    "paused": SubscriptionStatus.INACTIVE,
+}
+
+
+class UnhandledEvent(Exception):
+    """Raised by handlers when an event is valid but has nothing to apply locally."""
+
+
+def ordering_key_for(event: dict) -> str:
+    """Events are serialized per Stripe customer; fall back to the event id when there is none."""
+    obj = event.get("data", {}).get("object", {})
+    customer = obj.get("customer")
+    if isinstance(customer, dict):
+        customer = customer.get("id")
+    return customer or obj.get("metadata", {}).get("user_id") or event["id"]
+
+
+def _timestamp(value) -> Optional[datetime]:
+    if not value:
+        return None
+    return datetime.fromtimestamp(int(value), tz=pytz.UTC)
+
+
+def subscription_period(obj: dict):
+    """Period bounds live on the subscription in older API versions and on its items in newer ones."""
+    start, end = obj.get("current_period_start"), obj.get("current_period_end")
+    if not end:
+        items = (obj.get("items") or {}).get("data") or []
+        if items:
+            start, end = items[0].get("current_period_start"), items[0].get("current_period_end")
+    return _timestamp(start), _timestamp(end)
+
+
+def _invoice_subscription_id(invoice: dict) -> Optional[str]:
+    subscription_id = invoice.get("subscription")
+    if not subscription_id:
+        details = (invoice.get("parent") or {}).get("subscription_details") or {}
+        subscription_id = details.get("subscription")
+    if isinstance(subscription_id, dict):
+        subscription_id = subscription_id.get("id")
+    return subscription_id
+
+
+def _find_subscription(db: Session, stripe_subscription_id: Optional[str]) -> Subscription:
+    subscription = None
+    if stripe_subscription_id:
+        subscription = db.query(Subscription).filter(
+            Subscription.stripe_subscription_id == stripe_subscription_id
+        ).first()
+    if not subscription:
+        raise UnhandledEvent(f"no local subscription for {stripe_subscription_id}")
+    return subscription
+
+
+def handle_checkout_session_completed(db: Session, session_data: dict):
+    """
+    Upgrade the user's most recent subscription to PRO if payment succeeded.
+    Sets current_period_start = now, current_period_end = now + 1 month.
+    Never creates a duplicate Subscription row for the user.
+    """
+    user_id = session_data.get('metadata', {}).get('user_id')
+    stripe_customer_id = session_data.get('customer')
+    stripe_subscription_id = session_data.get('subscription')
+    payment_status = session_data.get('payment_status')
+    if user_id:
+        invalidate_checkout_session_sync(user_id)
+    if not user_id or not stripe_subscription_id:
+        raise UnhandledEvent("missing user_id or subscription in checkout.session.completed payload")
+    try:
+        user_uuid = uuid.UUID(str(user_id))
+    except ValueError:
+        raise UnhandledEvent(f"invalid user_id {user_id!r} in checkout.session.completed payload")
+    user = db.query(User).filter(User.id == user_uuid).first()
+    if not user:
+        raise UnhandledEvent(f"user {user_id} not found")
+    if payment_status != "paid":
+        raise UnhandledEvent(f"payment for user {user_id} not marked as paid")
+
+    # Set now as start, next month as end via relativedelta for calendar correctness
+    now = datetime.utcnow().replace(tzinfo=pytz.UTC)
+    next_month = now + relativedelta(months=1)
+
+    # Find the latest subscription for this user (any plan type)
+    subscription = db.query(Subscription).filter(
+        Subscription.user_id == user.id
+    ).order_by(Subscription.created_at.desc()).first()
+    if subscription:
+        subscription.plan_type = SubscriptionTier.PRO
+        subscription.status = SubscriptionStatus.ACTIVE
+        subscription.stripe_subscription_id = stripe_subscription_id
+        subscription.stripe_customer_id = stripe_customer_id
+        subscription.current_period_start = now
+        subscription.current_period_end = next_month
+        logger.info(f"Upgraded subscription ({subscription.id}) to PRO for user {user_id}.")
+    else:
+        db.add(Subscription(
+            user_id=user.id,
+            plan_type=SubscriptionTier.PRO,
+            stripe_subscription_id=stripe_subscription_id,
+            stripe_customer_id=stripe_customer_id,
+            status=SubscriptionStatus.ACTIVE,
+            current_period_start=now,
+            current_period_end=next_month
+        ))
+        logger.info(f"Created new PRO subscription for user {user_id}.")
+    return user.id
+
+
+def handle_checkout_session_expired(db: Session, session_data: dict):
+    """Drop the cached session so the next upgrade request creates a fresh one."""
+    user_id = session_data.get('metadata', {}).get('user_id')
+    if not user_id:
+        raise UnhandledEvent("missing user_id in checkout.session.expired payload")
+    invalidate_checkout_session_sync(user_id)
+
+
+def handle_subscription_updated(db: Session, obj: dict):
+    """Sync status and billing period (covers renewals, scheduled cancellations and past_due)."""
+    subscription = _find_subscription(db, obj.get("id"))
+    status = STATUS_MAP.get(obj.get("status"))
+    if status is None:
+        raise UnhandledEvent(f"unknown subscription status {obj.get('status')}")
+    start, end = subscription_period(obj)
+    subscription.status = status
+    if status in (SubscriptionStatus.ACTIVE, SubscriptionStatus.PAST_DUE):
+        subscription.plan_type = SubscriptionTier.PRO
+    if start and end:
+        subscription.current_period_start = start
+        subscription.current_period_end = end
+    logger.info(f"Subscription {subscription.id} synced from Stripe: {status.value}")
+    return subscription.user_id
+
+
+def handle_subscription_deleted(db: Session, obj: dict):
+    subscription = _find_subscription(db, obj.get("id"))
+    subscription.status = SubscriptionStatus.CANCELLED
+    subscription.plan_type = SubscriptionTier.BASIC
+    subscription.current_period_end = _timestamp(obj.get("ended_at")) or datetime.utcnow().replace(tzinfo=pytz.UTC)
+    logger.info(f"Subscription {subscription.id} cancelled; downgraded to BASIC")
+    return subscription.user_id
+
+
+def handle_invoice_paid(db: Session, invoice: dict):
+    """Renewal: extend the period to the end of the paid invoice line."""
+    subscription = _find_subscription(db, _invoice_subscription_id(invoice))
+    lines = (invoice.get("lines") or {}).get("data") or []
+    period = lines[0].get("period", {}) if lines else {}
+    subscription.plan_type = SubscriptionTier.PRO
+    subscription.status = SubscriptionStatus.ACTIVE
+    if period.get("end"):
+        subscription.current_period_start = _timestamp(period.get("start"))
+        subscription.current_period_end = _timestamp(period.get("end"))
+    logger.info(f"Subscription {subscription.id} renewed until {subscription.current_period_end}")
+    return subscription.user_id
+
+
+def handle_invoice_payment_failed(db: Session, invoice: dict):
+    subscription = _find_subscription(db, _invoice_subscription_id(invoice))
+    subscription.status = SubscriptionStatus.PAST_DUE
+    logger.warning(f"Payment failed for subscription {subscription.id}; marked past_due")
+    return subscription.user_id
+
+
+# Handlers return the id of the user whose plan may have changed (or None)
+EVENT_HANDLERS: Dict[str, Callable[[Session, dict], Optional[object]]] = {
+    "checkout.session.completed": handle_checkout_session_completed,
+    "checkout.session.expired": handle_checkout_session_expired,
+    "customer.subscription.created": handle_subscription_updated,
+    "customer.subscription.updated": handle_subscription_updated,
+    "customer.subscription.deleted": handle_subscription_deleted,
+    "invoice.paid": handle_invoice_paid,
+    "invoice.payment_succeeded": handle_invoice_paid,
+    "invoice.payment_failed": handle_invoice_payment_failed,
+}
+
+
+def process_pending_events(db: Session, ordering_key: str) -> dict:
+    """
+    Apply pending (and previously failed) events for one ordering key, oldest first.
+    Stops at the first failure so later events are never applied before earlier ones;
+    the exception propagates so the caller can retry. Events that failed
+    `stripe_event_max_attempts` times are left as FAILED and skipped (dead-lettered).
+    """
+    summary = {"processed": 0, "ignored": 0}
+    events = db.query(StripeEvent).filter(
+        StripeEvent.ordering_key == ordering_key,
+        or_(
+            StripeEvent.status == StripeEventStatus.PENDING,
+            and_(
+                StripeEvent.status == StripeEventStatus.FAILED,
+                StripeEvent.attempts < settings.stripe_event_max_attempts
+            )
+        )
+    ).order_by(StripeEvent.stripe_created, StripeEvent.received_at).all()
+    for event in events:
+        event_id, event_type = event.id, event.type
+        handler = EVENT_HANDLERS.get(event_type)
+        affected_user_id = None
+        try:
+            if handler is None:
+                raise UnhandledEvent("no handler for event type")
+            affected_user_id = handler(db, event.payload)
+            event.status = StripeEventStatus.PROCESSED
+            summary["processed"] += 1
+        except UnhandledEvent as e:
+            logger.info(f"Ignored Stripe event {event_id} ({event_type}): {e}")
+            event.status = StripeEventStatus.IGNORED
+            event.last_error = str(e)
+            summary["ignored"] += 1
+        except Exception as e:
+            db.rollback()
+            db.query(StripeEvent).filter(StripeEvent.id == event_id).update({
+                StripeEvent.status: StripeEventStatus.FAILED,
+                StripeEvent.attempts: StripeEvent.attempts + 1,
+                StripeEvent.last_error: str(e)
+            })
+            db.commit()
+            raise
+        event.attempts = (event.attempts or 0) + 1
+        event.processed_at = datetime.utcnow().replace(tzinfo=pytz.UTC)
+        db.commit()
+        if affected_user_id:
+            invalidate_entitlements_sync([affected_user_id])
+    return summary
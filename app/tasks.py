@@ -1,8 +1,27 @@
 from celery import current_task
 from app.celery_app import celery_app
-from app.database import SessionLocal
-from app.models import Message, MessageType, ProcessingStatus
+from app.database import SessionLocal, engine
+from app.models import Message, MessageType, ProcessingStatus, OTPAuditEvent, StripeEvent, StripeEventStatus
+from app.stripe_events import process_pending_events
+from app.entitlements import downgrade_lapsed_subscriptions as downgrade_lapsed
+from app.reconciliation import reconcile_subscriptions
+from app.rollups import refresh_rollups
+from app.stripe_client import stripe_client
 from app.gemini_client import gemini_client
+from app.etag import MESSAGE_VALIDATOR_TTL, message_etag_key, message_etag, store_validator_sync
+from app.cache import cache
+from app.chatroom_cache import chatroom_changed_keys
+from app.counters import increment_message_count, recount_message_counts
+from app.search import message_search_vector
+from app.export import delete_expired_exports as delete_expired_export_files, write_export
+from app.partitions import maintain_partitions
+from app import purge
+from app.redis_client import redis_client
+from app.otp import OTP_AUDIT_KEY
+from app.config import settings
+from sqlalchemy import insert
+from datetime import datetime, timedelta
+import json
 import time
 import logging
 
@@ -14,20 +33,20 @@ def process_gemini_message(self, message_id: str, content: str, context: list =
 
     Always updates the DB to prevent 'stuck' messages.
     """
-    from app.config import settings
-    logger.info(f"[CELERY] Using DATABASE_URL: {settings.database_url}")
     db = SessionLocal()
     start_time = time.time()
     try:
         message = db.query(Message).filter(Message.id == message_id).first()
-        logger.info(f"[CELERY] Fetched message id={message_id}: {message}")
         if not message:
             logger.error(f"[CELERY] Message {message_id} not found!")
             return {"error": "Message not found"}
 
         message.processing_status = ProcessingStatus.PROCESSING
+        validator_key = message_etag_key(message.user_id, message.id)
+        validator = message_etag(message)
         db.commit()
-        logger.info(f"[CELERY] Set message {message_id} status to PROCESSING.")
+        store_validator_sync(validator_key, validator, MESSAGE_VALIDATOR_TTL)
+        logger.debug("[CELERY] Set message %s status to PROCESSING.", message_id)
 
         # Build Gemini-style conversation context
         conversation_context = []
@@ -40,7 +59,7 @@ def process_gemini_message(self, message_id: str, content: str, context: list =
                         "parts": [{"text": ctx_msg["content"]}]
                     })
                 except Exception as e:
-                    logger.error(f"[CELERY] Bad context at {i}: {ctx_msg} ({str(e)})")
+                    logger.error("[CELERY] Bad context at %d for message %s: %s", i, message_id, e)
         # Always append current user message as last turn
         if content and isinstance(content, str) and content.strip():
             conversation_context.append({
@@ -50,21 +69,21 @@ def process_gemini_message(self, message_id: str, content: str, context: list =
         else:
             logger.warning(f"[CELERY] Empty or no user content for message {message_id}")
 
-        logger.info(f"[CELERY] Final conversation_context: {conversation_context}")
+        logger.debug("[CELERY] Conversation context for %s has %d turns", message_id, len(conversation_context))
 
         # Always call Gemini with both content and context for best result
         if not content or not content.strip():
             response = "[Cannot process: empty user message.]"
         else:
-            logger.info(f"{content} {conversation_context}")
             response = gemini_client.generate_response(content, conversation_context)
-            logger.info(f"[CELERY] Gemini response: {response!r}")
+            logger.debug("[CELERY] Gemini response for %s: %d chars", message_id, len(response))
 
         # Always finish the DB update, even for error/fallbacks
         message.ai_response = response
         message.processing_status = ProcessingStatus.COMPLETED
         processing_time = int((time.time() - start_time) * 1000)
         message.processing_time_ms = processing_time
+        message.search_vector = message_search_vector(message.content, response)
 
         ai_message = Message(
             chatroom_id=message.chatroom_id,
@@ -75,9 +94,16 @@ def process_gemini_message(self, message_id: str, content: str, context: list =
             processing_time_ms=processing_time
         )
         db.add(ai_message)
+        db.flush()
+        increment_message_count(db, message.chatroom_id)
+        validator = message_etag(message)
+        chatroom_keys = chatroom_changed_keys(message.user_id, message.chatroom_id)
         db.commit()
+        store_validator_sync(validator_key, validator, MESSAGE_VALIDATOR_TTL)
+        # The AI reply changed the chatroom's message_count
+        cache.delete_sync(*chatroom_keys)
 
-        logger.info(f"[CELERY] Successfully processed message {message_id} in {processing_time}ms")
+        logger.info("[CELERY] Successfully processed message %s in %dms", message_id, processing_time)
         return {
             "success": True,
             "message_id": str(message.id),
@@ -93,9 +119,242 @@ def process_gemini_message(self, message_id: str, content: str, context: list =
             if msg:
                 msg.processing_status = ProcessingStatus.COMPLETED
                 msg.ai_response = "Sorry, an internal error occurred. Please try again."
+                validator_key, validator = message_etag_key(msg.user_id, msg.id), message_etag(msg)
                 db.commit()
+                store_validator_sync(validator_key, validator, MESSAGE_VALIDATOR_TTL)
         except Exception as inner:
             logger.error(f"[CELERY] Could not update message on fatal error: {inner}")
         return {"error": str(e)}
     finally:
         db.close()
+
+
+@celery_app.task
+def flush_otp_audit():
+    """Drain OTP audit records from Redis into Postgres with batched inserts.
+
+    Records are trimmed from Redis only after the batch is committed, so a failed
+    insert is retried on the next run (at-least-once).
+    """
+    batch_size = settings.otp_audit_batch_size
+    total = 0
+    db = SessionLocal()
+    try:
+        while True:
+            raw = redis_client.client.lrange(OTP_AUDIT_KEY, 0, batch_size - 1)
+            if not raw:
+                break
+            rows = []
+            for item in raw:
+                try:
+                    record = json.loads(item)
+                    rows.append({
+                        "mobile_number": record["mobile_number"],
+                        "event": record["event"],
+                        "outcome": record["outcome"],
+                        "attempt_count": int(record.get("attempt_count", 0)),
+                        "created_at": datetime.fromisoformat(record["created_at"])
+                    })
+                except Exception as e:
+                    logger.error("[CELERY] Skipping malformed OTP audit record: %s", e)
+            if rows:
+                db.execute(insert(OTPAuditEvent), rows)
+                db.commit()
+            redis_client.client.ltrim(OTP_AUDIT_KEY, len(raw), -1)
+            total += len(rows)
+            if len(raw) < batch_size:
+                break
+    finally:
+        db.close()
+    if total:
+        logger.info("[CELERY] Flushed %d OTP audit records", total)
+    return {"flushed": total}
+
+
+@celery_app.task(bind=True, max_retries=8)
+def process_stripe_events(self, ordering_key: str):
+    """Apply a Stripe customer's pending webhook events in order.
+
+    A per-customer Redis lock serializes workers, so events for one customer are
+    never applied concurrently or out of order; different customers run in parallel.
+    """
+    lock = redis_client.client.lock(f"lock:stripe-events:{ordering_key}", timeout=120, blocking_timeout=10)
+    if not lock.acquire():
+        raise self.retry(countdown=5)
+    db = SessionLocal()
+    try:
+        summary = process_pending_events(db, ordering_key)
+    except Exception as e:
+        logger.error("[CELERY] Stripe events for %s failed: %s", ordering_key, e)
+        raise self.retry(countdown=min(30 * 2 ** self.request.retries, 3600))
+    finally:
+        db.close()
+        try:
+            lock.release()
+        except Exception:
+            pass
+    if summary["processed"] or summary["ignored"]:
+        logger.info("[CELERY] Stripe events for %s: %s", ordering_key, summary)
+    return summary
+
+
+@celery_app.task
+def requeue_stripe_events():
+    """Safety net: re-enqueue customers whose events are still pending or failed (e.g. lost enqueue)."""
+    db = SessionLocal()
+    try:
+        cutoff = datetime.utcnow() - timedelta(minutes=1)
+        keys = [key for (key,) in db.query(StripeEvent.ordering_key).filter(
+            StripeEvent.status.in_([StripeEventStatus.PENDING, StripeEventStatus.FAILED]),
+            StripeEvent.received_at < cutoff,
+            StripeEvent.attempts < settings.stripe_event_max_attempts
+        ).distinct().limit(1000)]
+    finally:
+        db.close()
+    for key in keys:
+        process_stripe_events.delay(key)
+    return {"requeued": len(keys)}
+
+
+@celery_app.task
+def downgrade_lapsed_subscriptions():
+    """Bulk-downgrade Pro subscriptions whose paid period (plus grace) has ended."""
+    db = SessionLocal()
+    try:
+        count = downgrade_lapsed(db)
+    finally:
+        db.close()
+    if count:
+        logger.info("[CELERY] Downgraded %d lapsed subscription(s) to BASIC", count)
+    return {"downgraded": count}
+
+
+@celery_app.task
+def reconcile_stripe_subscriptions():
+    """Page through all Stripe subscriptions and correct drifted local rows."""
+    lock = redis_client.client.lock("lock:stripe-reconcile", timeout=6 * 3600, blocking_timeout=0)
+    if not lock.acquire():
+        logger.info("[CELERY] Stripe reconciliation already running; skipping")
+        return {"skipped": True}
+    db = SessionLocal()
+    try:
+        summary = reconcile_subscriptions(
+            db, stripe_client.iter_subscriptions(), settings.stripe_reconcile_chunk_size
+        )
+    finally:
+        db.close()
+        try:
+            lock.release()
+        except Exception:
+            pass
+    logger.info("[CELERY] Stripe reconciliation finished: %s", summary)
+    return summary
+
+
+@celery_app.task
+def refresh_usage_rollups():
+    """Fold recent usage into the weekly/monthly rollup tables."""
+    lock = redis_client.client.lock("lock:usage-rollups", timeout=3600, blocking_timeout=0)
+    if not lock.acquire():
+        return {"skipped": True}
+    db = SessionLocal()
+    try:
+        summary = refresh_rollups(db)
+    finally:
+        db.close()
+        try:
+            lock.release()
+        except Exception:
+            pass
+    logger.info("[CELERY] Usage rollups refreshed: %s", summary)
+    return summary
+
+
+@celery_app.task
+def maintain_message_partitions():
+    """Create upcoming monthly message partitions and archive expired ones."""
+    lock = redis_client.client.lock("lock:message-partitions", timeout=6 * 3600, blocking_timeout=0)
+    if not lock.acquire():
+        return {"skipped": True}
+    try:
+        summary = maintain_partitions(engine)
+    finally:
+        try:
+            lock.release()
+        except Exception:
+            pass
+    logger.info("[CELERY] Message partitions maintained: %s", summary)
+    return summary
+
+
+@celery_app.task
+def recount_chatroom_message_counts(batch_size: int = 1000):
+    """Backfill/repair: recompute every chatroom's message_count from the messages table."""
+    db = SessionLocal()
+    try:
+        summary = recount_message_counts(db, batch_size)
+    finally:
+        db.close()
+    logger.info("[CELERY] Recounted chatroom messages: %s", summary)
+    return summary
+
+
+@celery_app.task
+def export_user_data(user_id: str, gzip: bool = True):
+    """Write a user's NDJSON export to `settings.export_dir`."""
+    path = write_export(user_id, gzip)
+    return {"path": path}
+
+
+@celery_app.task
+def delete_expired_exports():
+    """Delete export files older than EXPORT_RETENTION."""
+    removed = delete_expired_export_files()
+    if removed:
+        logger.info("[CELERY] Deleted %d expired export file(s)", removed)
+    return {"deleted": removed}
+
+
+@celery_app.task(bind=True, max_retries=5)
+def purge_chatroom(self, chatroom_id: str):
+    """Remove a soft-deleted chatroom and its messages in bounded batches."""
+    db = SessionLocal()
+    try:
+        summary = purge.purge_chatroom(db, chatroom_id)
+    except Exception as e:
+        logger.error("[CELERY] Purge of chatroom %s failed: %s", chatroom_id, e)
+        raise self.retry(countdown=60)
+    finally:
+        db.close()
+    logger.info("[CELERY] Purged chatroom %s: %s", chatroom_id, summary)
+    return summary
+
+
+@celery_app.task(bind=True, max_retries=5)
+def purge_user(self, user_id: str):
+    """Remove a soft-deleted user and everything they own in bounded batches."""
+    db = SessionLocal()
+    try:
+        summary = purge.purge_user(db, user_id)
+    except Exception as e:
+        logger.error("[CELERY] Purge of user %s failed: %s", user_id, e)
+        raise self.retry(countdown=60)
+    finally:
+        db.close()
+    logger.info("[CELERY] Purged user %s: %s", user_id, summary)
+    return summary
+
+
+@celery_app.task
+def purge_deleted():
+    """Safety net: re-enqueue purges for soft-deleted rows that are still present."""
+    db = SessionLocal()
+    try:
+        chatroom_ids, user_ids = purge.pending_purges(db)
+    finally:
+        db.close()
+    for chatroom_id in chatroom_ids:
+        purge_chatroom.delay(str(chatroom_id))
+    for user_id in user_ids:
+        purge_user.delay(str(user_id))
+    return {"chatrooms": len(chatroom_ids), "users": len(user_ids)}
\ No newline at end of file
@@ -0,0 +1,355 @@
+import atexit
+import contextvars
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+
+
+def _new_id(nbytes: int) -> str:
+    return os.urandom(nbytes).hex()
+
+
+def parse_traceparent(header: Optional[str]) -> Optional[Tuple[str, str, bool]]:
+    """Parse a W3C `traceparent` header into (trace_id, parent_span_id, sampled)."""
+    if not header:
+        return None
+    parts = header.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        flags = int(parts[3], 16)
+        int(parts[1], 16)
+        int(parts[2], 16)
+    except ValueError:
+        return None
+    return parts[1], parts[2], bool(flags & 0x01)
+
+
+class Span:
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "sampled", "attributes",
+                 "start_ns", "end_ns", "error")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], sampled: bool,
+                 attributes: Optional[Dict[str, Any]] = None, start_ns: Optional[int] = None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = _new_id(8)
+        self.parent_id = parent_id
+        self.sampled = sampled
+        self.attributes = attributes or {}
+        self.start_ns = start_ns or time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.error: Optional[str] = None
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": round((self.end_ns - self.start_ns) / 1e6, 3) if self.end_ns else None,
+            "attributes": self.attributes,
+            "error": self.error,
+            "service": settings.tracing_service_name,
+        }
+
+
+class FileExporter:
+    """Append finished spans to a JSON-lines file."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def export(self, spans: List[Span]):
+        with open(self.path, "a", encoding="utf-8") as f:
+            for span in spans:
+                f.write(json.dumps(span.to_dict(), default=str))
+                f.write("\n")
+
+    def shutdown(self):
+        pass
+
+
+class CollectorExporter:
+    """POST finished spans to an OTLP/HTTP (JSON) collector, e.g. a local otel-collector or Jaeger."""
+
+    def __init__(self, url: str, timeout: float = 2.0):
+        self.url = url
+        self.client = httpx.Client(timeout=timeout)
+
+    @staticmethod
+    def _attribute(key: str, value: Any) -> Dict[str, Any]:
+        if isinstance(value, bool):
+            return {"key": key, "value": {"boolValue": value}}
+        if isinstance(value, int):
+            return {"key": key, "value": {"intValue": str(value)}}
+        if isinstance(value, float):
+            return {"key": key, "value": {"doubleValue": value}}
+        return {"key": key, "value": {"stringValue": str(value)}}
+
+    def _otlp_span(self, span: Span) -> Dict[str, Any]:
+        otlp = {
+            "traceId": span.trace_id,
+            "spanId": span.span_id,
+            "name": span.name,
+            "kind": 1,
+            "startTimeUnixNano": str(span.start_ns),
+            "endTimeUnixNano": str(span.end_ns or span.start_ns),
+            "attributes": [self._attribute(k, v) for k, v in span.attributes.items()],
+            "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+        }
+        if span.parent_id:
+            otlp["parentSpanId"] = span.parent_id
+        return otlp
+
+    def export(self, spans: List[Span]):
+        body = {
+            "resourceSpans": [{
+                "resource": {"attributes": [self._attribute("service.name", settings.tracing_service_name)]},
+                "scopeSpans": [{
+                    "scope": {"name": "gemini-backend"},
+                    "spans": [self._otlp_span(span) for span in spans],
+                }],
+            }]
+        }
+        self.client.post(self.url, json=body)
+
+    def shutdown(self):
+        self.client.close()
+
+
+class BatchSpanProcessor:
+    """
+    Buffer finished spans in memory and hand them to the exporter from a daemon thread,
+    so request and task threads never block on file or network I/O.
+    Spans are dropped (not queued) once the buffer is full.
+    """
+
+    def __init__(self, exporter, max_queue_size: int = 2048, batch_size: int = 256, interval: float = 1.0):
+        self.exporter = exporter
+        self.batch_size = batch_size
+        self.interval = interval
+        self.queue: "queue.Queue[Span]" = queue.Queue(maxsize=max_queue_size)
+        self.dropped = 0
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+        self._thread.start()
+
+    def on_end(self, span: Span):
+        try:
+            self.queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def _drain(self) -> List[Span]:
+        batch = []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _export(self, batch: List[Span]):
+        try:
+            self.exporter.export(batch)
+        except Exception as e:
+            logger.warning(f"Span export failed ({len(batch)} spans dropped): {e}")
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            batch = self._drain()
+            while batch:
+                self._export(batch)
+                batch = self._drain()
+
+    def shutdown(self):
+        self._stopped.set()
+        self._thread.join(timeout=self.interval * 2)
+        batch = self._drain()
+        while batch:
+            self._export(batch)
+            batch = self._drain()
+        self.exporter.shutdown()
+
+
+class Tracer:
+    def __init__(self):
+        self.enabled = settings.tracing_enabled
+        self.sample_rate = settings.tracing_sample_rate
+        self.processor: Optional[BatchSpanProcessor] = None
+        if self.enabled:
+            if settings.tracing_exporter == "collector":
+                exporter = CollectorExporter(settings.tracing_collector_url)
+            else:
+                exporter = FileExporter(settings.tracing_file_path)
+            self.processor = BatchSpanProcessor(exporter)
+            atexit.register(self.processor.shutdown)
+
+    @staticmethod
+    def current_span() -> Optional[Span]:
+        return _current_span.get()
+
+    def current_traceparent(self) -> Optional[str]:
+        span = _current_span.get()
+        return span.traceparent if span else None
+
+    def start_span(self, name: str, traceparent: Optional[str] = None, start_ns: Optional[int] = None,
+                   **attributes) -> Optional[Span]:
+        """
+        Start a span as a child of the current span, or of `traceparent` if given.
+        Returns None when tracing is disabled or the trace is not sampled.
+        """
+        if not self.enabled:
+            return None
+        parent = _current_span.get()
+        remote = parse_traceparent(traceparent) if traceparent else None
+        if remote:
+            trace_id, parent_id, sampled = remote
+        elif parent:
+            trace_id, parent_id, sampled = parent.trace_id, parent.span_id, parent.sampled
+        else:
+            trace_id, parent_id, sampled = _new_id(16), None, random.random() < self.sample_rate
+        if not sampled:
+            return None
+        return Span(name, trace_id, parent_id, sampled, attributes, start_ns)
+
+    def end_span(self, span: Optional[Span], error: Optional[BaseException] = None):
+        if span is None:
+            return
+        span.end_ns = time.time_ns()
+        if error is not None:
+            span.error = f"{type(error).__name__}: {error}"
+        if self.processor:
+            self.processor.on_end(span)
+
+    @contextmanager
+    def span(self, name: str, traceparent: Optional[str] = None, **attributes):
+        """Context manager that records a span and makes it current for nested calls."""
+        span = self.start_span(name, traceparent=traceparent, **attributes)
+        if span is None:
+            yield None
+            return
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            self.end_span(span, e)
+            raise
+        else:
+            self.end_span(span)
+        finally:
+            _current_span.reset(token)
+
+    def activate(self, span: Optional[Span]):
+        """Make `span` current; returns a token for `deactivate`."""
+        return _current_span.set(span)
+
+    @staticmethod
+    def deactivate(token):
+        _current_span.reset(token)
+
+
+tracer = Tracer()
+
+
+def instrument_sqlalchemy(engine):
+    """Record a span around every statement executed on `engine`."""
+    from sqlalchemy import event
+
+    if not tracer.enabled:
+        return
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        span = tracer.start_span("db.query", statement=statement[:200], executemany=executemany)
+        conn.info.setdefault("trace_spans", []).append(span)
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        spans = conn.info.get("trace_spans")
+        if spans:
+            span = spans.pop()
+            if span is not None:
+                span.set_attribute("rowcount", cursor.rowcount)
+            tracer.end_span(span)
+
+    @event.listens_for(engine, "handle_error")
+    def _handle_error(exception_context):
+        conn = exception_context.connection
+        spans = conn.info.get("trace_spans") if conn is not None else None
+        if spans:
+            tracer.end_span(spans.pop(), exception_context.original_exception)
+
+
+def instrument_celery():
+    """
+    Propagate trace context through Celery task headers.
+
+    The publisher injects `traceparent` and the publish timestamp; the worker
+    continues the trace, records the time the message waited in the broker and
+    wraps the task body in a span.
+    """
+    from celery import signals
+
+    if not tracer.enabled:
+        return
+
+    active: Dict[str, Tuple[Optional[Span], Any]] = {}
+
+    @signals.before_task_publish.connect(weak=False)
+    def _inject(headers=None, **kwargs):
+        traceparent = tracer.current_traceparent()
+        if headers is not None and traceparent:
+            headers["traceparent"] = traceparent
+            headers["trace_published_ns"] = time.time_ns()
+
+    @signals.task_prerun.connect(weak=False)
+    def _start(task_id=None, task=None, **kwargs):
+        traceparent = getattr(task.request, "traceparent", None)
+        published_ns = getattr(task.request, "trace_published_ns", None)
+        span = tracer.start_span(f"celery.task {task.name}", traceparent=traceparent, task_id=task_id,
+                                 retries=task.request.retries)
+        token = tracer.activate(span)
+        if span is not None and published_ns:
+            wait = tracer.start_span("celery.broker_wait", start_ns=int(published_ns), queue=task.queue or "")
+            tracer.end_span(wait)
+        active[task_id] = (span, token)
+
+    @signals.task_postrun.connect(weak=False)
+    def _finish(task_id=None, state=None, **kwargs):
+        span, token = active.pop(task_id, (None, None))
+        if span is not None:
+            span.set_attribute("state", state)
+        tracer.end_span(span)
+        if token is not None:
+            tracer.deactivate(token)
+
+    @signals.task_failure.connect(weak=False)
+    def _failure(task_id=None, exception=None, **kwargs):
+        span, _ = active.get(task_id, (None, None))
+        if span is not None and exception is not None:
+            span.error = f"{type(exception).__name__}: {exception}"
@@ -0,0 +1,241 @@
+"""
+Bulk user import: stream CSV or NDJSON records and insert users plus their default
+BASIC subscriptions with multi-row INSERTs. Existing mobile numbers are skipped via
+ON CONFLICT DO NOTHING, so re-running an import is safe.
+
+CLI usage:
+    python -m app.user_import users.csv
+    python -m app.user_import users.ndjson --format ndjson --batch-size 2000
+"""
+import argparse
+import csv
+import json
+import logging
+import uuid
+from collections import deque
+from typing import AsyncIterator, Deque, Dict, Iterable, List, Optional
+from sqlalchemy import insert
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+from app.models import User, Subscription, SubscriptionTier, SubscriptionStatus
+
+logger = logging.getLogger(__name__)
+
+MAX_REPORTED_ERRORS = 20
+
+
+def normalize_mobile_number(value) -> Optional[str]:
+    """Same rule as the signup schema: keep digits, require 10-15 of them."""
+    cleaned = ''.join(filter(str.isdigit, str(value or "")))
+    if len(cleaned) < 10 or len(cleaned) > 15:
+        return None
+    return cleaned
+
+
+class RecordParser:
+    """
+    Turns lines into dicts. CSV needs a header row containing `mobile_number`.
+
+    One csv.reader reads every CSV line, pulling from a queue that `parse` fills
+    (lines arrive one at a time from a streamed body). A quoted field that spans
+    lines is held back until its closing quote arrives, so the reader always sees
+    whole records.
+    """
+
+    def __init__(self, fmt: str):
+        if fmt not in ("csv", "ndjson"):
+            raise ValueError("format must be 'csv' or 'ndjson'")
+        self.fmt = fmt
+        self.header: Optional[List[str]] = None
+        self._lines: Deque[str] = deque()
+        self._partial: List[str] = []
+        self._reader = csv.reader(self)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> str:
+        if not self._lines:
+            raise StopIteration
+        return self._lines.popleft()
+
+    @property
+    def incomplete(self) -> bool:
+        """True if the input ended inside a quoted CSV field."""
+        return bool(self._partial)
+
+    def parse(self, line: str) -> Optional[dict]:
+        """
+        Returns None for blank lines, the CSV header and lines that end inside a quoted
+        field; raises ValueError on bad input.
+        """
+        if not line.strip() and not self._partial:
+            return None
+        if self.fmt == "ndjson":
+            record = json.loads(line)
+            if not isinstance(record, dict):
+                raise ValueError("expected a JSON object")
+            return record
+        self._partial.append(line)
+        text = "\n".join(self._partial)
+        if text.count('"') % 2:
+            return None  # quoted field continues on the next line
+        self._partial.clear()
+        self._lines.append(text)
+        try:
+            fields = next(self._reader)
+        except csv.Error as e:
+            raise ValueError(f"invalid CSV: {e}")
+        if self.header is None:
+            self.header = [f.strip().lower() for f in fields]
+            if "mobile_number" not in self.header:
+                raise ValueError("CSV header must include mobile_number")
+            return None
+        return dict(zip(self.header, fields))
+
+
+class UserImporter:
+    """Accumulates records and writes them in batches; one transaction per batch."""
+
+    def __init__(self, db: Session, fmt: str, batch_size: int = 1000):
+        self.db = db
+        self.parser = RecordParser(fmt)
+        self.batch_size = batch_size
+        self._pending: Dict[str, Optional[str]] = {}
+        self._line_number = 0
+        self.received = 0
+        self.inserted = 0
+        self.skipped_existing = 0
+        self.invalid = 0
+        self.errors: List[str] = []
+
+    def _reject(self, line_number: int, reason: str):
+        self.invalid += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(f"line {line_number}: {reason}")
+
+    def feed_line(self, line: str):
+        self._line_number += 1
+        try:
+            record = self.parser.parse(line)
+        except ValueError as e:
+            self._reject(self._line_number, str(e))
+            return
+        if record is not None:
+            self.add(record, self._line_number)
+
+    def add(self, record: dict, line_number: int):
+        self.received += 1
+        mobile_number = normalize_mobile_number(record.get("mobile_number"))
+        if not mobile_number:
+            self._reject(line_number, "invalid mobile_number")
+            return
+        full_name = (record.get("full_name") or None)
+        if full_name is not None and not isinstance(full_name, str):
+            self._reject(line_number, "full_name must be a string")
+            return
+        if full_name and len(full_name) > 255:
+            self._reject(line_number, "full_name longer than 255 characters")
+            return
+        if mobile_number in self._pending:
+            self.skipped_existing += 1
+            return
+        self._pending[mobile_number] = full_name
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self._pending:
+            return
+        user_rows = [
+            {"id": uuid.uuid4(), "mobile_number": mobile, "full_name": name, "is_active": True}
+            for mobile, name in self._pending.items()
+        ]
+        stmt = (
+            pg_insert(User)
+            .values(user_rows)
+            .on_conflict_do_nothing(index_elements=[User.mobile_number])
+            .returning(User.id)
+        )
+        new_ids = self.db.execute(stmt).scalars().all()
+        if new_ids:
+            self.db.execute(insert(Subscription), [
+                {
+                    "id": uuid.uuid4(),
+                    "user_id": user_id,
+                    "plan_type": SubscriptionTier.BASIC,
+                    "status": SubscriptionStatus.ACTIVE
+                }
+                for user_id in new_ids
+            ])
+        self.db.commit()
+        self.inserted += len(new_ids)
+        self.skipped_existing += len(user_rows) - len(new_ids)
+        self._pending.clear()
+
+    def finish(self) -> dict:
+        if self.parser.incomplete:
+            self._reject(self._line_number, "unterminated quoted field")
+        self.flush()
+        logger.info(
+            f"User import finished: {self.inserted} inserted, {self.skipped_existing} existing, "
+            f"{self.invalid} invalid of {self.received}"
+        )
+        return {
+            "received": self.received,
+            "inserted": self.inserted,
+            "skipped_existing": self.skipped_existing,
+            "invalid": self.invalid,
+            "errors": self.errors
+        }
+
+
+def import_lines(lines: Iterable[str], fmt: str, db: Session, batch_size: int = 1000) -> dict:
+    importer = UserImporter(db, fmt, batch_size)
+    for line in lines:
+        importer.feed_line(line)
+    return importer.finish()
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Split a streamed request body into lines without buffering the whole body."""
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line.decode("utf-8-sig").rstrip("\r")
+    if buffer:
+        yield buffer.decode("utf-8-sig").rstrip("\r")
+
+
+async def import_stream(chunks: AsyncIterator[bytes], fmt: str, db: Session, batch_size: int = 1000) -> dict:
+    importer = UserImporter(db, fmt, batch_size)
+    async for line in iter_lines(chunks):
+        importer.feed_line(line)
+    return importer.finish()
+
+
+def main():
+    from app.database import SessionLocal
+    from app.logging_config import configure_logging
+
+    arg_parser = argparse.ArgumentParser(description="Bulk import users from CSV or NDJSON")
+    arg_parser.add_argument("path")
+    arg_parser.add_argument("--format", choices=["csv", "ndjson"])
+    arg_parser.add_argument("--batch-size", type=int, default=1000)
+    args = arg_parser.parse_args()
+    fmt = args.format or ("ndjson" if args.path.endswith((".ndjson", ".jsonl")) else "csv")
+
+    configure_logging()
+    db = SessionLocal()
+    try:
+        with open(args.path, encoding="utf-8-sig") as f:
+            summary = import_lines((line.rstrip("\r\n") for line in f), fmt, db, args.batch_size)
+    finally:
+        db.close()
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
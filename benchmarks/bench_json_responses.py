@@ -0,0 +1,106 @@
+"""
+Micro-benchmark for the chatroom read paths: the previous Pydantic round-trip
+versus pre-serialized orjson bytes.
+
+    python -m benchmarks.bench_json_responses [--rooms 50] [--iterations 2000]
+
+No database or Redis is needed; rows are plain objects and the cache is a dict.
+"""
+import argparse
+import json
+import time
+import uuid
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+from fastapi.encoders import jsonable_encoder
+
+from app.responses import dumps
+from app.routers.chatroom import _chatroom_payload
+from app.schemas import ChatroomListResponse, ChatroomResponse
+
+
+def make_rooms(count: int):
+    now = datetime.now(timezone.utc)
+    return [
+        SimpleNamespace(
+            id=uuid.uuid4(),
+            title=f"Chatroom {i}",
+            description="A room used for benchmarking the list endpoint",
+            message_count=i * 3,
+            created_at=now,
+            updated_at=now,
+        )
+        for i in range(count)
+    ]
+
+
+def fastapi_serialize(model) -> bytes:
+    # What FastAPI does with a response_model: validate, encode, dump with the stdlib encoder
+    validated = ChatroomListResponse.model_validate(model)
+    return json.dumps(jsonable_encoder(validated)).encode()
+
+
+def legacy_miss(rooms, cache):
+    responses = [
+        ChatroomResponse(
+            id=r.id, title=r.title, description=r.description, message_count=r.message_count,
+            created_at=r.created_at, updated_at=r.updated_at,
+        )
+        for r in rooms
+    ]
+    cache["legacy"] = json.dumps(
+        {"chatrooms": [room.model_dump() for room in responses], "total_count": len(responses)}, default=str
+    )
+    return fastapi_serialize(ChatroomListResponse(chatrooms=responses, total_count=len(responses)))
+
+
+def legacy_hit(rooms, cache):
+    return fastapi_serialize(ChatroomListResponse(**json.loads(cache["legacy"])))
+
+
+def fast_miss(rooms, cache):
+    body = dumps({"chatrooms": [_chatroom_payload(r) for r in rooms], "total_count": len(rooms)})
+    cache["fast"] = body
+    return body
+
+
+def fast_hit(rooms, cache):
+    return cache["fast"]
+
+
+def bench(fn, rooms, cache, iterations: int) -> float:
+    fn(rooms, cache)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn(rooms, cache)
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rooms", type=int, default=50)
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    rooms = make_rooms(args.rooms)
+    cache = {}
+    print(f"GET /chatroom with {args.rooms} rooms, {args.iterations} iterations (us per request)")
+    for label, legacy, fast in (("cache miss", legacy_miss, fast_miss), ("cache hit", legacy_hit, fast_hit)):
+        legacy_us = bench(legacy, rooms, cache, args.iterations)
+        fast_us = bench(fast, rooms, cache, args.iterations)
+        print(f"  {label:<10} pydantic: {legacy_us:9.1f}   orjson bytes: {fast_us:9.1f}   speedup: {legacy_us / fast_us:6.1f}x")
+
+    room = rooms[0]
+    single_legacy = bench(
+        lambda rs, c: json.dumps(jsonable_encoder(ChatroomResponse.model_validate(
+            ChatroomResponse(**_chatroom_payload(room))))).encode(),
+        rooms, cache, args.iterations,
+    )
+    single_fast = bench(lambda rs, c: dumps(_chatroom_payload(room)), rooms, cache, args.iterations)
+    print(f"GET /chatroom/{{id}}  pydantic: {single_legacy:9.1f}   orjson bytes: {single_fast:9.1f}   "
+          f"speedup: {single_legacy / single_fast:6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Storage saved and per-message cost of `CompressedText`: plain text versus zstd,
+with and without a dictionary trained on part of the corpus.
+
+    python -m benchmarks.bench_message_compression [--messages 5000] [--export export.ndjson]
+
+Without `--export`, synthetic Gemini-style markdown answers are generated. With
+an export file (`GET /user/me/export`), its message bodies are used instead.
+Stored sizes include the base64 framing used in the Text column; the
+MESSAGE_COMPRESSION_MIN_BYTES threshold applies as in production.
+"""
+import argparse
+import json
+import random
+import time
+
+import zstandard
+
+from app.compression import MessageCodec
+from app.config import settings
+
+WORDS = (
+    "request response latency cache database index query partition message user "
+    "chatroom token model answer context example function return value error retry "
+    "configuration deployment worker queue python async await client server"
+).split()
+
+
+def synthetic_message(rng: random.Random) -> str:
+    parts = [f"## {rng.choice(WORDS).title()} {rng.choice(WORDS)}\n"]
+    for _ in range(rng.randint(2, 8)):
+        sentence = " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 25)))
+        parts.append(f"{sentence.capitalize()}.\n")
+        if rng.random() < 0.4:
+            parts.append("".join(f"- **{rng.choice(WORDS)}**: {rng.choice(WORDS)} {rng.choice(WORDS)}\n"
+                                 for _ in range(rng.randint(2, 6))))
+        if rng.random() < 0.3:
+            name = rng.choice(WORDS)
+            parts.append(f"```python\ndef {name}(value):\n    return await client.{rng.choice(WORDS)}(value)\n```\n")
+    return "\n".join(parts)
+
+
+def load_export(path: str, limit: int):
+    bodies = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            record = json.loads(line)
+            if record.get("type") != "message":
+                continue
+            bodies.extend(value for value in (record.get("content"), record.get("ai_response")) if value)
+            if len(bodies) >= limit:
+                break
+    return bodies[:limit]
+
+
+def measure(codec: MessageCodec, bodies):
+    start = time.perf_counter()
+    stored = [codec.compress(body) for body in bodies]
+    encode_us = (time.perf_counter() - start) / len(bodies) * 1e6
+    start = time.perf_counter()
+    for value in stored:
+        codec.decode(value)
+    decode_us = (time.perf_counter() - start) / len(bodies) * 1e6
+    return sum(len(value.encode("utf-8")) for value in stored), encode_us, decode_us
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--export", help="NDJSON export to take message bodies from")
+    parser.add_argument("--dict-size", type=int, default=112640)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    bodies = load_export(args.export, args.messages) if args.export else [
+        synthetic_message(rng) for _ in range(args.messages)
+    ]
+    # Train on one half, measure on the other, as a dictionary trained on past traffic would be used
+    train, test = bodies[::2], bodies[1::2]
+    plain_bytes = sum(len(body.encode("utf-8")) for body in test)
+    print(f"{len(test)} messages, {plain_bytes / len(test):.0f} bytes average, "
+          f"threshold {settings.message_compression_min_bytes} bytes, level {settings.message_compression_level}")
+
+    dictionary = zstandard.train_dictionary(args.dict_size, [body.encode("utf-8") for body in train])
+    variants = (("zstd", None), ("zstd + dictionary", dictionary))
+    for label, dict_data in variants:
+        stored_bytes, encode_us, decode_us = measure(MessageCodec.with_dictionary(dict_data), test)
+        saved = plain_bytes - stored_bytes
+        print(f"  {label:<18} stored: {stored_bytes / len(test):7.0f} B/msg   saved: {saved / plain_bytes:6.1%}   "
+              f"encode: {encode_us:7.1f} us/msg   decode: {decode_us:7.1f} us/msg")
+
+
+if __name__ == "__main__":
+    main()
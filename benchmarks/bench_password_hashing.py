@@ -0,0 +1,66 @@
+"""
+Event-loop latency while password changes are in flight: bcrypt called inline in
+the coroutine (previous behaviour) versus offloaded to the password executor.
+
+    python -m benchmarks.bench_password_hashing [--concurrency 8] [--rounds 12]
+
+A probe task sleeps for 5 ms in a loop and records how late it wakes up; that
+delay is what every other request on the worker experiences.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+
+async def probe(stop: asyncio.Event, lags: list):
+    interval = 0.005
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append((time.perf_counter() - start - interval) * 1000)
+
+
+async def run(label: str, change_password, concurrency: int):
+    stop = asyncio.Event()
+    lags = []
+    probe_task = asyncio.create_task(probe(stop, lags))
+    await asyncio.sleep(0.05)
+    start = time.perf_counter()
+    await asyncio.gather(*(change_password(f"old-password-{i}") for i in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await probe_task
+    lags.sort()
+    p99 = lags[int(len(lags) * 0.99) - 1] if len(lags) > 1 else lags[-1]
+    print(f"  {label:<9} wall: {elapsed * 1000:8.1f} ms   loop lag p50: {statistics.median(lags):7.1f} ms"
+          f"   p99: {p99:7.1f} ms   max: {lags[-1]:7.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--rounds", type=int, default=12)
+    args = parser.parse_args()
+    os.environ["BCRYPT_ROUNDS"] = str(args.rounds)
+
+    from app.security import get_password_hash, verify_password, get_password_hash_async, verify_password_async
+
+    stored = get_password_hash("old-password-0")
+
+    async def inline(old):
+        verify_password(old, stored)
+        get_password_hash("new-password")
+
+    async def offloaded(old):
+        await verify_password_async(old, stored)
+        await get_password_hash_async("new-password")
+
+    print(f"{args.concurrency} concurrent password changes, bcrypt rounds={args.rounds}")
+    asyncio.run(run("inline", inline, args.concurrency))
+    asyncio.run(run("executor", offloaded, args.concurrency))
+
+
+if __name__ == "__main__":
+    main()
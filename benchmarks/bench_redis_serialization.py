@@ -0,0 +1,131 @@
+"""
+Payload size and cost of the Redis value encodings, and what batching saves.
+
+    python -m benchmarks.bench_redis_serialization [--iterations 2000] [--redis-url redis://localhost:6379/15]
+
+Part one needs no server: the `json.dumps(default=str)` path `set_json` used
+before, against orjson and msgpack (if installed), each with and without zstd
+above REDIS_COMPRESSION_THRESHOLD, on payloads shaped like the ones the app
+caches. Part two runs against `--redis-url` (a scratch database; the keys it
+writes are deleted afterwards): N sequential SET/GET calls against one pipeline
+and one MGET, which is where most of the latency goes once Redis is remote.
+"""
+import argparse
+import json
+import random
+import time
+import uuid
+from datetime import datetime, timezone
+
+import redis
+
+from app.serializers import MsgpackSerializer, OrjsonSerializer, ValueCodec
+from app.config import settings
+
+
+def payloads(rng: random.Random):
+    now = datetime.now(timezone.utc)
+    entitlement = {"tier": "pro", "status": "active", "current_period_end": now, "has_subscription": True}
+    chatroom = {
+        "id": str(uuid.uuid4()), "user_id": str(uuid.uuid4()), "title": "Release planning",
+        "description": "Notes for the next deploy", "message_count": 42,
+        "created_at": now.isoformat(), "updated_at": now.isoformat()
+    }
+    chatrooms = {"chatrooms": [dict(chatroom, id=str(uuid.uuid4()), message_count=rng.randint(0, 500))
+                               for _ in range(50)], "total_count": 50}
+    batch = {"state": "done", "fingerprint": uuid.uuid4().hex * 2, "body": json.dumps({
+        "results": [{"index": i, "status": "processing", "message": dict(chatroom, content="lorem ipsum " * 20)}
+                    for i in range(100)]
+    })}
+    return [("entitlement", entitlement), ("chatroom meta", chatroom),
+            ("chatroom list (50)", chatrooms), ("batch replay (100)", batch)]
+
+
+def codecs():
+    variants = [("json (before)", None), ("orjson", OrjsonSerializer())]
+    try:
+        variants.append(("msgpack", MsgpackSerializer()))
+    except ImportError:
+        print("msgpack is not installed; skipping it")
+    threshold = settings.redis_compression_threshold or 4096
+    for label, serializer in variants:
+        if serializer is None:
+            yield label, None
+            continue
+        yield label, ValueCodec(serializer, compression_threshold=0)
+        yield f"{label} + zstd", ValueCodec(serializer, compression_threshold=threshold)
+
+
+def time_per_call(func, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def bench_encoding(iterations: int):
+    for name, value in payloads(random.Random(42)):
+        print(f"\n{name}")
+        for label, codec in codecs():
+            if codec is None:
+                encoded = json.dumps(value, default=str)
+                encode_us = time_per_call(lambda: json.dumps(value, default=str), iterations)
+                decode_us = time_per_call(lambda: json.loads(encoded), iterations)
+                size = len(encoded.encode("utf-8"))
+            else:
+                encoded = codec.encode(value)
+                encode_us = time_per_call(lambda: codec.encode(value), iterations)
+                decode_us = time_per_call(lambda: codec.decode(encoded), iterations)
+                size = len(encoded)
+            print(f"  {label:<16} {size:8d} B   encode: {encode_us:8.1f} us   decode: {decode_us:8.1f} us")
+
+
+def bench_round_trips(url: str, keys: int, repeat: int):
+    client = redis.Redis.from_url(url)
+    try:
+        client.ping()
+    except redis.RedisError as e:
+        print(f"\nSkipping round-trip benchmark, {url} is not reachable: {e}")
+        return
+    codec = ValueCodec()
+    names = [f"bench:serialization:{i}" for i in range(keys)]
+    value = codec.encode({"tier": "pro", "status": "active", "has_subscription": True})
+
+    def sequential():
+        for name in names:
+            client.set(name, value, ex=60)
+        for name in names:
+            client.get(name)
+
+    def batched():
+        pipe = client.pipeline(transaction=False)
+        for name in names:
+            pipe.set(name, value, ex=60)
+        pipe.execute()
+        client.mget(names)
+
+    try:
+        print(f"\n{keys} keys against {url}")
+        for label, func in (("sequential SET/GET", sequential), ("pipeline + MGET", batched)):
+            elapsed = time_per_call(func, repeat) / 1000
+            print(f"  {label:<20} {elapsed:8.2f} ms per {keys} writes + {keys} reads")
+    finally:
+        client.delete(*names)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--redis-url", default="redis://localhost:6379/15")
+    parser.add_argument("--keys", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    print(f"Compression threshold {settings.redis_compression_threshold} bytes, "
+          f"level {settings.redis_compression_level}")
+    bench_encoding(args.iterations)
+    bench_round_trips(args.redis_url, args.keys, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
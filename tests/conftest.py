@@ -0,0 +1,100 @@
+"""
+Test fixtures: an in-memory SQLite database and fakeredis in place of Postgres and
+Redis, with the Stripe stub (STRIPE_BACKEND=stub) instead of the live API.
+"""
+import os
+
+# Settings are read at import time, so these must be set before `app` is imported
+os.environ.setdefault("DEBUG", "true")
+os.environ["STRIPE_BACKEND"] = "stub"
+os.environ["STRIPE_WEBHOOK_SECRET"] = "whsec_test"
+os.environ["DATABASE_URL"] = "sqlite://"
+
+import fakeredis
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import Date, create_engine, event
+from sqlalchemy.dialects.postgresql import REGCONFIG, TSVECTOR
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.models import Base, Message, UsageTracking
+from app.redis_client import redis_client
+
+
+@compiles(TSVECTOR, "sqlite")
+def _compile_tsvector(type_, compiler, **kw):
+    return "TEXT"
+
+
+@compiles(REGCONFIG, "sqlite")
+def _compile_regconfig(type_, compiler, **kw):
+    return "TEXT"
+
+
+# usage_tracking.date holds dates; SQLite only matches `date == today` on a DATE column
+UsageTracking.__table__.c.date.type = Date()
+
+# GIN index over the tsvector column has no SQLite equivalent
+for index in list(Message.__table__.indexes):
+    if index.name == "ix_messages_user_search":
+        Message.__table__.indexes.discard(index)
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine(
+        "sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False}
+    )
+
+    @event.listens_for(engine, "connect")
+    def _register_functions(dbapi_connection, connection_record):
+        dbapi_connection.create_function("to_tsvector", 2, lambda config, text: text)
+        dbapi_connection.create_function("setweight", 2, lambda vector, weight: vector)
+
+    Base.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def session_factory(engine):
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+@pytest.fixture
+def db(session_factory):
+    session = session_factory()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture(autouse=True)
+def fake_redis(monkeypatch):
+    server = fakeredis.FakeServer()
+    client = fakeredis.FakeRedis(server=server, decode_responses=True)
+    monkeypatch.setattr(redis_client, "client", client)
+    monkeypatch.setattr(redis_client, "binary_client", fakeredis.FakeRedis(server=server))
+    return client
+
+
+@pytest.fixture
+def client(session_factory):
+    from app.database import get_db
+    from app.main import app
+
+    def override_get_db():
+        session = session_factory()
+        try:
+            yield session
+        finally:
+            session.close()
+
+    app.dependency_overrides[get_db] = override_get_db
+    try:
+        yield TestClient(app)
+    finally:
+        app.dependency_overrides.pop(get_db, None)
@@ -0,0 +1,66 @@
+import os
+import time
+import uuid
+from datetime import datetime, timezone
+
+import pytest
+
+from app import export
+from app.config import settings
+from app.models import User
+from app.purge import purge_user
+
+
+@pytest.fixture
+def export_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "export_dir", str(tmp_path))
+    return tmp_path
+
+
+def touch(directory, name, age=0):
+    path = directory / name
+    path.write_bytes(b"{}\n")
+    mtime = time.time() - age
+    os.utime(path, (mtime, mtime))
+    return path
+
+
+def test_expired_exports_are_deleted(export_dir):
+    old = touch(export_dir, "u1-20260101T000000Z.ndjson.gz", age=settings.export_retention + 60)
+    fresh = touch(export_dir, "u2-20260101T000000Z.ndjson.gz")
+    unrelated = touch(export_dir, "notes.txt", age=settings.export_retention + 60)
+
+    assert export.delete_expired_exports() == 1
+    assert not old.exists()
+    assert fresh.exists()
+    assert unrelated.exists()
+
+
+def test_new_export_replaces_older_ones(export_dir, monkeypatch):
+    user_id = uuid.uuid4()
+    previous = touch(export_dir, f"{user_id}-20260101T000000Z.ndjson.gz")
+    other_user = touch(export_dir, f"{uuid.uuid4()}-20260101T000000Z.ndjson.gz")
+    monkeypatch.setattr(export, "export_stream", lambda user_id, gzip: iter([b"{}\n"]))
+
+    path = export.write_export(user_id)
+
+    assert os.path.exists(path)
+    assert not previous.exists()
+    assert other_user.exists()
+
+
+def test_purge_user_deletes_export_files(db, export_dir):
+    active = User(id=uuid.uuid4(), mobile_number="+15550000002", password="x")
+    deleted = User(id=uuid.uuid4(), mobile_number="+15550000003", password="x",
+                   deleted_at=datetime.now(timezone.utc))
+    db.add_all([active, deleted])
+    db.commit()
+    active_id, deleted_id = active.id, deleted.id
+    deleted_files = [touch(export_dir, f"{deleted_id}-20260101T000000Z.ndjson"),
+                     touch(export_dir, f"{deleted_id}-20260102T000000Z.ndjson.gz")]
+    active_file = touch(export_dir, f"{active_id}-20260101T000000Z.ndjson.gz")
+
+    assert purge_user(db, active_id)["exports"] == 0
+    assert purge_user(db, deleted_id) == {"messages": 0, "users": 1, "exports": 2}
+    assert not any(path.exists() for path in deleted_files)
+    assert active_file.exists()
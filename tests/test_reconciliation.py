@@ -0,0 +1,131 @@
+import uuid
+
+import pytest
+
+from app import reconciliation
+from app.entitlements import entitlement_key
+from app.models import Subscription, SubscriptionStatus, SubscriptionTier, User
+from app.reconciliation import reconcile_subscriptions
+from app.stripe_client import StubStripeClient
+from app.stripe_events import subscription_period
+
+
+@pytest.fixture
+def stub():
+    return StubStripeClient()
+
+
+def add_local(db, remote, plan_type=SubscriptionTier.PRO, status=SubscriptionStatus.ACTIVE):
+    """Id of a user whose subscription row matches `remote` unless told otherwise."""
+    user = User(id=uuid.uuid4(), mobile_number=f"+1{uuid.uuid4().int % 10 ** 10:010d}", password="x")
+    start, end = subscription_period(remote)
+    db.add(user)
+    db.add(Subscription(
+        user_id=user.id, plan_type=plan_type, status=status,
+        stripe_subscription_id=remote["id"], stripe_customer_id=remote["customer"],
+        current_period_start=start, current_period_end=end
+    ))
+    return user.id
+
+
+def subscription_of(db, user_id):
+    db.expire_all()
+    return db.query(Subscription).filter(Subscription.user_id == user_id).one()
+
+
+def test_missed_cancellation_is_repaired(db, stub, fake_redis):
+    remote = stub.add_subscription("sub_1", "cus_1", status="canceled")
+    user_id = add_local(db, remote)
+    db.commit()
+    fake_redis.set(entitlement_key(user_id), "cached")
+
+    summary = reconcile_subscriptions(db, stub.iter_subscriptions())
+
+    assert summary["updated"] == 1
+    subscription = subscription_of(db, user_id)
+    assert subscription.plan_type == SubscriptionTier.BASIC
+    assert subscription.status == SubscriptionStatus.CANCELLED
+    assert not fake_redis.exists(entitlement_key(user_id))
+
+
+def test_missed_renewal_is_repaired(db, stub):
+    remote = stub.add_subscription("sub_1", "cus_1", status="active")
+    user_id = add_local(db, remote, plan_type=SubscriptionTier.BASIC, status=SubscriptionStatus.PAST_DUE)
+    db.commit()
+
+    summary = reconcile_subscriptions(db, stub.iter_subscriptions())
+
+    assert summary["updated"] == 1
+    subscription = subscription_of(db, user_id)
+    assert subscription.plan_type == SubscriptionTier.PRO
+    assert subscription.status == SubscriptionStatus.ACTIVE
+
+
+def test_rows_in_sync_are_left_alone(db, stub, fake_redis, monkeypatch):
+    user_ids = [add_local(db, stub.add_subscription(f"sub_{i}", f"cus_{i}")) for i in range(3)]
+    db.commit()
+    for user_id in user_ids:
+        fake_redis.set(entitlement_key(user_id), "cached")
+    invalidated = []
+    monkeypatch.setattr(reconciliation, "invalidate_entitlements_sync", invalidated.extend)
+
+    summary = reconcile_subscriptions(db, stub.iter_subscriptions())
+
+    assert summary["scanned"] == 3
+    assert summary["in_sync"] == 3
+    assert summary["updated"] == 0
+    assert invalidated == []
+    assert all(fake_redis.exists(entitlement_key(user_id)) for user_id in user_ids)
+
+
+def test_second_run_is_a_no_op(db, stub):
+    add_local(db, stub.add_subscription("sub_1", "cus_1", status="canceled"))
+    db.commit()
+
+    first = reconcile_subscriptions(db, stub.iter_subscriptions())
+    second = reconcile_subscriptions(db, stub.iter_subscriptions())
+
+    assert first["updated"] == 1
+    assert second["updated"] == 0
+    assert second["in_sync"] == 1
+
+
+def test_unknown_and_unlinked_subscriptions_are_counted(db, stub):
+    add_local(db, stub.add_subscription("sub_1", "cus_1", status="some_new_status"))
+    stub.add_subscription("sub_2", "cus_2")
+    db.commit()
+
+    summary = reconcile_subscriptions(db, stub.iter_subscriptions())
+
+    assert summary["unknown_status"] == 1
+    assert summary["missing_locally"] == 1
+    assert summary["updated"] == 0
+
+
+def test_subscriptions_are_reconciled_in_chunks(db, stub, monkeypatch):
+    user_ids = []
+    for i in range(25):
+        remote = stub.add_subscription(f"sub_{i}", f"cus_{i}", status="canceled" if i % 3 == 0 else "active")
+        user_ids.append(add_local(db, remote))
+    stub.add_subscription("sub_unlinked", "cus_unlinked")
+    db.commit()
+    chunk_sizes = []
+    reconcile_chunk = reconciliation.reconcile_chunk
+
+    def recording_chunk(db, remote_chunk, summary):
+        chunk_sizes.append(len(remote_chunk))
+        return reconcile_chunk(db, remote_chunk, summary)
+
+    monkeypatch.setattr(reconciliation, "reconcile_chunk", recording_chunk)
+
+    summary = reconcile_subscriptions(db, stub.iter_subscriptions(), chunk_size=10)
+
+    assert chunk_sizes == [10, 10, 6]
+    assert summary["scanned"] == 26
+    assert summary["updated"] == 9
+    assert summary["in_sync"] == 16
+    assert summary["missing_locally"] == 1
+    cancelled = {user_id for i, user_id in enumerate(user_ids) if i % 3 == 0}
+    for user_id in user_ids:
+        expected = SubscriptionTier.BASIC if user_id in cancelled else SubscriptionTier.PRO
+        assert subscription_of(db, user_id).plan_type == expected
@@ -0,0 +1,106 @@
+import uuid
+
+import pytest
+
+from app.main import app
+from app.models import Chatroom, Message, UsageTracking, User
+from app.routers import chatroom as chatroom_router
+from app.security import get_current_active_user
+
+
+@pytest.fixture
+def user(db, session_factory):
+    user = User(id=uuid.uuid4(), mobile_number="+15550000010", password="x")
+    db.add(user)
+    db.commit()
+    user_id = user.id
+
+    def current_user():
+        with session_factory() as session:
+            return session.get(User, user_id)
+
+    app.dependency_overrides[get_current_active_user] = current_user
+    yield user
+    app.dependency_overrides.pop(get_current_active_user, None)
+
+
+@pytest.fixture
+def room(db, user):
+    room = Chatroom(id=uuid.uuid4(), user_id=user.id, title="Room", message_count=0)
+    db.add(room)
+    db.commit()
+    return room
+
+
+class BrokerDown(Exception):
+    pass
+
+
+@pytest.fixture
+def broker(monkeypatch):
+    """Stands in for process_gemini_message.delay; set `down` to make enqueueing fail."""
+    class Broker:
+        down = False
+        sent = []
+
+        def delay(self, *args):
+            if self.down:
+                raise BrokerDown("broker unavailable")
+            self.sent.append(args)
+
+    broker = Broker()
+    monkeypatch.setattr(chatroom_router.process_gemini_message, "delay", broker.delay)
+    return broker
+
+
+def send(client, room_id, key, content="hello"):
+    return client.post(f"/chatroom/{room_id}/message", json={"content": content},
+                       headers={"Idempotency-Key": key})
+
+
+def test_retry_after_enqueue_failure_replays_stored_message(client, db, room, broker):
+    broker.down = True
+    with pytest.raises(BrokerDown):
+        send(client, room.id, "key-1")
+
+    broker.down = False
+    retry = send(client, room.id, "key-1")
+
+    assert retry.status_code == 200
+    assert retry.headers.get("Idempotent-Replayed") == "true"
+    assert db.query(Message).count() == 1
+    assert retry.json()["message"]["id"] == str(db.query(Message.id).scalar())
+    assert db.query(UsageTracking.message_count).scalar() == 1
+
+
+def test_retry_after_not_found_runs_again(client, db, user, broker):
+    missing = uuid.uuid4()
+
+    first = send(client, missing, "key-2")
+    retry = send(client, missing, "key-2")
+
+    assert first.status_code == 404
+    assert retry.status_code == 404
+    assert "Idempotent-Replayed" not in retry.headers
+    assert db.query(Message).count() == 0
+
+
+def test_retry_of_successful_send_is_not_stored_twice(client, db, room, broker):
+    first = send(client, room.id, "key-3")
+    retry = send(client, room.id, "key-3")
+
+    assert first.json() == retry.json()
+    assert db.query(Message).count() == 1
+    assert len(broker.sent) == 1
+
+
+def test_polling_a_message_in_a_deleted_chatroom_returns_404(client, db, room, broker, monkeypatch):
+    monkeypatch.setattr(chatroom_router.purge_chatroom, "delay", lambda *args: None)
+    sent = send(client, room.id, "key-4").json()["message"]
+    url = f"/chatroom/{room.id}/message/{sent['id']}"
+    etag = client.get(url).headers["ETag"]
+    assert client.get(url, headers={"If-None-Match": etag}).status_code == 304
+
+    assert client.delete(f"/chatroom/{room.id}").status_code == 202
+
+    assert client.get(url, headers={"If-None-Match": etag}).status_code == 404
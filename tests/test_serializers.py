@@ -0,0 +1,128 @@
+import json
+import os
+from datetime import datetime, timezone
+from threading import Thread
+
+import pytest
+
+from app.serializers import (
+    COMPRESSED, JSON, MSGPACK, RAW, JSONSerializer, MsgpackSerializer, OrjsonSerializer, ValueCodec
+)
+
+VALUE = {"tier": "pro", "count": 3, "ratio": 0.5, "tags": ["a", "b"], "nested": {"ok": True, "none": None}}
+
+
+def serializers():
+    yield JSONSerializer()
+    yield OrjsonSerializer()
+    try:
+        yield MsgpackSerializer()
+    except ImportError:
+        pass
+
+
+@pytest.mark.parametrize("serializer", list(serializers()), ids=lambda s: s.name)
+def test_header_round_trip(serializer):
+    codec = ValueCodec(serializer, compression_threshold=0)
+
+    encoded = codec.encode(VALUE)
+
+    assert encoded[0] == serializer.header
+    assert codec.decode(encoded) == VALUE
+
+
+def test_values_are_written_as_strings_where_json_has_no_type():
+    codec = ValueCodec(OrjsonSerializer(), compression_threshold=0)
+    now = datetime(2026, 10, 19, 12, 0, tzinfo=timezone.utc)
+
+    assert codec.decode(codec.encode({"at": now})) == {"at": now.isoformat()}
+
+
+def test_payloads_below_threshold_are_not_compressed():
+    codec = ValueCodec(OrjsonSerializer(), compression_threshold=4096)
+
+    encoded = codec.encode(VALUE)
+
+    assert not encoded[0] & COMPRESSED
+
+
+def test_payloads_at_threshold_are_compressed():
+    large = {"body": "lorem ipsum " * 1000}
+    codec = ValueCodec(OrjsonSerializer(), compression_threshold=1024)
+
+    encoded = codec.encode(large)
+
+    assert encoded[0] == JSON | COMPRESSED
+    assert len(encoded) < len(json.dumps(large))
+    assert codec.decode(encoded) == large
+
+
+def test_incompressible_payloads_are_stored_plain():
+    codec = ValueCodec(compression_threshold=16)
+    noise = os.urandom(2048)
+
+    encoded = codec.encode(noise)
+
+    assert encoded[0] == RAW
+    assert codec.decode(encoded) == noise
+
+
+def test_zero_threshold_disables_compression():
+    codec = ValueCodec(OrjsonSerializer(), compression_threshold=0)
+
+    assert not codec.encode({"body": "x" * 100000})[0] & COMPRESSED
+
+
+def test_raw_bytes_round_trip():
+    codec = ValueCodec(compression_threshold=64)
+    small, large = b"\x00\x01binary", b"abc" * 1000
+
+    assert codec.encode(small)[0] == RAW
+    assert codec.decode(codec.encode(small)) == small
+    assert codec.encode(large)[0] == RAW | COMPRESSED
+    assert codec.decode(codec.encode(large)) == large
+
+
+def test_legacy_headerless_json_decodes():
+    codec = ValueCodec()
+
+    assert codec.decode(json.dumps(VALUE).encode("utf-8")) == VALUE
+    assert codec.decode(b"[1, 2, 3]") == [1, 2, 3]
+
+
+def test_empty_value_decodes_to_none():
+    assert ValueCodec().decode(None) is None
+    assert ValueCodec().decode(b"") is None
+
+
+def test_reads_follow_the_header_not_the_configured_serializer():
+    try:
+        msgpack_codec = ValueCodec(MsgpackSerializer(), compression_threshold=0)
+    except ImportError:
+        pytest.skip("msgpack is not installed")
+    json_codec = ValueCodec(OrjsonSerializer(), compression_threshold=0)
+
+    encoded = msgpack_codec.encode(VALUE)
+
+    assert encoded[0] == MSGPACK
+    assert json_codec.decode(encoded) == VALUE
+    assert msgpack_codec.decode(json_codec.encode(VALUE)) == VALUE
+
+
+def test_codec_is_safe_to_share_between_threads():
+    codec = ValueCodec(OrjsonSerializer(), compression_threshold=128)
+    values = [{"i": i, "body": "x" * (i * 37 % 3000 + 200)} for i in range(200)]
+    failures = []
+
+    def round_trip():
+        for value in values:
+            if codec.decode(codec.encode(value)) != value:
+                failures.append(value)
+
+    threads = [Thread(target=round_trip) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert failures == []
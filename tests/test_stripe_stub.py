@@ -0,0 +1,142 @@
+import asyncio
+import json
+import time
+import uuid
+
+import pytest
+
+from app import checkout
+from app.config import settings
+from app.models import StripeEvent, Subscription, SubscriptionStatus, SubscriptionTier, User
+from app.stripe_client import StubStripeClient, _create_stripe_client, stripe_client
+from app.stripe_events import process_pending_events
+
+
+@pytest.fixture
+def queued(monkeypatch):
+    """Ordering keys handed to the stripe_events queue instead of Celery."""
+    from app.routers import subscription
+    keys = []
+    monkeypatch.setattr(subscription.process_stripe_events, "delay", keys.append)
+    return keys
+
+
+@pytest.fixture
+def user(db):
+    user = User(id=uuid.uuid4(), mobile_number="+15550000001", password="x")
+    db.add(user)
+    db.add(Subscription(user_id=user.id, plan_type=SubscriptionTier.BASIC, status=SubscriptionStatus.ACTIVE))
+    db.commit()
+    return user
+
+
+def checkout_completed(user_id, event_id="evt_checkout_1"):
+    return json.dumps({
+        "id": event_id,
+        "type": "checkout.session.completed",
+        "created": int(time.time()),
+        "data": {"object": {
+            "id": "cs_stub_1",
+            "customer": "cus_stub_1",
+            "subscription": "sub_stub_1",
+            "payment_status": "paid",
+            "metadata": {"user_id": str(user_id)},
+        }},
+    }).encode("utf-8")
+
+
+def post_webhook(client, payload, signature):
+    headers = {"stripe-signature": signature} if signature else {}
+    return client.post("/webhook/stripe", content=payload, headers=headers)
+
+
+def test_stub_is_refused_outside_debug(monkeypatch):
+    monkeypatch.setattr(settings, "debug", False)
+    with pytest.raises(RuntimeError):
+        _create_stripe_client()
+
+
+def test_stub_requires_webhook_secret(monkeypatch):
+    monkeypatch.setattr(settings, "stripe_webhook_secret", "")
+    with pytest.raises(RuntimeError):
+        _create_stripe_client()
+
+
+@pytest.mark.asyncio
+async def test_checkout_session_is_reused(monkeypatch):
+    stub = StubStripeClient()
+    monkeypatch.setattr(checkout, "stripe_client", stub)
+
+    concurrent = await asyncio.gather(*[checkout.get_or_create_checkout_session("user-1") for _ in range(5)])
+    again = await checkout.get_or_create_checkout_session("user-1")
+
+    assert len(stub.sessions) == 1
+    assert {session["session_id"] for session in concurrent} == {again["session_id"]}
+
+
+@pytest.mark.asyncio
+async def test_new_checkout_session_after_invalidation(monkeypatch):
+    stub = StubStripeClient()
+    monkeypatch.setattr(checkout, "stripe_client", stub)
+
+    first = await checkout.get_or_create_checkout_session("user-1")
+    checkout.invalidate_checkout_session_sync("user-1")
+    second = await checkout.get_or_create_checkout_session("user-1")
+
+    assert len(stub.sessions) == 2
+    assert first["session_id"] != second["session_id"]
+
+
+def test_webhook_without_signature_is_rejected(client, db, user, queued):
+    response = post_webhook(client, checkout_completed(user.id), None)
+
+    assert response.status_code == 400
+    assert db.query(StripeEvent).count() == 0
+    assert queued == []
+
+
+def test_forged_webhook_is_rejected(client, db, user, queued):
+    payload = checkout_completed(user.id)
+    forger = StubStripeClient()
+    forger.webhook_secret = "whsec_guessed"
+
+    response = post_webhook(client, payload, forger.sign_payload(payload))
+
+    assert response.status_code == 400
+    assert db.query(StripeEvent).count() == 0
+    assert queued == []
+
+
+def test_tampered_webhook_is_rejected(client, db, user, queued):
+    signature = stripe_client.sign_payload(checkout_completed(user.id))
+
+    response = post_webhook(client, checkout_completed(uuid.uuid4()), signature)
+
+    assert response.status_code == 400
+    assert queued == []
+
+
+def test_signed_checkout_completed_upgrades_user(client, db, user, queued):
+    payload = checkout_completed(user.id)
+
+    response = post_webhook(client, payload, stripe_client.sign_payload(payload))
+
+    assert response.status_code == 200
+    assert response.json() == {"received": True}
+    assert len(queued) == 1
+    assert process_pending_events(db, queued[0]) == {"processed": 1, "ignored": 0}
+    subscription = db.query(Subscription).filter(Subscription.user_id == user.id).one()
+    assert subscription.plan_type == SubscriptionTier.PRO
+    assert subscription.stripe_subscription_id == "sub_stub_1"
+
+
+def test_redelivered_webhook_is_not_queued_twice(client, db, user, queued):
+    payload = checkout_completed(user.id)
+
+    first = post_webhook(client, payload, stripe_client.sign_payload(payload))
+    second = post_webhook(client, payload, stripe_client.sign_payload(payload))
+
+    assert first.json() == {"received": True}
+    assert second.json() == {"received": True, "duplicate": True}
+    assert len(queued) == 1
+    assert db.query(StripeEvent).count() == 1